@@ -0,0 +1,211 @@
+"""
+Background re-aggregation of segments that received new report data.
+
+Writers call mark_dirty(segment_id); a single asyncio task wakes every
+interval_s (plus or minus jitter_s, so several workers do not tick in
+lockstep) and re-aggregates the dirty segments in FIFO order, batch_size at
+a time, yielding to the event loop between batches. When the dirty set
+grows past high_water the task is woken immediately and keeps draining
+until it is back under the mark, so a burst of reports cannot build up an
+unbounded backlog.
+
+The aggregate function runs on the event loop thread. Callers must make
+their writes to the data it reads (and their mark_dirty calls) on that
+thread too, e.g. from `async def` handlers: FastAPI runs plain `def`
+handlers in a worker thread pool, concurrently with a drain. If the wake-up
+signal is raised from another thread anyway it is handed to the loop with
+call_soon_threadsafe, and a failing tick is recorded in stats() instead of
+stopping the task.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class AggregationScheduler:
+    """
+    Dirty-set scheduler around aggregate(segment_id) -> result dict.
+
+    before_drain: optional hook run at the start of every tick (e.g. to mark
+    segments whose reports aged out of the freshness window).
+    """
+
+    def __init__(
+        self,
+        aggregate: Callable[[int], Dict[str, Any]],
+        interval_s: float = 5.0,
+        jitter_s: float = 1.0,
+        batch_size: int = 200,
+        high_water: int = 5000,
+        before_drain: Optional[Callable[[], None]] = None,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.aggregate = aggregate
+        self.interval_s = interval_s
+        self.jitter_s = jitter_s
+        self.batch_size = batch_size
+        self.high_water = high_water
+        self.before_drain = before_drain
+        # segment_id -> monotonic time it was first marked; insertion order is FIFO
+        self._dirty: Dict[int, float] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.marked = 0
+        self.processed = 0
+        self.status_changes = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.batches = 0
+        self.drains = 0
+        self.max_lag_s = 0.0
+        self.last_drain_segments = 0
+        self.last_drain_s = 0.0
+        self.busy_s = 0.0
+        self.last_drain_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._dirty)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def mark_dirty(self, segment_id: int) -> None:
+        if segment_id not in self._dirty:
+            self._dirty[segment_id] = time.monotonic()
+            self.marked += 1
+            if len(self._dirty) >= self.high_water:
+                self._wake_up()
+
+    def _wake_up(self) -> None:
+        if self._wake is None or self._loop is None or self._loop.is_closed():
+            return
+        # asyncio.Event is not thread-safe; set it from the loop thread
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def mark_many(self, segment_ids: Iterable[int]) -> None:
+        for segment_id in segment_ids:
+            self.mark_dirty(segment_id)
+
+    def clear(self) -> None:
+        """Forget all pending segments (e.g. after a full aggregation pass)."""
+        self._dirty.clear()
+
+    def lag_s(self) -> float:
+        """How long the oldest pending segment has been waiting."""
+        if not self._dirty:
+            return 0.0
+        return time.monotonic() - next(iter(self._dirty.values()))
+
+    def run_batch(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Aggregate up to `limit` (default batch_size) of the oldest dirty segments."""
+        limit = self.batch_size if limit is None else limit
+        batch = list(islice(self._dirty.items(), limit))
+        if not batch:
+            return []
+        self.max_lag_s = max(self.max_lag_s, time.monotonic() - batch[0][1])
+        results = []
+        for segment_id, _ in batch:
+            # Remove first: a write during aggregate() marks the segment again
+            self._dirty.pop(segment_id, None)
+            try:
+                result = self.aggregate(segment_id)
+            except Exception as exc:  # keep the loop alive; surfaced in stats()
+                self.errors += 1
+                self.last_error = f"segment {segment_id}: {exc!r}"
+                continue
+            self.processed += 1
+            if result.get("status_changed"):
+                self.status_changes += 1
+            results.append(result)
+        self.batches += 1
+        return results
+
+    async def drain(self) -> int:
+        """
+        One tick: run before_drain, then batches covering the segments that
+        were dirty when the tick started; keeps going while over high_water.
+        """
+        started = time.monotonic()
+        if self.before_drain is not None:
+            try:
+                self.before_drain()
+            except Exception as exc:  # still drain what is already queued
+                self.errors += 1
+                self.last_error = f"before_drain: {exc!r}"
+        budget = len(self._dirty)
+        done = 0
+        while self._dirty and (done < budget or len(self._dirty) >= self.high_water):
+            before = self.processed + self.errors
+            self.run_batch()
+            done += self.processed + self.errors - before
+            await asyncio.sleep(0)  # let requests in between batches
+        self.drains += 1
+        self.last_drain_segments = done
+        self.last_drain_s = time.monotonic() - started
+        self.busy_s += self.last_drain_s
+        self.last_drain_at = time.time()
+        return done
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            delay = max(0.0, self.interval_s + random.uniform(-self.jitter_s, self.jitter_s))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # keep the task alive; retry next tick
+                self.errors += 1
+                self.last_error = f"drain: {exc!r}"
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        if len(self._dirty) >= self.high_water:
+            self._wake.set()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "pending": len(self._dirty),
+            "lag_s": round(self.lag_s(), 3),
+            "max_lag_s": round(self.max_lag_s, 3),
+            "marked": self.marked,
+            "processed": self.processed,
+            "status_changes": self.status_changes,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "batches": self.batches,
+            "drains": self.drains,
+            "last_drain_segments": self.last_drain_segments,
+            "last_drain_s": round(self.last_drain_s, 4),
+            # Segments aggregated per second spent draining
+            "throughput_per_s": round(self.processed / self.busy_s, 1) if self.busy_s > 0 else None,
+            "interval_s": self.interval_s,
+            "batch_size": self.batch_size,
+        }
@@ -1,18 +1,62 @@
 from __future__ import annotations
 
+import asyncio
 import math
+import os
 import random
 import hashlib
+import json
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional, Tuple
 
-import httpx
+import numpy as np
 from fastapi import FastAPI, HTTPException, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-app = FastAPI(title="BBP + Road Frontend")
+from aggregation_scheduler import AggregationScheduler
+from geodesy import cumulative_distance_m, haversine_m_array, pairwise_distance_m, polyline_length_m
+from osrm_client import CircuitBreaker, OSRMClient, latency_budget
+from road_graph import LocalRouter, SegmentPenalties
+from note_classifier import NoteClassifier, NoteClassifierSet
+from report_index import NOTE_CLASS_NAMES, SegmentReportIndex, decayed_vote_totals, utc_timestamp, vote_totals
+from road_skeleton import RoadSkeleton
+from segment_table import SegmentGeometryTable
+from route_cache import DiskRouteCache, TTLCache, snap_route_key
+from route_similarity import VertexGrid, routes_are_similar
+from singleflight import SingleFlight
+from spatial_index import HazardTileGrid, SegmentGridIndex, locate_along_polyline, points_near_polyline, points_near_polylines
+from tour import sequence_cost, solve_visit_order
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown."""
+    global LOCAL_ROUTER
+    await OSRM_CLIENT.start()
+    if OSRM_DISK_CACHE is not None:
+        OSRM_DISK_CACHE.open()
+        OSRM_DISK_CACHE.warm(OSRM_CACHE, OSRM_DISK_CACHE_WARM_ENTRIES)
+        if ROAD_SKELETON is not None:
+            for _, data in OSRM_DISK_CACHE.hottest(ROAD_SKELETON_WARM_ENTRIES):
+                ROAD_SKELETON.add_route_response(data)
+    if AGGREGATION_SCHEDULER_ENABLED:
+        AGGREGATION_SCHEDULER.start()
+    if LOCAL_GRAPH_PATH and LOCAL_ROUTER is None:
+        LOCAL_ROUTER = await asyncio.to_thread(
+            LocalRouter.from_file, LOCAL_GRAPH_PATH, contract=LOCAL_GRAPH_CONTRACT
+        )
+        attach_segment_penalties(LOCAL_ROUTER)
+    yield
+    await AGGREGATION_SCHEDULER.stop()
+    await OSRM_CLIENT.aclose()
+    if OSRM_DISK_CACHE is not None:
+        OSRM_DISK_CACHE.close()
+
+
+app = FastAPI(title="BBP + Road Frontend", lifespan=lifespan)
 
 # ---- Internationalization (i18n) ----
 # Translations for English, Chinese, Italian
@@ -246,34 +290,176 @@ OSRM_BASE_URL = "http://router.project-osrm.org"
 OSRM_TIMEOUT = 10.0
 
 
-def fetch_osrm_route(
+OSRM_MAX_CONNECTIONS = 20  # Upper bound on concurrent upstream connections
+OSRM_MAX_KEEPALIVE = 10  # Idle connections kept open for reuse
+OSRM_KEEPALIVE_EXPIRY = 30.0  # Seconds an idle connection stays in the pool
+OSRM_HTTP2: Optional[bool] = None  # None = enable when the h2 package is installed
+
+# Circuit breaker: stop calling OSRM while most recent calls fail
+OSRM_BREAKER_WINDOW = 20  # Recent calls considered for the failure rate
+OSRM_BREAKER_MIN_CALLS = 5  # Calls needed in the window before the breaker can open
+OSRM_BREAKER_FAILURE_RATE = 0.5  # Failure share that opens the breaker
+OSRM_BREAKER_OPEN_S = 30.0  # Seconds to fail fast before probing OSRM again
+OSRM_REQUEST_BUDGET_S = 6.0  # Total OSRM time allowed per API request (caps each call's timeout)
+
+OSRM_BREAKER = CircuitBreaker(
+    window=OSRM_BREAKER_WINDOW,
+    min_calls=OSRM_BREAKER_MIN_CALLS,
+    failure_rate=OSRM_BREAKER_FAILURE_RATE,
+    open_s=OSRM_BREAKER_OPEN_S,
+)
+
+OSRM_CLIENT = OSRMClient(
+    OSRM_BASE_URL,
+    timeout=OSRM_TIMEOUT,
+    max_connections=OSRM_MAX_CONNECTIONS,
+    max_keepalive_connections=OSRM_MAX_KEEPALIVE,
+    keepalive_expiry=OSRM_KEEPALIVE_EXPIRY,
+    http2=OSRM_HTTP2,
+    breaker=OSRM_BREAKER,
+)
+
+
+# In-memory response cache in front of the OSRM fetch functions
+OSRM_CACHE_SIZE = 2048  # Max cached responses (LRU eviction)
+OSRM_CACHE_TTL_S = 600.0  # Seconds a cached route stays valid
+OSRM_CACHE_PRECISION = 4  # Coordinate decimals in the cache key (~11 m)
+
+OSRM_CACHE = TTLCache(maxsize=OSRM_CACHE_SIZE, ttl_s=OSRM_CACHE_TTL_S)
+
+# Persistent cache so popular routes survive restarts (set the path to None to disable)
+OSRM_DISK_CACHE_PATH: Optional[str] = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "osrm_cache.sqlite3"
+)
+OSRM_DISK_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Compressed payload budget before LRU eviction
+OSRM_DISK_CACHE_MAX_AGE_S = 7 * 86400.0  # Road geometry is re-fetched after a week
+OSRM_DISK_CACHE_WARM_ENTRIES = 500  # Hottest entries loaded into OSRM_CACHE on startup
+
+OSRM_DISK_CACHE: Optional[DiskRouteCache] = (
+    DiskRouteCache(
+        OSRM_DISK_CACHE_PATH,
+        max_bytes=OSRM_DISK_CACHE_MAX_BYTES,
+        max_age_s=OSRM_DISK_CACHE_MAX_AGE_S,
+    )
+    if OSRM_DISK_CACHE_PATH else None
+)
+
+# Identical OSRM requests in flight at the same time share one upstream call
+OSRM_INFLIGHT = SingleFlight()
+
+# Embedded road-graph router (road_graph.LocalRouter), loaded on startup
+LOCAL_GRAPH_PATH: Optional[str] = None  # .osm, .geojson or prebuilt .npz road network; None disables
+LOCAL_GRAPH_CONTRACT = False  # Build contraction hierarchies on load (slow startup, faster queries)
+ROUTING_ENGINE = "osrm"  # "osrm": OSRM first, local graph when it fails; "local": local graph only
+PATH_SEARCH_PENALIZED_ROUTING = True  # path_search candidates from segment-penalized local searches when available
+
+# Edge cost factors per preference for penalized local routing. They mirror
+# calculate_route_score: 1 + its per-meter penalties for each status, and its
+# per-pothole penalty in meters.
+ROUTE_PENALTY_PROFILES: Dict[str, Dict[str, float]] = {
+    "safety_first": {"maintenance": 16.0, "suboptimal": 6.0, "medium": 2.5, "pothole_m": 1200.0},
+    "balanced": {"maintenance": 7.0, "suboptimal": 3.0, "medium": 1.5, "pothole_m": 500.0},
+    "shortest": {"maintenance": 2.1, "suboptimal": 1.3, "medium": 1.1, "pothole_m": 100.0},
+}
+SEGMENT_EDGE_MATCH_DEG = 0.0002  # Graph edges within ~20 m of a segment line take its penalty
+
+LOCAL_ROUTER: Optional[LocalRouter] = None
+
+# Road skeleton merged from every OSRM geometry received, routed on when OSRM
+# (and the local graph, if any) cannot answer
+ROAD_SKELETON_ENABLED = True
+ROAD_SKELETON_SNAP_DEG = 0.0001  # ~11m vertex grid; shared streets collapse onto the same nodes
+ROAD_SKELETON_MAX_NODES = 200_000  # Stop growing past this many vertices
+ROAD_SKELETON_MAX_SNAP_M = 250.0  # Endpoints farther than this from the skeleton are not routed on it
+ROAD_SKELETON_WARM_ENTRIES = 2000  # Disk cache entries folded in on startup
+
+ROAD_SKELETON: Optional[RoadSkeleton] = (
+    RoadSkeleton(
+        snap_deg=ROAD_SKELETON_SNAP_DEG,
+        max_nodes=ROAD_SKELETON_MAX_NODES,
+        max_snap_m=ROAD_SKELETON_MAX_SNAP_M,
+    )
+    if ROAD_SKELETON_ENABLED else None
+)
+
+
+async def osrm_route(
+    points: List[Tuple[float, float]],
+    profile: str = "bike",
+    alternatives: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """
+    Fetch an OSRM route through (lat, lon) points, served from OSRM_CACHE
+    when an equivalent request (same profile, alternatives flag and points
+    snapped to OSRM_CACHE_PRECISION) was answered recently, then from
+    OSRM_DISK_CACHE, and only then from the network. Concurrent misses for
+    the same key are coalesced into one lookup by OSRM_INFLIGHT.
+    Cached responses are shared: callers must treat them as read-only.
+
+    With ROUTING_ENGINE = "local" the request goes straight to LOCAL_ROUTER;
+    otherwise LOCAL_ROUTER (if loaded) answers when OSRM returns nothing,
+    and ROAD_SKELETON after that.
+    """
+    if ROUTING_ENGINE == "local" and LOCAL_ROUTER is not None:
+        return await LOCAL_ROUTER.route(points, profile=profile, alternatives=alternatives)
+    key = snap_route_key(profile, points, alternatives, OSRM_CACHE_PRECISION)
+    data = OSRM_CACHE.get(key)
+    if data is not None:
+        return data
+    data = await OSRM_INFLIGHT.run(
+        key, lambda: _fetch_osrm_uncached(key, points, profile, alternatives)
+    )
+    if data is None and LOCAL_ROUTER is not None:
+        data = await LOCAL_ROUTER.route(points, profile=profile, alternatives=alternatives)
+    if data is None and ROAD_SKELETON is not None:
+        # Pure-Python A*: keep it off the event loop like LocalRouter searches
+        data = await asyncio.to_thread(ROAD_SKELETON.route, points, profile, alternatives)
+    return data
+
+
+async def _fetch_osrm_uncached(
+    key: Tuple[Any, ...],
+    points: List[Tuple[float, float]],
+    profile: str,
+    alternatives: bool,
+) -> Optional[Dict[str, Any]]:
+    """Disk cache, then network; fills both caches and the road skeleton on success."""
+    # SQLite calls block, so they run in a worker thread like LocalRouter searches
+    if OSRM_DISK_CACHE is not None:
+        data = await asyncio.to_thread(OSRM_DISK_CACHE.get, key)
+        if data is not None:
+            OSRM_CACHE.set(key, data)
+            if ROAD_SKELETON is not None:
+                await asyncio.to_thread(ROAD_SKELETON.add_route_response, data)
+            return data
+    data = await OSRM_CLIENT.route(points, profile=profile, alternatives=alternatives)
+    if data is not None:
+        OSRM_CACHE.set(key, data)
+        if OSRM_DISK_CACHE is not None:
+            await asyncio.to_thread(OSRM_DISK_CACHE.set, key, data)
+        if ROAD_SKELETON is not None:
+            await asyncio.to_thread(ROAD_SKELETON.add_route_response, data)
+    return data
+
+
+async def fetch_osrm_route(
     from_lat: float, from_lon: float,
     to_lat: float, to_lon: float,
     profile: str = "bike",
     alternatives: bool = True
 ) -> Optional[Dict[str, Any]]:
     """
-    Fetch route from OSRM (synchronous).
+    Fetch route from OSRM through the shared pooled client.
     Returns OSRM response with real road geometry.
     """
-    alt_param = "true" if alternatives else "false"
-    url = (
-        f"{OSRM_BASE_URL}/route/v1/{profile}/"
-        f"{from_lon},{from_lat};{to_lon},{to_lat}"
-        f"?overview=full&geometries=geojson&alternatives={alt_param}&steps=true"
+    return await osrm_route(
+        [(from_lat, from_lon), (to_lat, to_lon)],
+        profile=profile,
+        alternatives=alternatives,
     )
-    try:
-        resp = httpx.get(url, timeout=OSRM_TIMEOUT)
-        resp.raise_for_status()
-        data = resp.json()
-        if data.get("code") == "Ok" and data.get("routes"):
-            return data
-        return None
-    except Exception:
-        return None
 
 
-def fetch_osrm_route_via_waypoint(
+async def fetch_osrm_route_via_waypoint(
     from_lat: float, from_lon: float,
     via_lat: float, via_lon: float,
     to_lat: float, to_lon: float,
@@ -283,20 +469,38 @@ def fetch_osrm_route_via_waypoint(
     Fetch route from OSRM with an intermediate waypoint.
     Used to generate diverse candidate routes.
     """
-    url = (
-        f"{OSRM_BASE_URL}/route/v1/{profile}/"
-        f"{from_lon},{from_lat};{via_lon},{via_lat};{to_lon},{to_lat}"
-        "?overview=full&geometries=geojson&alternatives=false&steps=true"
+    return await fetch_osrm_route_via_waypoints(
+        [(from_lat, from_lon), (via_lat, via_lon), (to_lat, to_lon)],
+        profile=profile,
     )
-    try:
-        resp = httpx.get(url, timeout=OSRM_TIMEOUT)
-        resp.raise_for_status()
-        data = resp.json()
-        if data.get("code") == "Ok" and data.get("routes"):
-            return data
-        return None
-    except Exception:
-        return None
+
+
+async def fetch_osrm_route_via_waypoints(
+    points: List[Tuple[float, float]],
+    profile: str = "bike"
+) -> Optional[Dict[str, Any]]:
+    """
+    Fetch one route from OSRM through (lat, lon) points in the given order
+    (origin, any number of waypoints, destination).
+    """
+    return await osrm_route(points, profile=profile, alternatives=False)
+
+
+async def osrm_table(
+    points: List[Tuple[float, float]],
+    profile: str = "bike"
+) -> Optional[Dict[str, Any]]:
+    """
+    Distance/duration matrix between (lat, lon) points from the OSRM table
+    service, or from LOCAL_ROUTER (same routing-engine rules as osrm_route).
+    Returns None if neither can answer.
+    """
+    if ROUTING_ENGINE == "local" and LOCAL_ROUTER is not None:
+        return await LOCAL_ROUTER.table(points, profile=profile)
+    data = await OSRM_CLIENT.table(points, profile=profile)
+    if data is None and LOCAL_ROUTER is not None:
+        data = await LOCAL_ROUTER.table(points, profile=profile)
+    return data
 
 
 def calculate_perpendicular_waypoints(
@@ -343,50 +547,29 @@ def calculate_perpendicular_waypoints(
     return [waypoint1, waypoint2]
 
 
-def routes_are_similar(route1_coords: List[List[float]], route2_coords: List[List[float]], 
-                       route1_dist: float, route2_dist: float,
-                       distance_threshold: float = 0.02,
-                       coord_similarity_threshold: float = 0.8) -> bool:
+# Geometry check used to drop near-identical candidates ("sample", "hausdorff" or "frechet")
+ROUTE_DEDUP_MODE = "sample"
+
+
+def is_duplicate_route(coords: List[List[float]], distance_m: float, candidates: List[Dict[str, Any]]) -> bool:
     """
-    Check if two routes are essentially the same.
-    Returns True if routes are similar (should be deduplicated).
-    
-    Uses two criteria:
-    1. Distance similarity (within threshold percentage)
-    2. Coordinate overlap (percentage of points that are close)
+    Check a new route against already accepted candidates.
+    Each candidate's vertex grid is built once and kept on the candidate
+    under "_vertex_grid", so repeated comparisons only hash new routes.
     """
-    # Check distance similarity
-    if route1_dist > 0 and route2_dist > 0:
-        dist_diff = abs(route1_dist - route2_dist) / max(route1_dist, route2_dist)
-        if dist_diff > distance_threshold:
-            return False  # Significantly different distances = different routes
-    
-    # Check coordinate similarity by sampling
-    if not route1_coords or not route2_coords:
-        return True
-    
-    # Sample every Nth point from route1 and check if it's close to route2
-    sample_step = max(1, len(route1_coords) // 10)
-    close_count = 0
-    total_sampled = 0
-    
-    for i in range(0, len(route1_coords), sample_step):
-        total_sampled += 1
-        pt1 = route1_coords[i]
-        
-        # Check if this point is close to any point in route2
-        min_dist = float('inf')
-        for pt2 in route2_coords:
-            dist = math.sqrt((pt1[0] - pt2[0])**2 + (pt1[1] - pt2[1])**2)
-            min_dist = min(min_dist, dist)
-            if dist < 0.0005:  # ~50m tolerance
-                break
-        
-        if min_dist < 0.0005:
-            close_count += 1
-    
-    similarity = close_count / total_sampled if total_sampled > 0 else 1.0
-    return similarity >= coord_similarity_threshold
+    for existing in candidates:
+        grid = existing.get("_vertex_grid")
+        if grid is None:
+            grid = VertexGrid(existing["coords"])
+            existing["_vertex_grid"] = grid
+        if routes_are_similar(
+            coords, existing["coords"],
+            distance_m, existing["distance_m"],
+            mode=ROUTE_DEDUP_MODE,
+            route2_grid=grid,
+        ):
+            return True
+    return False
 
 # CORS for Vite dev server (5173), local builds, and LAN access
 app.add_middleware(
@@ -402,15 +585,9 @@ def now_iso() -> str:
     return datetime.utcnow().isoformat()
 
 
-def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Great-circle distance in meters."""
-    R = 6_371_000.0
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dl = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dl / 2) ** 2
-    return 2 * R * math.asin(math.sqrt(a))
+def now_ts() -> float:
+    """Current UTC time as epoch seconds (the numeric form of now_iso)."""
+    return utc_timestamp(datetime.utcnow())
 
 
 def path_line(from_lat: float, from_lon: float, to_lat: float, to_lon: float, steps: int = 30) -> List[List[float]]:
@@ -438,12 +615,7 @@ def path_via(
 
 
 def path_distance_m(coords: List[List[float]]) -> float:
-    d = 0.0
-    for i in range(1, len(coords)):
-        lon1, lat1 = coords[i - 1]
-        lon2, lat2 = coords[i]
-        d += haversine_m(lat1, lon1, lat2, lon2)
-    return d
+    return polyline_length_m(coords)
 
 
 def estimate_duration_s(distance_m: float, speed_mps: float = 11.0) -> float:
@@ -492,7 +664,8 @@ def obfuscate_location(lat: float, lon: float, method: str = "noise") -> tuple:
 
 def obfuscate_trip_geometry(
     coords: List[List[float]], 
-    fuzz_distance_m: float = 150
+    fuzz_distance_m: float = 150,
+    cum_dist_m: Optional[np.ndarray] = None,
 ) -> List[List[float]]:
     """
     Obfuscate the first and last ~fuzz_distance_m of a trip geometry
@@ -500,36 +673,30 @@ def obfuscate_trip_geometry(
     
     coords: List of [lon, lat] pairs (GeoJSON format)
     fuzz_distance_m: Distance in meters to obfuscate from start/end
+    cum_dist_m: Optional cumulative distance array for coords (see
+        geodesy.cumulative_distance_m) when the caller already has one.
+        Otherwise it is computed with the equirectangular approximation,
+        which is exact to well under a millimetre for trip-sized hops.
     
     Returns: Sanitized coordinate list with fuzzed start/end points
     """
     if len(coords) < 2:
         return coords
     
-    # Calculate total path distance and find trim indices
     result = coords.copy()
+    n = len(coords)
+    cum = cum_dist_m if cum_dist_m is not None else cumulative_distance_m(coords, fast=True)
+    total = cum[-1]
     
-    # Calculate distances from start
-    dist_from_start = 0.0
-    start_trim_idx = 0
-    for i in range(1, len(coords)):
-        lon1, lat1 = coords[i - 1]
-        lon2, lat2 = coords[i]
-        dist_from_start += haversine_m(lat1, lon1, lat2, lon2)
-        if dist_from_start >= fuzz_distance_m:
-            start_trim_idx = i
-            break
-    
-    # Calculate distances from end
-    dist_from_end = 0.0
-    end_trim_idx = len(coords) - 1
-    for i in range(len(coords) - 1, 0, -1):
-        lon1, lat1 = coords[i]
-        lon2, lat2 = coords[i - 1]
-        dist_from_end += haversine_m(lat1, lon1, lat2, lon2)
-        if dist_from_end >= fuzz_distance_m:
-            end_trim_idx = i
-            break
+    # First vertex at least fuzz_distance_m from the start (0 if never reached)
+    start_trim_idx = int(np.searchsorted(cum, fuzz_distance_m, side="left"))
+    if start_trim_idx >= n:
+        start_trim_idx = 0
+    
+    # Last vertex whose preceding vertex is at least fuzz_distance_m from the end
+    from_end = total - cum[:-1]  # from_end[i - 1] = distance from vertex i-1 to the end
+    reached = np.nonzero(from_end >= fuzz_distance_m)[0]
+    end_trim_idx = int(reached[-1]) + 1 if reached.size else n - 1
     
     # If trip is too short, just obfuscate endpoints
     if start_trim_idx >= end_trim_idx:
@@ -564,28 +731,148 @@ AGGREGATION_FRESHNESS_WEIGHT = 2.0  # Weight multiplier for fresh reports
 AGGREGATION_CONFIRMED_WEIGHT = 1.5  # Weight multiplier for confirmed reports
 AGGREGATION_THRESHOLD_BAD = 0.6  # If negative_score > this, segment is "maintenance"
 AGGREGATION_THRESHOLD_MEDIUM = 0.3  # If negative_score > this, segment is "medium"
+AGGREGATION_WEIGHTING = "window"  # "window": fresh weight inside AGGREGATION_FRESHNESS_DAYS; "decay": exponential decay
+AGGREGATION_DECAY_HALF_LIFE_DAYS = 30.0  # "decay": a report's extra freshness weight halves every this many days
+
+# Background re-aggregation of segments with new or confirmed reports
+AGGREGATION_SCHEDULER_ENABLED = True
+AGGREGATION_INTERVAL_S = 5.0  # Time between scheduler ticks
+AGGREGATION_JITTER_S = 1.0  # Random +/- offset on each tick
+AGGREGATION_BATCH_SIZE = 200  # Segments aggregated before yielding to requests
+AGGREGATION_HIGH_WATER = 5000  # Pending segments that trigger an immediate, continued drain
+
+# Keywords for classifying report notes, per supported language (lowercase)
+REPORT_NOTE_KEYWORDS: Dict[str, Dict[str, List[str]]] = {
+    "en": {
+        "negative": ["bad", "pothole", "damage", "broken", "crack", "hole",
+                     "rough", "dangerous", "hazard", "poor", "terrible"],
+        "positive": ["good", "fixed", "repaired", "smooth", "clear",
+                     "excellent", "optimal", "safe", "fine"],
+    },
+    "zh": {
+        "negative": ["坑", "破损", "损坏", "裂缝", "颠簸", "危险", "很差", "路况差", "糟糕"],
+        "positive": ["修好", "修复", "平坦", "平整", "良好", "很好", "顺畅"],
+    },
+    "it": {
+        # No "crepe" (plural of "crepa"): it is also an English word
+        "negative": ["buca", "buche", "rotto", "rotta", "rotti", "rotte", "crepa",
+                     "danneggiato", "danneggiata", "danneggiati", "danneggiate",
+                     "dissestato", "dissestata", "dissestati", "dissestate",
+                     "pericoloso", "pericolosa", "pericolosi", "pericolose",
+                     "pessimo", "pessima", "pessimi", "pessime"],
+        "positive": ["riparato", "riparata", "riparati", "riparate",
+                     "sistemato", "sistemata", "sistemati", "sistemate",
+                     "liscio", "liscia", "lisci", "lisce", "ottimo", "ottima", "ottimi", "ottime",
+                     "buono", "buona", "buoni", "buone",
+                     "perfetto", "perfetta", "perfetti", "perfette"],
+    },
+}
+# Languages whose keywords only match whole words. English keeps substring
+# matching ("hole" in "pothole"); Chinese has no word separators.
+REPORT_NOTE_WHOLE_WORD_LANGUAGES = {"it"}
+
+# One compiled matcher per language; NOTE_CLASSIFIER.version changes with the keywords
+NOTE_CLASSIFIER = NoteClassifierSet({
+    lang: NoteClassifier(
+        words["negative"], words["positive"], whole_words=lang in REPORT_NOTE_WHOLE_WORD_LANGUAGES
+    )
+    for lang, words in REPORT_NOTE_KEYWORDS.items()
+})
 
 
-def calculate_report_weight(report: Dict[str, Any]) -> float:
+def classify_report(report: Dict[str, Any]) -> int:
+    """
+    Classify a report's note (negative wins over positive, else neutral) and
+    store the class, matched terms and keyword version on the report.
+    """
+    note_class, terms = NOTE_CLASSIFIER.classify(report.get("note"))
+    report["note_class"] = NOTE_CLASS_NAMES[note_class]
+    report["note_terms"] = terms
+    report["note_keywords_version"] = NOTE_CLASSIFIER.version
+    return note_class
+
+
+def reclassify_reports() -> int:
+    """
+    Re-classify reports stored with an older keyword version (no-op while the
+    keywords are unchanged); segments whose vote changed are queued for
+    aggregation. Returns how many reports changed class.
+    """
+    global _reports_keywords_version
+    version = NOTE_CLASSIFIER.version
+    if _reports_keywords_version == version:
+        return 0
+    changed = 0
+    now = now_ts()
+    for rid, report in REPORTS.items():
+        if report.get("note_keywords_version") == version:
+            continue
+        if REPORT_INDEX.set_note_class(rid, classify_report(report), now=now):
+            AGGREGATION_SCHEDULER.mark_dirty(report["segment_id"])
+            changed += 1
+    _reports_keywords_version = version
+    return changed
+
+
+def report_timestamp(created_at: Any) -> Optional[float]:
+    """Epoch seconds of a report's created_at ISO string, None if it cannot be parsed."""
+    try:
+        return utc_timestamp(datetime.fromisoformat(created_at.replace("Z", "")))
+    except (AttributeError, ValueError, TypeError):
+        return None
+
+
+def _report_ts(report: Dict[str, Any]) -> Optional[float]:
+    """Numeric creation time of a report (created_ts, else parsed from created_at)."""
+    created_ts = report.get("created_ts")
+    return created_ts if created_ts is not None else report_timestamp(report.get("created_at"))
+
+
+def index_report(report: Dict[str, Any]) -> None:
+    """Classify a new report, add it to REPORT_INDEX and queue its segment for aggregation."""
+    REPORT_INDEX.add(
+        report["id"],
+        report["segment_id"],
+        _report_ts(report),
+        bool(report.get("confirmed")),
+        classify_report(report),
+        now=now_ts(),
+    )
+    AGGREGATION_SCHEDULER.mark_dirty(report["segment_id"])
+
+
+def mark_report_confirmed(report_id: int) -> None:
+    """Confirm a report in REPORTS and REPORT_INDEX; queues its segment if that changed anything."""
+    REPORTS[report_id]["confirmed"] = True
+    if REPORT_INDEX.set_confirmed(report_id, now=now_ts()):
+        AGGREGATION_SCHEDULER.mark_dirty(REPORTS[report_id]["segment_id"])
+
+
+def calculate_report_weight(report: Dict[str, Any], now: Optional[float] = None) -> float:
     """
     Calculate the weight of a report based on freshness and confirmation status.
     
     Weighting Rules:
-    - Recent reports (last 30 days) get 2x weight
+    - Recent reports (last 30 days) get 2x weight; with AGGREGATION_WEIGHTING
+      = "decay" the extra weight instead fades smoothly with age
+      (half-life AGGREGATION_DECAY_HALF_LIFE_DAYS)
     - Confirmed reports get 1.5x weight
     - Base weight is 1.0
+    
+    now: epoch seconds, so a caller weighting many reports reads the clock once.
     """
     weight = 1.0
-    
-    # Freshness weight
-    created_at_str = report.get("created_at", "")
-    try:
-        created_at = datetime.fromisoformat(created_at_str.replace("Z", ""))
-        age_days = (datetime.utcnow() - created_at).days
-        if age_days <= AGGREGATION_FRESHNESS_DAYS:
+    now = now_ts() if now is None else now
+    
+    # Freshness weight (unknown creation time: base weight)
+    created_ts = _report_ts(report)
+    if created_ts is not None:
+        age_s = now - created_ts
+        if AGGREGATION_WEIGHTING == "decay":
+            decay = math.exp(-math.log(2) * max(0.0, age_s) / (AGGREGATION_DECAY_HALF_LIFE_DAYS * 86400.0))
+            weight *= 1.0 + (AGGREGATION_FRESHNESS_WEIGHT - 1.0) * decay
+        elif age_s < (AGGREGATION_FRESHNESS_DAYS + 1) * 86400.0:  # i.e. age in whole days <= FRESHNESS_DAYS
             weight *= AGGREGATION_FRESHNESS_WEIGHT
-    except (ValueError, TypeError):
-        pass  # If date parsing fails, use base weight
     
     # Confirmation weight
     if report.get("confirmed", False):
@@ -599,7 +886,7 @@ def aggregate_segment_reports(segment_id: int) -> Dict[str, Any]:
     Aggregate reports for a segment using weighted voting.
     
     Algorithm:
-    1. Collect all reports for the segment
+    1. Read the segment's report counts from REPORT_INDEX
     2. Calculate weighted scores based on:
        - Report freshness (recent = higher weight)
        - Confirmation status (confirmed = higher weight)
@@ -613,9 +900,16 @@ def aggregate_segment_reports(segment_id: int) -> Dict[str, Any]:
     if segment_id not in SEGMENTS:
         return {"error": "segment_id not found"}
     
-    reports = [r for r in REPORTS.values() if r["segment_id"] == segment_id]
+    # Running per-segment totals, kept by REPORT_INDEX as reports arrive and get confirmed
+    segment_totals = REPORT_INDEX.decayed_totals if AGGREGATION_WEIGHTING == "decay" else REPORT_INDEX.totals
+    totals = segment_totals(
+        segment_id,
+        now=now_ts(),
+        fresh_weight=AGGREGATION_FRESHNESS_WEIGHT,
+        confirmed_weight=AGGREGATION_CONFIRMED_WEIGHT,
+    )
     
-    if not reports:
+    if not totals["reports_total"]:
         return {
             "segment_id": segment_id,
             "reports_total": 0,
@@ -625,47 +919,10 @@ def aggregate_segment_reports(segment_id: int) -> Dict[str, Any]:
             "status_changed": False,
         }
     
-    # Keywords for classification
-    negative_keywords = ["bad", "pothole", "damage", "broken", "crack", "hole", 
-                         "rough", "dangerous", "hazard", "poor", "terrible"]
-    positive_keywords = ["good", "fixed", "repaired", "smooth", "clear", 
-                         "excellent", "optimal", "safe", "fine"]
-    
-    total_weight = 0.0
-    negative_weight = 0.0
-    positive_weight = 0.0
-    confirmed_count = 0
-    fresh_count = 0
-    
-    for report in reports:
-        weight = calculate_report_weight(report)
-        total_weight += weight
-        
-        if report.get("confirmed"):
-            confirmed_count += 1
-        
-        # Check freshness
-        try:
-            created_at = datetime.fromisoformat(report.get("created_at", "").replace("Z", ""))
-            if (datetime.utcnow() - created_at).days <= AGGREGATION_FRESHNESS_DAYS:
-                fresh_count += 1
-        except (ValueError, TypeError):
-            pass
-        
-        # Classify report
-        note = (report.get("note") or "").lower()
-        is_negative = any(kw in note for kw in negative_keywords)
-        is_positive = any(kw in note for kw in positive_keywords)
-        
-        # If no keywords, consider it neutral (slightly negative for caution)
-        if is_negative:
-            negative_weight += weight
-        elif is_positive:
-            positive_weight += weight
-        else:
-            # Neutral reports lean slightly negative for safety
-            negative_weight += weight * 0.3
-            positive_weight += weight * 0.7
+    # Neutral reports (no keywords) lean slightly negative for safety
+    total_weight = totals["total_weight"]
+    negative_weight = totals["negative_weight"]
+    positive_weight = totals["positive_weight"]
     
     # Calculate normalized scores
     if total_weight > 0:
@@ -687,17 +944,13 @@ def aggregate_segment_reports(segment_id: int) -> Dict[str, Any]:
         recommended_status = "medium"
     
     # Update segment status if changed
-    status_changed = False
-    if recommended_status != current_status:
-        SEGMENTS[segment_id]["status"] = recommended_status
-        SEGMENTS[segment_id]["last_aggregated"] = now_iso()
-        status_changed = True
+    status_changed = _apply_aggregated_status(segment_id, recommended_status)
     
     return {
         "segment_id": segment_id,
-        "reports_total": len(reports),
-        "reports_confirmed": confirmed_count,
-        "reports_fresh": fresh_count,
+        "reports_total": totals["reports_total"],
+        "reports_confirmed": totals["reports_confirmed"],
+        "reports_fresh": totals["reports_fresh"],
         "weighted_negative_score": round(negative_score, 3),
         "weighted_positive_score": round(positive_score, 3),
         "previous_status": current_status,
@@ -707,17 +960,199 @@ def aggregate_segment_reports(segment_id: int) -> Dict[str, Any]:
     }
 
 
+def _apply_aggregated_status(segment_id: int, recommended_status: str) -> bool:
+    """Set a segment's aggregated status; returns whether it changed."""
+    if recommended_status == SEGMENTS[segment_id]["status"]:
+        return False
+    SEGMENTS[segment_id]["status"] = recommended_status
+    SEGMENTS[segment_id]["last_aggregated"] = now_iso()
+    segment_changed(SEGMENTS[segment_id])
+    return True
+
+
+def aggregate_segments_bulk(segment_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """
+    aggregate_segment_reports for many segments (default: all) at once.
+    
+    Vote counts come from REPORT_INDEX as one matrix; weights, scores and
+    recommended statuses are computed column-wise with NumPy, then only the
+    segments whose status changes are updated. Results are identical to
+    calling aggregate_segment_reports on each segment.
+    """
+    ids = list(SEGMENTS) if segment_ids is None else [sid for sid in segment_ids if sid in SEGMENTS]
+    if not ids:
+        return []
+    now = now_ts()
+    counts = REPORT_INDEX.count_matrix(ids, now)
+    if AGGREGATION_WEIGHTING == "decay":
+        totals = decayed_vote_totals(
+            counts,
+            REPORT_INDEX.decayed_matrix(ids, now),
+            fresh_weight=AGGREGATION_FRESHNESS_WEIGHT,
+            confirmed_weight=AGGREGATION_CONFIRMED_WEIGHT,
+        )
+    else:
+        totals = vote_totals(
+            counts,
+            fresh_weight=AGGREGATION_FRESHNESS_WEIGHT,
+            confirmed_weight=AGGREGATION_CONFIRMED_WEIGHT,
+        )
+    total_weight = totals["total_weight"]
+    has_weight = total_weight > 0
+    safe_total = np.where(has_weight, total_weight, 1.0)
+    negative_score = np.where(has_weight, totals["negative_weight"] / safe_total, 0.0)
+    positive_score = np.where(has_weight, totals["positive_weight"] / safe_total, 0.0)
+    recommended = np.select(
+        [
+            negative_score >= AGGREGATION_THRESHOLD_BAD,
+            negative_score >= AGGREGATION_THRESHOLD_MEDIUM,
+            positive_score > 0.7,
+        ],
+        ["maintenance", "medium", "optimal"],
+        default="medium",
+    )
+    
+    aggregated_at = now_iso()
+    results = []
+    for i, segment_id in enumerate(ids):
+        reports_total = int(totals["reports_total"][i])
+        current_status = SEGMENTS[segment_id]["status"]
+        if not reports_total:
+            results.append({
+                "segment_id": segment_id,
+                "reports_total": 0,
+                "weighted_negative_score": 0.0,
+                "weighted_positive_score": 0.0,
+                "recommended_status": current_status,
+                "status_changed": False,
+            })
+            continue
+        recommended_status = str(recommended[i])
+        results.append({
+            "segment_id": segment_id,
+            "reports_total": reports_total,
+            "reports_confirmed": int(totals["reports_confirmed"][i]),
+            "reports_fresh": int(totals["reports_fresh"][i]),
+            "weighted_negative_score": round(float(negative_score[i]), 3),
+            "weighted_positive_score": round(float(positive_score[i]), 3),
+            "previous_status": current_status,
+            "recommended_status": recommended_status,
+            "status_changed": _apply_aggregated_status(segment_id, recommended_status),
+            "aggregated_at": aggregated_at,
+        })
+    return results
+
+
 # ---- in-memory stores ----
 USERS: Dict[int, Dict[str, Any]] = {}
 SEGMENTS: Dict[int, Dict[str, Any]] = {}
 REPORTS: Dict[int, Dict[str, Any]] = {}
 TRIPS: Dict[int, Dict[str, Any]] = {}
 
+# Bumped whenever a segment is added or its status changes; results derived
+# from SEGMENTS (e.g. PATH_SEARCH_CACHE entries) are keyed by it
+SEGMENTS_VERSION = 0
+
+# segment_id -> reports, with running weighted-vote counts (see report_index)
+REPORT_INDEX = SegmentReportIndex(
+    fresh_window_s=(AGGREGATION_FRESHNESS_DAYS + 1) * 86400.0,
+    decay_half_life_s=AGGREGATION_DECAY_HALF_LIFE_DAYS * 86400.0,
+)
+
+# NOTE_CLASSIFIER.version the stored report classifications were made with
+_reports_keywords_version: Optional[str] = NOTE_CLASSIFIER.version
+
+
+def _mark_expired_segments() -> None:
+    """
+    Queue segments whose reports just left the freshness window (their
+    weights dropped) or changed class after a keyword update.
+    """
+    reclassify_reports()
+    REPORT_INDEX.expire(now_ts())
+    AGGREGATION_SCHEDULER.mark_many(REPORT_INDEX.pop_expired_segments())
+
+
+# Segments whose reports changed are re-aggregated in the background. The
+# scheduler runs on the event loop, so every handler that writes REPORTS,
+# REPORT_INDEX or segment statuses is `async def` (FastAPI would otherwise
+# run it in a worker thread, concurrently with a drain).
+AGGREGATION_SCHEDULER = AggregationScheduler(
+    aggregate_segment_reports,
+    interval_s=AGGREGATION_INTERVAL_S,
+    jitter_s=AGGREGATION_JITTER_S,
+    batch_size=AGGREGATION_BATCH_SIZE,
+    high_water=AGGREGATION_HIGH_WATER,
+    before_drain=_mark_expired_segments,
+)
+
 _next_user_id = 1
 _next_segment_id = 1
 _next_report_id = 1
 _next_trip_id = 1
 
+# Spatial index over segment midpoints, kept in sync with SEGMENTS
+SEGMENT_INDEX_CELL_DEG = 0.002  # ~200m grid, same order as the route matching tolerance
+SEGMENT_INDEX = SegmentGridIndex(cell_deg=SEGMENT_INDEX_CELL_DEG)
+
+# Length, midpoint and bounding box of every segment, computed once at insert
+SEGMENT_GEOMETRY = SegmentGeometryTable()
+
+# Coarse hazard totals per tile, for cheap upper bounds on route scores
+HAZARD_TILE_DEG = 0.005  # ~500m tiles
+HAZARD_TILES = HazardTileGrid(tile_deg=HAZARD_TILE_DEG)
+
+
+def index_segment(seg: Dict[str, Any]) -> None:
+    """Add (or refresh) a segment in the geometry table, the spatial index and the hazard tiles."""
+    SEGMENT_GEOMETRY.upsert(seg["id"], seg["start_lat"], seg["start_lon"], seg["end_lat"], seg["end_lon"])
+    mid_lon, mid_lat = SEGMENT_GEOMETRY.midpoint(seg["id"])
+    SEGMENT_INDEX.insert(seg["id"], mid_lon, mid_lat)
+    obstacle = seg.get("obstacle")
+    HAZARD_TILES.update_segment(
+        seg["id"], mid_lon, mid_lat,
+        seg.get("status", "optimal"),
+        SEGMENT_GEOMETRY.length_m(seg["id"]),
+        pothole=bool(obstacle and "pothole" in obstacle.lower()),
+    )
+
+
+def _update_segment_costs(seg: Dict[str, Any]) -> None:
+    obstacle = seg.get("obstacle")
+    LOCAL_ROUTER.penalties.update_segment(
+        seg["id"],
+        [[seg["start_lon"], seg["start_lat"]], [seg["end_lon"], seg["end_lat"]]],
+        seg.get("status", "optimal"),
+        pothole=bool(obstacle and "pothole" in obstacle.lower()),
+    )
+
+
+def segment_changed(seg: Dict[str, Any]) -> None:
+    """
+    Propagate a new or updated segment to the structures derived from
+    SEGMENTS: the spatial index, the penalized edge costs when a local graph
+    is loaded (only the segment's own edges are recomputed), and
+    SEGMENTS_VERSION, which also drops all cached path_search responses
+    and scored candidate sets. Hazard tiles are updated through
+    index_segment.
+    """
+    global SEGMENTS_VERSION
+    SEGMENTS_VERSION += 1
+    PATH_SEARCH_CACHE.clear()
+    CANDIDATE_SET_CACHE.clear()
+    index_segment(seg)
+    if LOCAL_ROUTER is not None and LOCAL_ROUTER.penalties is not None:
+        _update_segment_costs(seg)
+
+
+def attach_segment_penalties(router: LocalRouter) -> None:
+    """Build penalized edge costs for all current segments on a freshly loaded router."""
+    router.penalties = SegmentPenalties(
+        router.graph, ROUTE_PENALTY_PROFILES, match_tolerance_deg=SEGMENT_EDGE_MATCH_DEG
+    )
+    for seg in SEGMENTS.values():
+        _update_segment_costs(seg)
+
 
 # ---- schemas ----
 class UserCreate(BaseModel):
@@ -740,6 +1175,17 @@ class ReportCreate(BaseModel):
     report_type: Optional[str] = None  # "pothole", "crack", "debris", "flooding", "other"
 
 
+class ReportImport(BaseModel):
+    segment_id: int
+    note: Optional[str] = None
+    confirmed: bool = False
+    created_at: Optional[str] = None  # ISO timestamp, UTC unless it has an offset; defaults to now
+
+
+class ReportBulkCreate(BaseModel):
+    reports: List[ReportImport] = Field(min_length=1)
+
+
 class AutoDetectRequest(BaseModel):
     """Request model for sensor-based automatic detection."""
     z_axis_peak: float = Field(..., description="Peak Z-axis acceleration from accelerometer (m/s²)")
@@ -784,6 +1230,17 @@ class PathSearchRequest(BaseModel):
     preferences: str = Field(default="balanced")  # "safety_first", "shortest", "balanced"
 
 
+class BatchPathSearchRequest(BaseModel):
+    searches: List[PathSearchRequest]
+
+
+class MultiStopRequest(BaseModel):
+    origin: Coordinate
+    stops: List[Coordinate]
+    destination: Optional[Coordinate] = None  # Fixed final point; None = finish at the last stop
+    return_to_origin: bool = False
+
+
 class SegmentWarning(BaseModel):
     lat: float
     lon: float
@@ -917,6 +1374,7 @@ def seed_demo_data():
             **seg,
             "created_at": now_iso(),
         }
+        segment_changed(SEGMENTS[sid])
 
 
 @app.get("/")
@@ -960,7 +1418,7 @@ def list_segments(user_id: Optional[int] = Query(default=None)):
 
 
 @app.post("/api/segments")
-def create_segment(payload: SegmentCreate):
+async def create_segment(payload: SegmentCreate):
     global _next_segment_id
     if payload.user_id not in USERS:
         raise HTTPException(status_code=404, detail="user_id not found")
@@ -981,45 +1439,105 @@ def create_segment(payload: SegmentCreate):
         "created_at": now_iso(),
     }
     SEGMENTS[sid] = s
+    segment_changed(s)
     return s
 
 
 # ---- reports ----
 @app.post("/api/segments/{segment_id}/reports")
-def create_report(segment_id: int, payload: ReportCreate):
+async def create_report(segment_id: int, payload: ReportCreate):
     global _next_report_id
     if segment_id not in SEGMENTS:
         raise HTTPException(status_code=404, detail="segment_id not found")
     rid = _next_report_id
     _next_report_id += 1
+    created = datetime.utcnow()
     r = {
         "id": rid,
         "segment_id": segment_id,
         "note": payload.note,
         "confirmed": False,
-        "created_at": now_iso(),
+        "created_at": created.isoformat(),
+        "created_ts": utc_timestamp(created),  # Numeric form used by aggregation
     }
     REPORTS[rid] = r
+    index_report(r)
     return r
 
 
+@app.post("/api/reports/bulk")
+async def import_reports(payload: ReportBulkCreate):
+    """
+    Import many reports at once (e.g. a historical backfill).
+    
+    Each timestamp is parsed and each note classified once; the reports are
+    indexed column-wise and every affected segment is aggregated in bulk.
+    """
+    global _next_report_id
+    unknown = sorted({item.segment_id for item in payload.reports} - SEGMENTS.keys())
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"segment_id not found: {unknown[:10]}")
+    
+    n = len(payload.reports)
+    now = now_iso()
+    created_ts = np.empty(n)
+    for i, item in enumerate(payload.reports):
+        ts = report_timestamp(item.created_at or now)
+        if ts is None:
+            raise HTTPException(status_code=400, detail=f"invalid created_at at index {i}")
+        created_ts[i] = ts
+    
+    first_id = _next_report_id
+    _next_report_id += n
+    note_class = np.empty(n, dtype=np.int64)
+    for i, item in enumerate(payload.reports):
+        rid = first_id + i
+        REPORTS[rid] = {
+            "id": rid,
+            "segment_id": item.segment_id,
+            "note": item.note,
+            "confirmed": item.confirmed,
+            "created_at": item.created_at or now,
+            "created_ts": float(created_ts[i]),
+        }
+        note_class[i] = classify_report(REPORTS[rid])
+    segment_ids = np.fromiter((item.segment_id for item in payload.reports), dtype=np.int64, count=n)
+    REPORT_INDEX.add_many(
+        range(first_id, first_id + n),
+        segment_ids,
+        created_ts,
+        np.fromiter((item.confirmed for item in payload.reports), dtype=bool, count=n),
+        note_class,
+        now=now_ts(),
+    )
+    
+    results = aggregate_segments_bulk(np.unique(segment_ids).tolist())
+    return {
+        "imported": n,
+        "first_report_id": first_id,
+        "last_report_id": first_id + n - 1,
+        "segments_aggregated": len(results),
+        "status_changes": sum(1 for result in results if result["status_changed"]),
+    }
+
+
 @app.get("/api/segments/{segment_id}/reports")
-def list_reports(segment_id: int):
+async def list_reports(segment_id: int):
     if segment_id not in SEGMENTS:
         raise HTTPException(status_code=404, detail="segment_id not found")
-    return [r for r in REPORTS.values() if r["segment_id"] == segment_id]
+    return [REPORTS[rid] for rid in REPORT_INDEX.report_ids(segment_id)]
 
 
 @app.post("/api/reports/{report_id}/confirm")
-def confirm_report(report_id: int):
+async def confirm_report(report_id: int):
     if report_id not in REPORTS:
         raise HTTPException(status_code=404, detail="report_id not found")
-    REPORTS[report_id]["confirmed"] = True
+    mark_report_confirmed(report_id)
     return REPORTS[report_id]
 
 
 @app.get("/api/segments/{segment_id}/aggregate")
-def aggregate(segment_id: int):
+async def aggregate(segment_id: int):
     """
     Aggregate reports for a segment using weighted voting algorithm.
     
@@ -1037,7 +1555,7 @@ def aggregate(segment_id: int):
 
 
 @app.post("/api/aggregation/trigger")
-def trigger_aggregation_all():
+async def trigger_aggregation_all():
     """
     Trigger data aggregation for ALL segments (simulates cron job from DD).
     
@@ -1046,14 +1564,11 @@ def trigger_aggregation_all():
     
     Returns summary of all segments processed and status changes.
     """
-    results = []
-    status_changes = 0
-    
-    for segment_id in SEGMENTS:
-        result = aggregate_segment_reports(segment_id)
-        if result.get("status_changed"):
-            status_changes += 1
-        results.append(result)
+    reclassify_reports()
+    results = aggregate_segments_bulk()
+    status_changes = sum(1 for result in results if result["status_changed"])
+    # Everything is fresh now; nothing left for the background scheduler
+    AGGREGATION_SCHEDULER.clear()
     
     return {
         "triggered_at": now_iso(),
@@ -1063,9 +1578,15 @@ def trigger_aggregation_all():
     }
 
 
+@app.get("/api/aggregation/status")
+async def aggregation_status():
+    """Background aggregation scheduler metrics: pending segments, lag and throughput."""
+    return {**AGGREGATION_SCHEDULER.stats(), "report_index": REPORT_INDEX.stats()}
+
+
 # ---- trips ----
 @app.post("/api/trips")
-def create_trip(payload: TripCreate, use_osrm: bool = Query(default=False)):
+async def create_trip(payload: TripCreate, use_osrm: bool = Query(default=False)):
     """
     Create a trip with Privacy By Design:
     - Raw coordinates are stored privately
@@ -1079,6 +1600,7 @@ def create_trip(payload: TripCreate, use_osrm: bool = Query(default=False)):
         raise HTTPException(status_code=404, detail="user_id not found")
 
     coords: List[List[float]]
+    cum_dist: Optional[np.ndarray] = None
     route_source = "geometry"
     
     # Get user language for weather
@@ -1086,12 +1608,13 @@ def create_trip(payload: TripCreate, use_osrm: bool = Query(default=False)):
 
     if use_osrm or payload.use_osrm:
         # Try OSRM for real road geometry (use bike profile)
-        osrm_data = fetch_osrm_route(
-            payload.from_lat, payload.from_lon,
-            payload.to_lat, payload.to_lon,
-            profile="bike",
-            alternatives=False
-        )
+        with latency_budget(OSRM_REQUEST_BUDGET_S):
+            osrm_data = await fetch_osrm_route(
+                payload.from_lat, payload.from_lon,
+                payload.to_lat, payload.to_lon,
+                profile="bike",
+                alternatives=False
+            )
         
         if osrm_data and osrm_data.get("routes"):
             route = osrm_data["routes"][0]
@@ -1102,7 +1625,8 @@ def create_trip(payload: TripCreate, use_osrm: bool = Query(default=False)):
         else:
             # fallback to straight line
             coords = path_line(payload.from_lat, payload.from_lon, payload.to_lat, payload.to_lon, steps=30)
-            dist = path_distance_m(coords)
+            cum_dist = cumulative_distance_m(coords)
+            dist = float(cum_dist[-1])
             dur = estimate_duration_s(dist)
             route_source = "fallback"
     else:
@@ -1111,12 +1635,17 @@ def create_trip(payload: TripCreate, use_osrm: bool = Query(default=False)):
             if payload.geometry and payload.geometry.coordinates
             else path_line(payload.from_lat, payload.from_lon, payload.to_lat, payload.to_lon, steps=30)
         )
-        dist = payload.distance_m if payload.distance_m is not None else path_distance_m(coords)
+        if payload.distance_m is not None:
+            dist = payload.distance_m
+        else:
+            cum_dist = cumulative_distance_m(coords)
+            dist = float(cum_dist[-1])
         dur = payload.duration_s if payload.duration_s is not None else estimate_duration_s(dist)
 
     # Privacy By Design: Obfuscate start/end locations
     # Store raw coordinates privately, but create sanitized public version
-    public_coords = obfuscate_trip_geometry(coords, fuzz_distance_m=PRIVACY_FUZZ_METERS)
+    # (reuses the cumulative distances computed above when available)
+    public_coords = obfuscate_trip_geometry(coords, fuzz_distance_m=PRIVACY_FUZZ_METERS, cum_dist_m=cum_dist)
     
     # Obfuscate exact from/to coordinates for public display
     obf_from = obfuscate_location(payload.from_lat, payload.from_lon, "truncate")
@@ -1300,7 +1829,7 @@ def auto_detect_segment(segment_id: int, sensor_data: Optional[AutoDetectRequest
 
 
 @app.post("/api/segments/{segment_id}/apply-detection")
-def apply_detection(segment_id: int, new_status: str = Query(...)):
+async def apply_detection(segment_id: int, new_status: str = Query(...)):
     """Apply the detected status to the segment."""
     if segment_id not in SEGMENTS:
         raise HTTPException(status_code=404, detail="segment_id not found")
@@ -1309,6 +1838,7 @@ def apply_detection(segment_id: int, new_status: str = Query(...)):
     
     old_status = SEGMENTS[segment_id]["status"]
     SEGMENTS[segment_id]["status"] = new_status
+    segment_changed(SEGMENTS[segment_id])
     return {
         "segment_id": segment_id,
         "old_status": old_status,
@@ -1318,12 +1848,12 @@ def apply_detection(segment_id: int, new_status: str = Query(...)):
 
 
 @app.post("/api/reports/batch-confirm")
-def batch_confirm_reports(report_ids: List[int]):
+async def batch_confirm_reports(report_ids: List[int]):
     """Confirm multiple reports at once."""
     results = []
     for rid in report_ids:
         if rid in REPORTS:
-            REPORTS[rid]["confirmed"] = True
+            mark_report_confirmed(rid)
             results.append({"id": rid, "confirmed": True})
         else:
             results.append({"id": rid, "error": "not found"})
@@ -1331,7 +1861,7 @@ def batch_confirm_reports(report_ids: List[int]):
 
 
 @app.post("/api/segments/{segment_id}/auto-confirm-reports")
-def auto_confirm_reports(segment_id: int, threshold: int = Query(default=2)):
+async def auto_confirm_reports(segment_id: int, threshold: int = Query(default=2)):
     """
     Auto-confirm reports for a segment if they have similar notes (matching pattern).
     threshold = minimum number of similar reports to trigger auto-confirm.
@@ -1339,14 +1869,14 @@ def auto_confirm_reports(segment_id: int, threshold: int = Query(default=2)):
     if segment_id not in SEGMENTS:
         raise HTTPException(status_code=404, detail="segment_id not found")
     
-    reports = [r for r in REPORTS.values() if r["segment_id"] == segment_id and not r["confirmed"]]
+    reports = [REPORTS[rid] for rid in REPORT_INDEX.report_ids(segment_id) if not REPORTS[rid]["confirmed"]]
     if len(reports) < threshold:
         return {"auto_confirmed": 0, "message": f"Need at least {threshold} unconfirmed reports"}
     
     # Simple pattern: confirm all if we have enough reports
     confirmed_ids = []
     for r in reports:
-        REPORTS[r["id"]]["confirmed"] = True
+        mark_report_confirmed(r["id"])
         confirmed_ids.append(r["id"])
     
     return {"auto_confirmed": len(confirmed_ids), "report_ids": confirmed_ids}
@@ -1447,7 +1977,7 @@ def get_stats(user_id: Optional[int] = Query(default=None)):
     total_segments = len(SEGMENTS)
     total_reports = len(REPORTS)
     total_trips = len(TRIPS)
-    confirmed_reports = sum(1 for r in REPORTS.values() if r["confirmed"])
+    confirmed_reports = REPORT_INDEX.confirmed_total
     
     status_counts = {}
     status_counts_localized = {}
@@ -1471,7 +2001,7 @@ def get_stats(user_id: Optional[int] = Query(default=None)):
 
 
 @app.post("/api/routes")
-def preview_routes(req: RoutesRequest, user_id: Optional[int] = Query(default=None)):
+async def preview_routes(req: RoutesRequest, user_id: Optional[int] = Query(default=None)):
     """
     Preview multiple route options between two points.
     Uses OSRM for real road geometry when available.
@@ -1480,17 +2010,19 @@ def preview_routes(req: RoutesRequest, user_id: Optional[int] = Query(default=No
     route_source = "osrm"
     
     # Try OSRM first
-    osrm_data = fetch_osrm_route(
-        req.from_lat, req.from_lon,
-        req.to_lat, req.to_lon,
-        profile="bike",
-        alternatives=True
-    )
+    with latency_budget(OSRM_REQUEST_BUDGET_S):
+        osrm_data = await fetch_osrm_route(
+            req.from_lat, req.from_lon,
+            req.to_lat, req.to_lon,
+            profile="bike",
+            alternatives=True
+        )
     
     routes = []
     
     if osrm_data and osrm_data.get("routes"):
-        # Use real OSRM routes
+        # Use real OSRM routes (or local graph / road skeleton ones)
+        route_source = osrm_data.get("engine", "osrm")
         osrm_routes = osrm_data["routes"][:req.n]
         labels = ["Direct", "Alt 1", "Alt 2", "Alt 3", "Alt 4"]
         
@@ -1506,7 +2038,7 @@ def preview_routes(req: RoutesRequest, user_id: Optional[int] = Query(default=No
                 "duration_s": round(dur, 1),
                 "duration_display": _format_duration(dur),
                 "geometry": {"type": "LineString", "coordinates": coords},
-                "source": "osrm",
+                "source": route_source,
             })
     else:
         # Fallback to math-based routes
@@ -1569,6 +2101,129 @@ def preview_routes(req: RoutesRequest, user_id: Optional[int] = Query(default=No
     }
 
 
+# ---- Multi-stop trips ----
+MULTI_STOP_MAX_STOPS = 23  # Stops per request, origin and destination not included
+
+
+@app.post("/api/routes/multi-stop")
+async def plan_multi_stop(req: MultiStopRequest):
+    """
+    Plan an errand trip through several stops with two upstream calls.
+    
+    1. One distance matrix for origin, stops and destination (OSRM table
+       service or the local graph; straight-line distances if both fail)
+    2. Visiting order: nearest neighbour, then 2-opt / Or-opt improvements
+       (origin first, destination or origin last when given)
+    3. One route through all points in that order
+       (fetch_osrm_route_via_waypoints; straight legs as fallback)
+    
+    stop_order lists indices into the request's stops in visiting order.
+    """
+    if not req.stops:
+        raise HTTPException(status_code=400, detail="stops must not be empty")
+    if len(req.stops) > MULTI_STOP_MAX_STOPS:
+        raise HTTPException(status_code=400, detail=f"at most {MULTI_STOP_MAX_STOPS} stops")
+    if req.destination is not None and req.return_to_origin:
+        raise HTTPException(status_code=400, detail="destination and return_to_origin are mutually exclusive")
+    
+    points = [(req.origin.lat, req.origin.lon)] + [(s.lat, s.lon) for s in req.stops]
+    end = None
+    if req.destination is not None:
+        points.append((req.destination.lat, req.destination.lon))
+        end = len(points) - 1
+    
+    with latency_budget(OSRM_REQUEST_BUDGET_S):
+        table = await osrm_table(points, profile="bike")
+        if table is not None:
+            matrix = table["distances"]
+            matrix_source = table.get("engine", "osrm")
+        else:
+            lonlat = [[lon, lat] for lat, lon in points]
+            matrix = pairwise_distance_m(lonlat, lonlat).tolist()
+            matrix_source = "haversine"
+        
+        seq = solve_visit_order(matrix, start=0, end=end, return_to_start=req.return_to_origin)
+        ordered = [points[i] for i in seq]
+        route_data = await fetch_osrm_route_via_waypoints(ordered, profile="bike")
+    
+    if route_data is not None:
+        route = route_data["routes"][0]
+        coords = route["geometry"]["coordinates"]
+        distance_m = route["distance"]
+        duration_s = route["duration"]
+        legs = [
+            {"distance": round(leg["distance"], 1), "duration_s": round(leg["duration"], 1)}
+            for leg in route.get("legs", [])
+        ]
+        route_source = route_data.get("engine", "osrm")
+    else:
+        coords = []
+        legs = []
+        for (a_lat, a_lon), (b_lat, b_lon) in zip(ordered, ordered[1:]):
+            leg_coords = path_line(a_lat, a_lon, b_lat, b_lon)
+            leg_m = path_distance_m(leg_coords)
+            legs.append({"distance": round(leg_m, 1), "duration_s": round(estimate_duration_s(leg_m), 1)})
+            coords.extend(leg_coords[1:] if coords else leg_coords)
+        distance_m = path_distance_m(coords)
+        duration_s = estimate_duration_s(distance_m)
+        route_source = "fallback"
+    
+    input_seq = list(range(len(req.stops) + 1))
+    if end is not None:
+        input_seq.append(end)
+    elif req.return_to_origin:
+        input_seq.append(0)
+    
+    waypoints = []
+    for i in seq:
+        lat, lon = points[i]
+        if i == 0:
+            waypoints.append({"lat": lat, "lon": lon, "kind": "origin"})
+        elif i == end:
+            waypoints.append({"lat": lat, "lon": lon, "kind": "destination"})
+        else:
+            waypoints.append({"lat": lat, "lon": lon, "kind": "stop", "stop_index": i - 1})
+    
+    order_m = sequence_cost(matrix, seq)
+    input_order_m = sequence_cost(matrix, input_seq)
+    return {
+        "stop_order": [i - 1 for i in seq if 0 < i <= len(req.stops)],
+        "waypoints": waypoints,
+        "total_distance": round(distance_m, 1),
+        "duration_s": round(duration_s, 1),
+        "duration_display": _format_duration(duration_s),
+        "legs": legs,
+        "geometry": encode_polyline(coords),
+        "geometry_geojson": {"type": "LineString", "coordinates": coords},
+        "matrix_source": matrix_source,
+        "route_source": route_source,
+        "order_distance_m": round(order_m, 1) if order_m is not None else None,
+        "input_order_distance_m": round(input_order_m, 1) if input_order_m is not None else None,
+    }
+
+
+# ---- Routing service status ----
+@app.get("/api/osrm/stats")
+def get_osrm_stats():
+    """Counters for the routing layers (breaker, coalescing, memory and disk caches, local graph, road skeleton)."""
+    return {
+        "base_url": OSRM_CLIENT.base_url,
+        "degraded": OSRM_BREAKER.state != CircuitBreaker.CLOSED,
+        "client": OSRM_CLIENT.stats(),
+        "circuit_breaker": OSRM_BREAKER.stats(),
+        "coalescing": OSRM_INFLIGHT.stats(),
+        "cache": OSRM_CACHE.stats(),
+        "disk_cache": OSRM_DISK_CACHE.stats() if OSRM_DISK_CACHE is not None else None,
+        "routing_engine": ROUTING_ENGINE,
+        "local_router": LOCAL_ROUTER.stats() if LOCAL_ROUTER is not None else None,
+        "road_skeleton": ROAD_SKELETON.stats() if ROAD_SKELETON is not None else None,
+        "segments_version": SEGMENTS_VERSION,
+        "path_search_cache": PATH_SEARCH_CACHE.stats(),
+        "candidate_set_cache": CANDIDATE_SET_CACHE.stats(),
+        "hazard_tiles": len(HAZARD_TILES),
+    }
+
+
 # ---- i18n API ----
 @app.get("/api/i18n/translations")
 def get_translations(lang: str = Query(default="en")):
@@ -1619,29 +2274,54 @@ def find_segments_near_route(route_coords: List[List[float]], tolerance_deg: flo
     Find all segments in the database that are near the given route.
     route_coords: list of [lon, lat] pairs
     tolerance_deg: roughly ~200m at equator
+
+    Only segments returned by SEGMENT_INDEX for the route's buffered corridor
+    are tested, so the cost scales with nearby segments, not the whole table.
+    The midpoint-to-route distances of all candidates are computed in one
+    vectorized pass (see spatial_index.points_near_polyline).
     """
-    nearby_segments = []
-    for seg in SEGMENTS.values():
-        seg_start = (seg["start_lon"], seg["start_lat"])
-        seg_end = (seg["end_lon"], seg["end_lat"])
-        seg_mid_lon = (seg_start[0] + seg_end[0]) / 2
-        seg_mid_lat = (seg_start[1] + seg_end[1]) / 2
-        
-        # Check if segment midpoint is close to any point in route
-        for i in range(len(route_coords) - 1):
-            lon1, lat1 = route_coords[i]
-            lon2, lat2 = route_coords[i + 1]
-            dist = point_to_segment_distance(seg_mid_lon, seg_mid_lat, lon1, lat1, lon2, lat2)
-            if dist < tolerance_deg:
-                nearby_segments.append(seg)
-                break
-    return nearby_segments
+    candidates = [
+        SEGMENTS[sid]
+        for sid in SEGMENT_INDEX.query_corridor(route_coords, tolerance_deg)
+        if sid in SEGMENTS
+    ]
+    if not candidates:
+        return []
+    
+    midpoints = SEGMENT_GEOMETRY.midpoints(SEGMENT_GEOMETRY.rows(seg["id"] for seg in candidates))
+    hits = points_near_polyline(midpoints, route_coords, tolerance_deg)
+    return [seg for seg, hit in zip(candidates, hits) if hit]
+
+
+def find_segments_near_routes(
+    routes_coords: List[List[List[float]]],
+    tolerance_deg: float = 0.002,
+) -> List[List[Dict[str, Any]]]:
+    """
+    find_segments_near_route for several routes at once (same results, same order).
+    Candidates are the union of the routes' corridors and are tested against
+    all routes in one vectorized pass (see spatial_index.points_near_polylines).
+    """
+    ids = set()
+    for coords in routes_coords:
+        ids.update(SEGMENT_INDEX.query_corridor(coords, tolerance_deg))
+    candidates = [SEGMENTS[sid] for sid in sorted(ids) if sid in SEGMENTS]
+    if not candidates:
+        return [[] for _ in routes_coords]
+    
+    midpoints = SEGMENT_GEOMETRY.midpoints(SEGMENT_GEOMETRY.rows(seg["id"] for seg in candidates))
+    hits = points_near_polylines(midpoints, routes_coords, tolerance_deg)
+    return [
+        [seg for seg, hit in zip(candidates, hits[:, r]) if hit]
+        for r in range(len(routes_coords))
+    ]
 
 
 def calculate_route_score(
     distance_m: float,
     nearby_segments: List[Dict[str, Any]],
-    preferences: str = "balanced"
+    preferences: str = "balanced",
+    route_coords: Optional[List[List[float]]] = None
 ) -> tuple:
     """
     Calculate route score. Returns (score, quality_score, pothole_count, bad_road_length, tags, warnings).
@@ -1658,50 +2338,117 @@ def calculate_route_score(
     - "Best Surface" only appears when no issues AND not marked as "Fastest"
     - "Fastest" only appears for shortest preference on direct route
     """
+    return score_route_components(
+        distance_m, route_penalty_components(nearby_segments, route_coords), preferences
+    )
+
+
+WARNING_DEDUP_DEG = 0.0001  # A Road Work warning is dropped when a pothole warning is this close
+
+
+def _warning_cell(lat: float, lon: float) -> Tuple[int, int]:
+    return (math.floor(lat / WARNING_DEDUP_DEG), math.floor(lon / WARNING_DEDUP_DEG))
+
+
+def _pothole_near(cells: Dict[Tuple[int, int], List[Tuple[float, float]]], lat: float, lon: float) -> bool:
+    """True if a recorded pothole lies within WARNING_DEDUP_DEG (in lat and lon) of the point."""
+    cy, cx = _warning_cell(lat, lon)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            for p_lat, p_lon in cells.get((cy + dy, cx + dx), ()):
+                if abs(p_lat - lat) < WARNING_DEDUP_DEG and abs(p_lon - lon) < WARNING_DEDUP_DEG:
+                    return True
+    return False
+
+
+def route_penalty_components(
+    nearby_segments: List[Dict[str, Any]],
+    route_coords: Optional[List[List[float]]] = None,
+) -> Dict[str, Any]:
+    """
+    Preference-independent part of calculate_route_score: pothole count,
+    lengths of bad / maintenance / medium road and the warning list.
+    Computed once per candidate, then scored for any preference with
+    score_route_components.
+    
+    Pothole warnings are bucketed by quantized position, so checking a
+    maintenance segment for a nearby pothole is O(1) instead of a scan of
+    all warnings. With route_coords, every warning gets distance_along_m
+    (linear referencing against the route) and the list is ordered by it.
+    """
     pothole_count = 0
     bad_road_length_m = 0.0
     maintenance_length_m = 0.0  # Track maintenance separately for safety_first
     medium_length_m = 0.0  # Track medium quality roads
     warnings = []
     
-    for seg in nearby_segments:
+    # Precomputed lengths for stored segments; computed here only for ad-hoc ones
+    rows = SEGMENT_GEOMETRY.rows(seg.get("id") for seg in nearby_segments)
+    if rows is not None:
+        seg_lengths = SEGMENT_GEOMETRY.lengths_m(rows).tolist()
+        midpoints = SEGMENT_GEOMETRY.midpoints(rows).tolist()
+    else:
+        seg_lengths = haversine_m_array(
+            [seg["start_lat"] for seg in nearby_segments],
+            [seg["start_lon"] for seg in nearby_segments],
+            [seg["end_lat"] for seg in nearby_segments],
+            [seg["end_lon"] for seg in nearby_segments],
+        ).tolist()
+        midpoints = [
+            [(seg["start_lon"] + seg["end_lon"]) / 2, (seg["start_lat"] + seg["end_lat"]) / 2]
+            for seg in nearby_segments
+        ]
+    pothole_cells: Dict[Tuple[int, int], List[Tuple[float, float]]] = {}
+    
+    for seg, seg_len, (mid_lon, mid_lat) in zip(nearby_segments, seg_lengths, midpoints):
         status = seg.get("status", "optimal")
         obstacle = seg.get("obstacle")
-        seg_len = haversine_m(
-            seg["start_lat"], seg["start_lon"],
-            seg["end_lat"], seg["end_lon"]
-        )
         
         # Count potholes
         if obstacle and "pothole" in obstacle.lower():
             pothole_count += 1
-            warnings.append({
-                "lat": (seg["start_lat"] + seg["end_lat"]) / 2,
-                "lon": (seg["start_lon"] + seg["end_lon"]) / 2,
-                "type": "Pothole"
-            })
+            warnings.append({"lat": mid_lat, "lon": mid_lon, "type": "Pothole"})
+            pothole_cells.setdefault(_warning_cell(mid_lat, mid_lon), []).append((mid_lat, mid_lon))
         
         # Track road quality by status
         if status == "maintenance":
             maintenance_length_m += seg_len
             bad_road_length_m += seg_len
-            if not any(w["type"] == "Pothole" for w in warnings if 
-                abs(w["lat"] - (seg["start_lat"] + seg["end_lat"]) / 2) < 0.0001):
-                warnings.append({
-                    "lat": (seg["start_lat"] + seg["end_lat"]) / 2,
-                    "lon": (seg["start_lon"] + seg["end_lon"]) / 2,
-                    "type": "Road Work"
-                })
+            if not _pothole_near(pothole_cells, mid_lat, mid_lon):
+                warnings.append({"lat": mid_lat, "lon": mid_lon, "type": "Road Work"})
         elif status == "suboptimal":
             bad_road_length_m += seg_len
-            warnings.append({
-                "lat": (seg["start_lat"] + seg["end_lat"]) / 2,
-                "lon": (seg["start_lon"] + seg["end_lon"]) / 2,
-                "type": "Bad Road"
-            })
+            warnings.append({"lat": mid_lat, "lon": mid_lon, "type": "Bad Road"})
         elif status == "medium":
             medium_length_m += seg_len
     
+    if warnings and route_coords is not None and len(route_coords) >= 2:
+        along = locate_along_polyline([[w["lon"], w["lat"]] for w in warnings], route_coords)
+        for warning, dist_m in zip(warnings, along.tolist()):
+            warning["distance_along_m"] = round(dist_m, 1)
+        warnings.sort(key=lambda w: w["distance_along_m"])
+    
+    return {
+        "pothole_count": pothole_count,
+        "bad_road_length_m": bad_road_length_m,
+        "maintenance_length_m": maintenance_length_m,
+        "medium_length_m": medium_length_m,
+        "warnings": warnings,
+    }
+
+
+def score_route_components(
+    distance_m: float,
+    components: Dict[str, Any],
+    preferences: str = "balanced"
+) -> tuple:
+    """Score route_penalty_components for one preference (same result tuple as calculate_route_score)."""
+    pothole_count = components["pothole_count"]
+    bad_road_length_m = components["bad_road_length_m"]
+    maintenance_length_m = components["maintenance_length_m"]
+    medium_length_m = components["medium_length_m"]
+    warnings = components["warnings"]
+    
     # Calculate penalty-based score (lower is better)
     if preferences == "safety_first":
         # VERY heavy penalty for maintenance segments (as per RASD requirement)
@@ -1833,7 +2580,7 @@ def _generate_fallback_routes(
         
         nearby_segs = find_segments_near_route(coords)
         score, quality_score, pothole_count, bad_road_len, tags, warnings = calculate_route_score(
-            distance_m, nearby_segs, preferences
+            distance_m, nearby_segs, preferences, route_coords=coords
         )
         
         if offset == 0.0:
@@ -1860,8 +2607,231 @@ def _generate_fallback_routes(
     return candidates
 
 
+# Start the smaller-offset detours together with the first round instead of
+# only after it comes back with too few distinct routes
+PATH_SEARCH_SPECULATIVE_OFFSETS = True
+
+# Whole path_search responses, keyed by request, SEGMENTS_VERSION and weather hour
+PATH_SEARCH_CACHE_SIZE = 1024  # Max cached responses (LRU eviction)
+PATH_SEARCH_CACHE_TTL_S = 600.0  # Same lifetime as the OSRM route cache
+
+PATH_SEARCH_CACHE = TTLCache(maxsize=PATH_SEARCH_CACHE_SIZE, ttl_s=PATH_SEARCH_CACHE_TTL_S)
+
+# Short-lived cache of generated candidates with their penalty components, so
+# switching preference for the same trip only re-scores and re-sorts
+CANDIDATE_SET_CACHE_SIZE = 512
+CANDIDATE_SET_CACHE_TTL_S = 120.0
+
+CANDIDATE_SET_CACHE = TTLCache(maxsize=CANDIDATE_SET_CACHE_SIZE, ttl_s=CANDIDATE_SET_CACHE_TTL_S)
+
+# Degraded-mode results are not cached, so real routes return once OSRM recovers
+UNCACHED_ROUTE_SOURCES = ("fallback", "skeleton")
+
+PATH_SEARCH_MAX_SCORED = 3  # Candidates returned; the shortest is always among them
+ROUTE_CORRIDOR_DEG = 0.002  # find_segments_near_routes tolerance used for scoring
+
+
+def route_score_upper_bound(candidate: Dict[str, Any], preferences: str) -> float:
+    """
+    Upper bound on the candidate's exact score for `preferences`, from the
+    hazard tiles covering its matching corridor (no segment matching). Tiles
+    and the exact match are both keyed by segment midpoint, so the tiles hold
+    every segment the match can find, and penalties only grow with hazard mass.
+    """
+    mass = HAZARD_TILES.route_mass(candidate["coords"], buffer_deg=ROUTE_CORRIDOR_DEG)
+    components = {
+        "pothole_count": mass["potholes"],
+        "bad_road_length_m": mass["maintenance_m"] + mass["suboptimal_m"],
+        "maintenance_length_m": mass["maintenance_m"],
+        "medium_length_m": mass["medium_m"],
+        "warnings": [],
+    }
+    return score_route_components(candidate["distance_m"], components, preferences)[0]
+
+
+def shortlist_candidates(candidates: List[Dict[str, Any]], preferences: str) -> List[int]:
+    """
+    Indices (in generation order) of the candidates that can still rank among
+    the top PATH_SEARCH_MAX_SCORED for `preferences`; only these need the
+    exact corridor match.
+    
+    - shortest ranks by distance, which is exact: the N shortest are kept
+    - balanced ranks by score, which is at least the distance: a candidate
+      is dropped once N others are certainly better (their tile upper
+      bound is below its distance)
+    - safety_first ranks by hazard per meter, which the tiles cannot bound
+      from below: nothing is dropped
+    The minimum-distance candidate is always kept.
+    """
+    n = len(candidates)
+    if n <= PATH_SEARCH_MAX_SCORED or preferences == "safety_first":
+        return list(range(n))
+    by_distance = sorted(range(n), key=lambda i: candidates[i]["distance_m"])
+    if preferences == "shortest":
+        return sorted(by_distance[:PATH_SEARCH_MAX_SCORED])
+    upper = [route_score_upper_bound(c, preferences) for c in candidates]
+    keep = {
+        i
+        for i, candidate in enumerate(candidates)
+        if sum(1 for j in range(n) if j != i and upper[j] < candidate["distance_m"]) < PATH_SEARCH_MAX_SCORED
+    }
+    keep.add(by_distance[0])
+    return sorted(keep)
+
+
+def evaluate_candidates(candidate_set: Dict[str, Any], indices: List[int]) -> List[Dict[str, Any]]:
+    """
+    Candidates at `indices` with their route_penalty_components. Components
+    are preference-independent, so each candidate is matched at most once
+    per candidate set (kept in candidate_set["components"]); the missing
+    ones are matched in one pass.
+    """
+    candidates = candidate_set["candidates"]
+    known = candidate_set["components"]
+    missing = [i for i in indices if i not in known]
+    if missing:
+        nearby_per_candidate = find_segments_near_routes(
+            [candidates[i]["coords"] for i in missing], ROUTE_CORRIDOR_DEG
+        )
+        for i, nearby_segs in zip(missing, nearby_per_candidate):
+            known[i] = route_penalty_components(nearby_segs, candidates[i]["coords"])
+    return [{**candidates[i], "components": known[i]} for i in indices]
+
+
+def _via_candidate(via_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not via_data or not via_data.get("routes"):
+        return None
+    route = via_data["routes"][0]
+    return {
+        "coords": route["geometry"]["coordinates"],
+        "distance_m": route["distance"],
+        "duration_s": route["duration"],
+        "source": "osrm_via_waypoint",
+    }
+
+
+async def generate_osrm_candidates(
+    origin_lat: float, origin_lon: float,
+    dest_lat: float, dest_lon: float,
+) -> List[Dict[str, Any]]:
+    """
+    Candidate generation for path_search.
+    
+    - Candidate 1: Direct route (OSRM may add one alternative)
+    - Candidates 2-3: Routes via perpendicular waypoints (15% offset)
+    - If fewer than 2 distinct routes remain, waypoints at 8% offset
+    
+    All OSRM requests are started at once (the 8% round speculatively when
+    PATH_SEARCH_SPECULATIVE_OFFSETS is set) so latency is roughly that of
+    the slowest call. Results are deduplicated in the original priority
+    order as soon as each one is available, which keeps the candidate list
+    deterministic. Unneeded requests are cancelled.
+    
+    Returns an empty list if the direct route cannot be fetched.
+    """
+    def start_via(offset_fraction: float) -> List[asyncio.Task]:
+        waypoints = calculate_perpendicular_waypoints(
+            origin_lat, origin_lon,
+            dest_lat, dest_lon,
+            offset_fraction=offset_fraction,
+        )
+        return [
+            asyncio.create_task(fetch_osrm_route_via_waypoint(
+                origin_lat, origin_lon,
+                wp_lat, wp_lon,
+                dest_lat, dest_lon,
+                profile="bike"
+            ))
+            for wp_lat, wp_lon in waypoints
+        ]
+    
+    direct_task = asyncio.create_task(fetch_osrm_route(
+        origin_lat, origin_lon,
+        dest_lat, dest_lon,
+        profile="bike",
+        alternatives=True
+    ))
+    primary = start_via(0.15)
+    secondary = start_via(0.08) if PATH_SEARCH_SPECULATIVE_OFFSETS else []
+    candidates: List[Dict[str, Any]] = []
+    try:
+        osrm_data = await direct_task
+        if not osrm_data or not osrm_data.get("routes"):
+            return []
+        
+        for route in osrm_data["routes"][:2]:  # Take max 2 from OSRM's alternatives
+            candidates.append({
+                "coords": route["geometry"]["coordinates"],
+                "distance_m": route["distance"],
+                "duration_s": route["duration"],
+                "source": "osrm_direct",
+                "engine": osrm_data.get("engine", "osrm"),
+            })
+        
+        for task in primary:
+            candidate = _via_candidate(await task)
+            # Validation: Check if this route is actually different from existing candidates
+            if candidate and not is_duplicate_route(candidate["coords"], candidate["distance_m"], candidates):
+                candidates.append(candidate)
+        
+        # If we still have less than 2 candidates, try with a smaller offset
+        if len(candidates) < 2:
+            if not secondary:
+                secondary = start_via(0.08)
+            for task in secondary:
+                if len(candidates) >= 3:
+                    break
+                candidate = _via_candidate(await task)
+                if candidate and not is_duplicate_route(candidate["coords"], candidate["distance_m"], candidates):
+                    candidates.append(candidate)
+        return candidates
+    finally:
+        for task in [direct_task, *primary, *secondary]:
+            if not task.done():
+                task.cancel()
+
+
+async def generate_penalized_candidates(
+    origin_lat: float, origin_lon: float,
+    dest_lat: float, dest_lon: float,
+    preferences: str,
+) -> List[Dict[str, Any]]:
+    """
+    Candidate generation on the local road graph with segment-penalized costs.
+    
+    One search per preference profile, the requested preference first, plus
+    the plain shortest path; each search already avoids bad segments as
+    much as its profile asks, so no waypoint detours are needed.
+    Duplicates are dropped in that order and at most 3 candidates are kept.
+    
+    Returns an empty list if the local graph has no route.
+    """
+    points = [(origin_lat, origin_lon), (dest_lat, dest_lon)]
+    order: List[Optional[str]] = [preferences]
+    order += [p for p in ROUTE_PENALTY_PROFILES if p != preferences]
+    order.append(None)
+    results = await asyncio.gather(*(
+        LOCAL_ROUTER.route(points, profile="bike", preference=p) for p in order
+    ))
+    candidates: List[Dict[str, Any]] = []
+    for pref, data in zip(order, results):
+        if not data or len(candidates) >= 3:
+            continue
+        route = data["routes"][0]
+        coords = route["geometry"]["coordinates"]
+        if is_duplicate_route(coords, route["distance"], candidates):
+            continue
+        candidates.append({
+            "coords": coords,
+            "distance_m": route["distance"],
+            "duration_s": route["duration"],
+            "source": "local_penalized" if pref else "local_direct",
+        })
+    return candidates
+
+
 @app.post("/api/path/search")
-def path_search(
+async def path_search(
     req: PathSearchRequest,
     user_id: Optional[int] = Query(default=None)
 ):
@@ -1873,6 +2843,8 @@ def path_search(
        - Candidate 1: Direct route (Origin -> Dest)
        - Candidate 2-3: Routes via perpendicular waypoints for diversity
        - Validate routes are actually different (not 99% identical)
+       - With a local road graph loaded: one segment-penalized search per
+         preference instead (see generate_penalized_candidates)
     
     2. Scoring & Ranking: Grade each candidate against local pothole/segment data
        - safety_first: Sort by road_quality_score descending (best surface first)
@@ -1887,112 +2859,106 @@ def path_search(
     Returns 1-3 candidate routes sorted by preference.
     Includes weather information and localized labels.
     """
-    origin = req.origin
-    dest = req.destination
-    preferences = req.preferences
-    lang = get_user_language(user_id)
-    
-    candidates = []
-    route_source = "osrm"
+    return await run_path_search(
+        req.origin, req.destination, req.preferences, get_user_language(user_id)
+    )
+
+
+async def get_candidate_set(
+    origin: Coordinate,
+    dest: Coordinate,
+    preferences: str,
+) -> Optional[Dict[str, Any]]:
+    """
+    Phase 1 of path_search plus the preference-independent half of phase 2.
+    
+    Returns {"route_source", "candidates", "components"} where "components"
+    collects route_penalty_components by candidate index as
+    evaluate_candidates computes them, or None when no real route could be
+    fetched (callers fall back).
+    Results are kept in CANDIDATE_SET_CACHE for the current SEGMENTS_VERSION;
+    OSRM candidates do not depend on the preference, so a preference switch
+    reuses them (penalized local candidates do, and are keyed by it).
+    """
+    penalized = (
+        PATH_SEARCH_PENALIZED_ROUTING and LOCAL_ROUTER is not None and LOCAL_ROUTER.penalties is not None
+    )
+    key = (
+        origin.lat, origin.lon, dest.lat, dest.lon,
+        preferences if penalized else None, SEGMENTS_VERSION,
+    )
+    cached = CANDIDATE_SET_CACHE.get(key)
+    if cached is not None:
+        return cached
     
     # ====== PHASE 1: CANDIDATE GENERATION ======
     
-    # Candidate 1: Direct route from OSRM (may include OSRM's own alternatives)
-    osrm_data = fetch_osrm_route(
-        origin.lat, origin.lon,
-        dest.lat, dest.lon,
-        profile="bike",
-        alternatives=True
-    )
-    
-    if osrm_data and osrm_data.get("routes"):
-        # Add direct route(s) from OSRM
-        for route in osrm_data["routes"][:2]:  # Take max 2 from OSRM's alternatives
-            coords = route["geometry"]["coordinates"]
-            distance_m = route["distance"]
-            duration_s = route["duration"]
-            candidates.append({
-                "coords": coords,
-                "distance_m": distance_m,
-                "duration_s": duration_s,
-                "source": "osrm_direct",
-            })
-        
-        # Candidates 2-3: Routes via perpendicular waypoints for diversity
-        waypoints = calculate_perpendicular_waypoints(
-            origin.lat, origin.lon,
-            dest.lat, dest.lon,
-            offset_fraction=0.15  # 15% of direct distance
+    # Penalized local searches when a road graph is loaded; otherwise the direct
+    # route plus perpendicular-waypoint detours, fetched concurrently
+    route_source = "osrm"
+    candidates = []
+    if penalized:
+        candidates = await generate_penalized_candidates(
+            origin.lat, origin.lon, dest.lat, dest.lon, preferences
         )
-        
-        for wp_lat, wp_lon in waypoints:
-            via_data = fetch_osrm_route_via_waypoint(
-                origin.lat, origin.lon,
-                wp_lat, wp_lon,
-                dest.lat, dest.lon,
-                profile="bike"
-            )
-            if via_data and via_data.get("routes"):
-                route = via_data["routes"][0]
-                coords = route["geometry"]["coordinates"]
-                distance_m = route["distance"]
-                duration_s = route["duration"]
-                
-                # Validation: Check if this route is actually different from existing candidates
-                is_duplicate = False
-                for existing in candidates:
-                    if routes_are_similar(
-                        coords, existing["coords"],
-                        distance_m, existing["distance_m"]
-                    ):
-                        is_duplicate = True
-                        break
-                
-                if not is_duplicate:
-                    candidates.append({
-                        "coords": coords,
-                        "distance_m": distance_m,
-                        "duration_s": duration_s,
-                        "source": "osrm_via_waypoint",
-                    })
-        
-        # If we still have less than 2 candidates, try with different offset
-        if len(candidates) < 2:
-            waypoints_small = calculate_perpendicular_waypoints(
-                origin.lat, origin.lon,
-                dest.lat, dest.lon,
-                offset_fraction=0.08  # Smaller offset
-            )
-            for wp_lat, wp_lon in waypoints_small:
-                if len(candidates) >= 3:
-                    break
-                via_data = fetch_osrm_route_via_waypoint(
-                    origin.lat, origin.lon,
-                    wp_lat, wp_lon,
-                    dest.lat, dest.lon,
-                    profile="bike"
-                )
-                if via_data and via_data.get("routes"):
-                    route = via_data["routes"][0]
-                    coords = route["geometry"]["coordinates"]
-                    distance_m = route["distance"]
-                    
-                    is_duplicate = False
-                    for existing in candidates:
-                        if routes_are_similar(coords, existing["coords"], distance_m, existing["distance_m"]):
-                            is_duplicate = True
-                            break
-                    
-                    if not is_duplicate:
-                        candidates.append({
-                            "coords": coords,
-                            "distance_m": distance_m,
-                            "duration_s": route["duration"],
-                            "source": "osrm_via_waypoint",
-                        })
+        if candidates:
+            route_source = "local"
+    if not candidates:
+        with latency_budget(OSRM_REQUEST_BUDGET_S):
+            candidates = await generate_osrm_candidates(origin.lat, origin.lon, dest.lat, dest.lon)
+        if candidates:
+            # Degraded mode: the direct route may come from the local graph or road skeleton
+            route_source = candidates[0].get("engine", "osrm")
+    if not candidates:
+        return None
+    
+    candidate_set = {"route_source": route_source, "candidates": candidates, "components": {}}
+    if route_source not in UNCACHED_ROUTE_SOURCES:
+        CANDIDATE_SET_CACHE.set(key, candidate_set)
+    return candidate_set
+
+
+async def run_path_search(
+    origin: Coordinate,
+    dest: Coordinate,
+    preferences: str,
+    lang: str,
+    weather_cache: Optional[Dict[Tuple[float, float, str], Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Body of path_search, shared with path_search_batch.
+    weather_cache: optional dict reused across calls so a batch looks up the
+    weather for each (midpoint, language) only once.
+    
+    Responses are served from PATH_SEARCH_CACHE while the segment set
+    (SEGMENTS_VERSION) and the weather hour are unchanged. Fallback and
+    road-skeleton responses are not cached, so OSRM recovering is picked up
+    immediately.
+    Cached responses are shared: callers must treat them as read-only.
+    """
+    key = (
+        origin.lat, origin.lon, dest.lat, dest.lon, preferences, lang,
+        SEGMENTS_VERSION, datetime.utcnow().strftime("%Y-%m-%d %H"),
+    )
+    response = PATH_SEARCH_CACHE.get(key)
+    if response is None:
+        response = await _compute_path_search(origin, dest, preferences, lang, weather_cache)
+        if response["route_source"] not in UNCACHED_ROUTE_SOURCES:
+            PATH_SEARCH_CACHE.set(key, response)
+    return response
+
+
+async def _compute_path_search(
+    origin: Coordinate,
+    dest: Coordinate,
+    preferences: str,
+    lang: str,
+    weather_cache: Optional[Dict[Tuple[float, float, str], Dict[str, Any]]],
+) -> Dict[str, Any]:
+    candidate_set = await get_candidate_set(origin, dest, preferences)
     
     # Fallback to math-based routes if OSRM fails
-    if not candidates:
+    if candidate_set is None:
         route_source = "fallback"
         candidates = _generate_fallback_routes(
             origin.lat, origin.lon,
@@ -2003,18 +2969,22 @@ def path_search(
         # Jump directly to response building
         candidates_scored = candidates
     else:
+        route_source = candidate_set["route_source"]
+        candidates = candidate_set["candidates"]
+        
         # ====== PHASE 2: SCORING & RANKING ======
         candidates_scored = []
         
-        for candidate in candidates[:3]:  # Max 3 candidates
+        # Exact corridor match only for candidates that can still make the top ranks
+        shortlist = shortlist_candidates(candidates, preferences)
+        for candidate in evaluate_candidates(candidate_set, shortlist):
             coords = candidate["coords"]
             distance_m = candidate["distance_m"]
             duration_s = candidate["duration_s"]
             
-            # Find segments near this route and calculate score
-            nearby_segs = find_segments_near_route(coords)
-            score, quality_score, pothole_count, bad_road_len, base_tags, warnings = calculate_route_score(
-                distance_m, nearby_segs, preferences
+            # Score the precomputed penalty components for this preference
+            score, quality_score, pothole_count, bad_road_len, base_tags, warnings = score_route_components(
+                distance_m, candidate["components"], preferences
             )
             
             candidates_scored.append({
@@ -2040,6 +3010,12 @@ def path_search(
         else:  # balanced
             # Sort by weighted score ASCENDING (lower score = better)
             candidates_scored.sort(key=lambda x: x["score"])
+        
+        # Keep the top PATH_SEARCH_MAX_SCORED, always including the shortest route
+        shortest = min(candidates_scored, key=lambda x: x["distance_m"])
+        candidates_scored = candidates_scored[:PATH_SEARCH_MAX_SCORED]
+        if all(c is not shortest for c in candidates_scored):
+            candidates_scored[-1] = shortest
     
     # ====== PHASE 3: TAGGING (After Ranking) ======
     
@@ -2081,7 +3057,12 @@ def path_search(
     # Get weather for the route
     mid_lat = (origin.lat + dest.lat) / 2
     mid_lon = (origin.lon + dest.lon) / 2
-    weather = WeatherService.get_weather(mid_lat, mid_lon, lang)
+    weather_key = (mid_lat, mid_lon, lang)
+    weather = weather_cache.get(weather_key) if weather_cache is not None else None
+    if weather is None:
+        weather = WeatherService.get_weather(mid_lat, mid_lon, lang)
+        if weather_cache is not None:
+            weather_cache[weather_key] = weather
     weather_summary = weather["summary"]
     cycling_recommendation = WeatherService.get_cycling_recommendation(weather, lang)
     
@@ -2138,6 +3119,71 @@ def _format_duration(seconds: float) -> str:
     return f"{hours} hr {mins} min"
 
 
+BATCH_MAX_PAIRS = 500  # Searches accepted per batch request
+BATCH_MAX_CONCURRENCY = 8  # Searches of one batch running at the same time
+
+
+@app.post("/api/path/search/batch")
+async def path_search_batch(
+    req: BatchPathSearchRequest,
+    user_id: Optional[int] = Query(default=None)
+):
+    """
+    Run path_search for many origin/destination pairs, streamed as NDJSON.
+    
+    - Identical searches (same origin, destination and preferences) are
+      computed once and reported for every index that asked for them
+    - At most BATCH_MAX_CONCURRENCY searches run at a time; their OSRM calls
+      share the route caches and in-flight coalescing, so pairs with the same
+      endpoints but different preferences cost one set of upstream requests
+    - Weather is looked up once per route midpoint for the whole batch
+    
+    Each line is {"index": i, "result": <path_search response>} or
+    {"index": i, "error": "..."}, written as soon as that search finishes
+    (not in request order). A final {"done": true, ...} line closes the stream.
+    """
+    if not req.searches:
+        raise HTTPException(status_code=400, detail="searches must not be empty")
+    if len(req.searches) > BATCH_MAX_PAIRS:
+        raise HTTPException(status_code=400, detail=f"at most {BATCH_MAX_PAIRS} searches per batch")
+    lang = get_user_language(user_id)
+    
+    groups: Dict[Tuple[float, float, float, float, str], List[int]] = {}
+    for idx, item in enumerate(req.searches):
+        key = (item.origin.lat, item.origin.lon, item.destination.lat, item.destination.lon, item.preferences)
+        groups.setdefault(key, []).append(idx)
+    
+    weather_cache: Dict[Tuple[float, float, str], Dict[str, Any]] = {}
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def solve(indices: List[int]) -> Tuple[List[int], Optional[Dict[str, Any]], Optional[str]]:
+        item = req.searches[indices[0]]
+        async with semaphore:
+            try:
+                result = await run_path_search(
+                    item.origin, item.destination, item.preferences, lang, weather_cache
+                )
+            except Exception as exc:  # one bad pair must not abort the whole stream
+                return indices, None, str(exc) or type(exc).__name__
+        return indices, result, None
+    
+    async def stream():
+        tasks = [asyncio.create_task(solve(indices)) for indices in groups.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indices, result, error = await next_done
+                for idx in indices:
+                    line = {"index": idx, "result": result} if error is None else {"index": idx, "error": error}
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "searches": len(req.searches), "unique": len(groups)}) + "\n"
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 # ---- Initialize demo data on startup ----
 # This is called at module level after all classes are defined
 seed_demo_data()
@@ -0,0 +1,102 @@
+"""
+Keyword classification of report notes.
+
+A note is negative if it contains any negative keyword, else positive if it
+contains any positive keyword, else neutral (case-insensitive). Each keyword
+set is compiled into one regular expression, so a note is scanned once per
+set instead of once per keyword, and the matched terms come out of the same
+pass.
+
+Keywords match as substrings by default (English stems such as "hole" also
+count inside "pothole", as they always have). With whole_words=True a
+keyword only matches a complete word, which keeps another language's
+keywords from firing inside English words ("rotto" in "grotto").
+NoteClassifierSet applies one classifier per language to the same note.
+
+`version` is a digest of the keyword sets and matching modes: stored
+classifications made with another version are stale and should be
+recomputed.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+from report_index import NOTE_NEGATIVE, NOTE_NEUTRAL, NOTE_POSITIVE
+
+
+def _compile(keywords: List[str], whole_words: bool = False) -> Optional[Pattern[str]]:
+    if not keywords:
+        return None
+    # Longest first, so findall reports "pothole" rather than "hole"
+    ordered = sorted(set(keywords), key=lambda kw: (-len(kw), kw))
+    alternation = "|".join(re.escape(kw) for kw in ordered)
+    return re.compile(rf"\b(?:{alternation})\b" if whole_words else alternation)
+
+
+class NoteClassifier:
+    """Compiled negative / positive keyword matcher for one language."""
+
+    def __init__(self, negative: Iterable[str], positive: Iterable[str], whole_words: bool = False):
+        self.negative = [kw.lower() for kw in negative if kw]
+        self.positive = [kw.lower() for kw in positive if kw]
+        self.whole_words = whole_words
+        self._negative = _compile(self.negative, whole_words)
+        self._positive = _compile(self.positive, whole_words)
+        digest = hashlib.sha1(b"w" if whole_words else b"s")
+        for kw in sorted(set(self.negative)):
+            digest.update(b"-" + kw.encode("utf-8") + b"\0")
+        for kw in sorted(set(self.positive)):
+            digest.update(b"+" + kw.encode("utf-8") + b"\0")
+        self.version = digest.hexdigest()[:12]
+
+    def matches(self, text: str) -> Tuple[List[str], List[str]]:
+        """Negative and positive terms found in already lowercased text."""
+        negative = self._negative.findall(text) if self._negative else []
+        positive = self._positive.findall(text) if self._positive else []
+        return negative, positive
+
+    def classify(self, note: Optional[str]) -> Tuple[int, List[str]]:
+        """(NOTE_NEGATIVE / NOTE_POSITIVE / NOTE_NEUTRAL, matched negative then positive terms)."""
+        text = (note or "").lower()
+        if not text:
+            return NOTE_NEUTRAL, []
+        return _result(*self.matches(text))
+
+
+class NoteClassifierSet:
+    """
+    Per-language NoteClassifiers applied to the same note: a negative term
+    in any language makes the note negative, else a positive term makes it
+    positive. Each language keeps its own matching mode.
+    """
+
+    def __init__(self, classifiers: Dict[str, NoteClassifier]):
+        self.classifiers = dict(classifiers)
+        digest = hashlib.sha1()
+        for lang in sorted(self.classifiers):
+            digest.update(lang.encode("utf-8") + b"=" + self.classifiers[lang].version.encode("ascii") + b"\0")
+        self.version = digest.hexdigest()[:12]
+
+    def classify(self, note: Optional[str]) -> Tuple[int, List[str]]:
+        """Same result shape as NoteClassifier.classify."""
+        text = (note or "").lower()
+        if not text:
+            return NOTE_NEUTRAL, []
+        negative: List[str] = []
+        positive: List[str] = []
+        for classifier in self.classifiers.values():
+            neg, pos = classifier.matches(text)
+            negative.extend(neg)
+            positive.extend(pos)
+        return _result(negative, positive)
+
+
+def _result(negative: List[str], positive: List[str]) -> Tuple[int, List[str]]:
+    terms = list(dict.fromkeys(negative + positive))
+    if negative:
+        return NOTE_NEGATIVE, terms
+    if positive:
+        return NOTE_POSITIVE, terms
+    return NOTE_NEUTRAL, terms
@@ -0,0 +1,329 @@
+"""
+Pooled HTTP client for the OSRM route service.
+
+One long-lived httpx.AsyncClient is shared by every request so connections
+are kept alive between calls instead of paying a TCP/TLS handshake per
+route. HTTP/2 is enabled automatically when the optional `h2` package is
+installed (it only applies to https:// OSRM servers).
+
+A CircuitBreaker in front of the client fails fast while OSRM is down, and
+each call's timeout is capped by the caller's remaining latency budget
+(see latency_budget), so degraded mode is quick instead of slow.
+"""
+from __future__ import annotations
+
+import contextlib
+import importlib.util
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+LatLon = Tuple[float, float]
+
+# Absolute time.monotonic() deadline of the current request, if any.
+# Context variables are copied into asyncio tasks, so concurrent OSRM calls
+# started by one request share its deadline.
+_REQUEST_DEADLINE: ContextVar[Optional[float]] = ContextVar("osrm_request_deadline", default=None)
+
+
+@contextlib.contextmanager
+def latency_budget(seconds: float) -> Iterator[None]:
+    """Limit all OSRM calls made inside the block to `seconds` in total."""
+    token = _REQUEST_DEADLINE.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _REQUEST_DEADLINE.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current latency budget, or None if unbounded."""
+    deadline = _REQUEST_DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker.
+
+    - closed: calls go through; the outcome of the last `window` calls is
+      kept, and once at least `min_calls` are recorded and the failure
+      share reaches `failure_rate`, the breaker opens.
+    - open: calls are rejected immediately for `open_s` seconds.
+    - half_open: up to `half_open_max_calls` probe calls are let through;
+      a success closes the breaker, a failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        open_s: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_s = open_s
+        self.half_open_max_calls = half_open_max_calls
+        self._outcomes: Deque[bool] = deque(maxlen=window)  # True = failure
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_s:
+            self._state = self.HALF_OPEN
+            self._probes_in_flight = 0
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    def allow(self) -> bool:
+        """Whether a call may proceed. Every allowed call must be followed by record()."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if success:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            if self._state == self.OPEN:
+                return  # late result of a call started before the breaker opened
+            self._outcomes.append(not success)
+            failures = sum(self._outcomes)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def release(self) -> None:
+        """Give back an allowed call that ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._outcomes)
+            failures = sum(self._outcomes)
+            return {
+                "state": self._state,
+                "window_calls": calls,
+                "window_failures": failures,
+                "failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+                "open_s": self.open_s,
+            }
+
+
+def http2_available() -> bool:
+    """True if httpx can negotiate HTTP/2 (requires the `h2` package)."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_route_url(
+    base_url: str,
+    profile: str,
+    points: List[LatLon],
+    alternatives: bool = False,
+) -> str:
+    """OSRM /route URL for a list of (lat, lon) points (origin, waypoints..., destination)."""
+    coord_str = ";".join(f"{lon},{lat}" for lat, lon in points)
+    alt_param = "true" if alternatives else "false"
+    return (
+        f"{base_url}/route/v1/{profile}/{coord_str}"
+        f"?overview=full&geometries=geojson&alternatives={alt_param}&steps=true"
+    )
+
+
+def build_table_url(base_url: str, profile: str, points: List[LatLon]) -> str:
+    """OSRM /table URL for the full distance/duration matrix between (lat, lon) points."""
+    coord_str = ";".join(f"{lon},{lat}" for lat, lon in points)
+    return f"{base_url}/table/v1/{profile}/{coord_str}?annotations=distance,duration"
+
+
+class OSRMClient:
+    """
+    Shared async OSRM client with a bounded keep-alive connection pool.
+
+    start()/aclose() are wired to the app lifespan; get_client() also
+    creates the pool lazily so the client works outside the app (scripts,
+    tests) too.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: Optional[bool] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        budget_timeout_share: float = 0.5,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # A timeout counts as a breaker failure when the call got at least
+        # this share of its own timeout; shorter budget cuts are not OSRM's fault
+        self.budget_timeout_share = budget_timeout_share
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2_available() if http2 is None else http2
+        self.breaker = breaker
+        self._client: Optional[httpx.AsyncClient] = None
+        self.calls = 0
+        self.failures = 0
+        self.budget_skips = 0
+        self.budget_timeouts = 0
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+            )
+        return self._client
+
+    async def start(self) -> None:
+        self.get_client()
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def route(
+        self,
+        points: List[LatLon],
+        profile: str = "bike",
+        alternatives: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a route through the given (lat, lon) points.
+        Returns the OSRM response if it contains at least one route, else None.
+
+        Returns None without a network call when the circuit breaker is
+        open or the current latency budget is exhausted. Transport errors,
+        timeouts and non-2xx responses count as breaker failures; a valid
+        OSRM answer without a route (e.g. NoRoute) does not, and neither does
+        a timeout after the caller's budget cut the call to less than
+        budget_timeout_share of its timeout.
+        """
+        url = build_route_url(self.base_url, profile, points, alternatives)
+        data = await self._get_json(url, timeout)
+        if data is not None and data.get("code") == "Ok" and data.get("routes"):
+            return data
+        return None
+
+    async def table(
+        self,
+        points: List[LatLon],
+        profile: str = "bike",
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the distance/duration matrix between all (lat, lon) points.
+        Returns the OSRM response if it contains "distances", else None.
+        Same breaker and budget handling as route().
+        """
+        url = build_table_url(self.base_url, profile, points)
+        data = await self._get_json(url, timeout)
+        if data is not None and data.get("code") == "Ok" and data.get("distances"):
+            return data
+        return None
+
+    async def _get_json(self, url: str, timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+        """GET url through the breaker and latency budget; parsed JSON body or None."""
+        call_timeout = self.timeout if timeout is None else timeout
+        left = remaining_budget()
+        # A call the budget cut well short of its own timeout says nothing about OSRM's health
+        budget_capped = left is not None and left < call_timeout * self.budget_timeout_share
+        if left is not None:
+            if left <= 0:
+                self.budget_skips += 1
+                return None
+            call_timeout = min(call_timeout, left)
+        if self.breaker is not None and not self.breaker.allow():
+            return None
+
+        self.calls += 1
+        try:
+            resp = await self.get_client().get(url, timeout=call_timeout)
+            resp.raise_for_status()
+            data = resp.json()
+        except httpx.TimeoutException:
+            if budget_capped:
+                self.budget_timeouts += 1
+                if self.breaker is not None:
+                    self.breaker.release()
+                return None
+            self.failures += 1
+            if self.breaker is not None:
+                self.breaker.record(False)
+            return None
+        except Exception:
+            self.failures += 1
+            if self.breaker is not None:
+                self.breaker.record(False)
+            return None
+        except BaseException:
+            # Cancelled: no outcome to record, but free a half-open probe slot
+            if self.breaker is not None:
+                self.breaker.release()
+            raise
+        if self.breaker is not None:
+            self.breaker.record(True)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "budget_skips": self.budget_skips,
+            "budget_timeouts": self.budget_timeouts,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+        }
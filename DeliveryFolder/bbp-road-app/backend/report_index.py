@@ -0,0 +1,453 @@
+"""
+Per-segment index of road reports with running aggregation totals.
+
+Report weights depend on two flags (fresh, confirmed) and the note class
+(negative / positive / neutral), so a segment's weighted vote is fully
+described by how many of its reports fall in each of the 2 x 2 x 3
+combinations. SegmentReportIndex keeps those counts per segment, updated
+in O(1) when a report is added or confirmed. Reports leave the fresh
+window over time; a heap ordered by the moment each report stops being
+fresh moves them to the stale counts lazily, each report exactly once.
+
+Timestamps are seconds since the Unix epoch of naive UTC datetimes
+(utc_timestamp), matching datetime.utcnow() used for report creation;
+timezone-aware datetimes are converted to UTC.
+
+With decay_half_life_s set, the index also keeps, per segment and
+(confirmed, note class), the sum of exp(-rate * age) over its reports: an
+exponentially decayed freshness that changes smoothly instead of at the
+window edge. Each segment's sums are stored as of a reference time and
+rescaled lazily (one multiplication) when they are next read or updated,
+so the cost does not depend on how many reports a segment has.
+
+The same counts can be built for many reports at once from NumPy columns
+(vote_counts_from_columns, a group-by over segment and slot), and
+vote_totals turns a (segments x slots) count matrix into weighted sums with
+exactly the arithmetic of SegmentReportIndex.totals, so bulk and
+per-segment aggregation agree bit for bit.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+# Note classes
+NOTE_NEGATIVE = 0
+NOTE_POSITIVE = 1
+NOTE_NEUTRAL = 2
+NOTE_CLASSES = 3
+NOTE_CLASS_NAMES = ("negative", "positive", "neutral")
+SLOTS = 4 * NOTE_CLASSES  # (fresh, confirmed) x note class
+DECAY_SLOTS = 2 * NOTE_CLASSES  # confirmed x note class
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def utc_timestamp(dt: datetime) -> float:
+    """Epoch seconds of a naive UTC datetime (aware datetimes are converted to UTC first)."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH).total_seconds()
+
+
+def _slot(fresh: bool, confirmed: bool, note_class: int) -> int:
+    return (int(fresh) * 2 + int(confirmed)) * NOTE_CLASSES + note_class
+
+
+def _slot_weight(fresh: bool, confirmed: bool, fresh_weight: float, confirmed_weight: float) -> float:
+    weight = 1.0
+    if fresh:
+        weight *= fresh_weight
+    if confirmed:
+        weight *= confirmed_weight
+    return weight
+
+
+def slot_columns(
+    created_ts: np.ndarray,
+    confirmed: np.ndarray,
+    note_class: np.ndarray,
+    now: float,
+    fresh_window_s: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(fresh flags, slot numbers) for report columns; NaN created_ts is never fresh."""
+    fresh = now < np.asarray(created_ts, dtype=np.float64) + fresh_window_s
+    slots = (fresh.astype(np.int64) * 2 + np.asarray(confirmed, dtype=np.int64)) * NOTE_CLASSES
+    slots += np.asarray(note_class, dtype=np.int64)
+    return fresh, slots
+
+
+def vote_counts_from_columns(
+    segment_ids: np.ndarray,
+    created_ts: np.ndarray,
+    confirmed: np.ndarray,
+    note_class: np.ndarray,
+    now: float,
+    fresh_window_s: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Group-by of report columns into (segments, counts): the sorted unique
+    segment ids and a (len(segments), SLOTS) int64 count matrix.
+    """
+    _, slots = slot_columns(created_ts, confirmed, note_class, now, fresh_window_s)
+    segments, inverse = np.unique(np.asarray(segment_ids, dtype=np.int64), return_inverse=True)
+    flat = np.bincount(inverse.reshape(-1) * SLOTS + slots, minlength=len(segments) * SLOTS)
+    return segments, flat.reshape(len(segments), SLOTS)
+
+
+def vote_totals(
+    counts: np.ndarray,
+    fresh_weight: float,
+    confirmed_weight: float,
+    neutral_negative_share: float = 0.3,
+) -> Dict[str, np.ndarray]:
+    """Column-wise SegmentReportIndex.totals for a (segments x SLOTS) count matrix."""
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1, SLOTS)
+    k = counts.shape[0]
+    out = {
+        "reports_total": counts.sum(axis=1),
+        "reports_confirmed": np.zeros(k, dtype=np.int64),
+        "reports_fresh": np.zeros(k, dtype=np.int64),
+        "total_weight": np.zeros(k),
+        "negative_weight": np.zeros(k),
+        "positive_weight": np.zeros(k),
+    }
+    # Same slot order and operations as the scalar loop (adding 0.0 is exact)
+    for fresh in (False, True):
+        for confirmed in (False, True):
+            weight = _slot_weight(fresh, confirmed, fresh_weight, confirmed_weight)
+            for note_class in range(NOTE_CLASSES):
+                n = counts[:, _slot(fresh, confirmed, note_class)]
+                if confirmed:
+                    out["reports_confirmed"] += n
+                if fresh:
+                    out["reports_fresh"] += n
+                out["total_weight"] += n * weight
+                if note_class == NOTE_NEGATIVE:
+                    out["negative_weight"] += n * weight
+                elif note_class == NOTE_POSITIVE:
+                    out["positive_weight"] += n * weight
+                else:
+                    out["negative_weight"] += n * weight * neutral_negative_share
+                    out["positive_weight"] += n * weight * (1 - neutral_negative_share)
+    return out
+
+
+def decayed_vote_totals(
+    counts: np.ndarray,
+    decayed: np.ndarray,
+    fresh_weight: float,
+    confirmed_weight: float,
+    neutral_negative_share: float = 0.3,
+) -> Dict[str, np.ndarray]:
+    """
+    vote_totals with exponentially decayed freshness: a report weighs
+    (1 + (fresh_weight - 1) * decay), times confirmed_weight if confirmed,
+    where decay = exp(-rate * age) goes from 1 (new) towards 0 (old).
+    decayed: (segments x DECAY_SLOTS) sums of decay per (confirmed, note class).
+    """
+    counts = np.asarray(counts, dtype=np.int64).reshape(-1, SLOTS)
+    decayed = np.asarray(decayed, dtype=np.float64).reshape(-1, DECAY_SLOTS)
+    out = vote_totals(counts, fresh_weight, confirmed_weight, neutral_negative_share)
+    k = counts.shape[0]
+    out["total_weight"] = np.zeros(k)
+    out["negative_weight"] = np.zeros(k)
+    out["positive_weight"] = np.zeros(k)
+    for confirmed in (False, True):
+        for note_class in range(NOTE_CLASSES):
+            n = counts[:, _slot(False, confirmed, note_class)] + counts[:, _slot(True, confirmed, note_class)]
+            weight = n + (fresh_weight - 1.0) * decayed[:, int(confirmed) * NOTE_CLASSES + note_class]
+            if confirmed:
+                weight = weight * confirmed_weight
+            out["total_weight"] += weight
+            if note_class == NOTE_NEGATIVE:
+                out["negative_weight"] += weight
+            elif note_class == NOTE_POSITIVE:
+                out["positive_weight"] += weight
+            else:
+                out["negative_weight"] += weight * neutral_negative_share
+                out["positive_weight"] += weight * (1 - neutral_negative_share)
+    return out
+
+
+class SegmentReportIndex:
+    """
+    segment_id -> report ids, plus per-segment report counts by
+    (fresh, confirmed, note class).
+
+    fresh_window_s: a report counts as fresh while now < created + fresh_window_s
+    decay_half_life_s: also keep exponentially decayed sums with this half-life
+    """
+
+    def __init__(self, fresh_window_s: float, decay_half_life_s: Optional[float] = None):
+        self.fresh_window_s = fresh_window_s
+        self.decay_rate = math.log(2) / decay_half_life_s if decay_half_life_s else None
+        self._ids: Dict[int, List[int]] = {}
+        self._counts: Dict[int, List[int]] = {}
+        # segment_id -> [reference time, DECAY_SLOTS sums as of that time]
+        self._decayed: Dict[int, List] = {}
+        # report_id -> [segment_id, note_class, confirmed, fresh, created_ts]
+        self._reports: Dict[int, List] = {}
+        self._expiry: List[Tuple[float, int]] = []
+        self._expired_segments: Set[int] = set()
+        self.confirmed_total = 0
+
+    def __len__(self) -> int:
+        return len(self._reports)
+
+    def clear(self) -> None:
+        self._ids.clear()
+        self._counts.clear()
+        self._decayed.clear()
+        self._reports.clear()
+        self._expiry.clear()
+        self._expired_segments.clear()
+        self.confirmed_total = 0
+
+    def add(
+        self,
+        report_id: int,
+        segment_id: int,
+        created_ts: Optional[float],
+        confirmed: bool,
+        note_class: int,
+        now: float,
+    ) -> None:
+        """Index a new report. created_ts None (unknown date) means never fresh."""
+        fresh = created_ts is not None and now < created_ts + self.fresh_window_s
+        self._ids.setdefault(segment_id, []).append(report_id)
+        counts = self._counts.setdefault(segment_id, [0] * SLOTS)
+        counts[_slot(fresh, confirmed, note_class)] += 1
+        self._reports[report_id] = [segment_id, note_class, confirmed, fresh, created_ts]
+        self._add_decayed(segment_id, confirmed, note_class, created_ts, now, 1.0)
+        if fresh:
+            heapq.heappush(self._expiry, (created_ts + self.fresh_window_s, report_id))
+        if confirmed:
+            self.confirmed_total += 1
+
+    def _decay(self, created_ts: Optional[float], now: float) -> float:
+        if created_ts is None or created_ts != created_ts:  # unknown date: fully decayed
+            return 0.0
+        return math.exp(-self.decay_rate * max(0.0, now - created_ts))
+
+    def _rescaled(self, segment_id: int, now: float) -> List:
+        """The segment's decayed sums, brought forward to now."""
+        entry = self._decayed.get(segment_id)
+        if entry is None:
+            entry = self._decayed[segment_id] = [now, [0.0] * DECAY_SLOTS]
+        elif now > entry[0]:
+            factor = math.exp(-self.decay_rate * (now - entry[0]))
+            entry[1] = [value * factor for value in entry[1]]
+            entry[0] = now
+        return entry
+
+    def _add_decayed(
+        self, segment_id: int, confirmed: bool, note_class: int,
+        created_ts: Optional[float], now: float, sign: float,
+    ) -> None:
+        if self.decay_rate is None:
+            return
+        entry = self._rescaled(segment_id, now)
+        # Contribution as of the entry's reference time (not earlier than now)
+        entry[1][int(confirmed) * NOTE_CLASSES + note_class] += sign * self._decay(created_ts, entry[0])
+
+    def add_many(
+        self,
+        report_ids: Sequence[int],
+        segment_ids: np.ndarray,
+        created_ts: np.ndarray,
+        confirmed: np.ndarray,
+        note_class: np.ndarray,
+        now: float,
+    ) -> None:
+        """add() for whole columns at once (bulk imports); created_ts NaN means unknown."""
+        report_ids = np.asarray(report_ids, dtype=np.int64)
+        segment_ids = np.asarray(segment_ids, dtype=np.int64)
+        created_ts = np.asarray(created_ts, dtype=np.float64)
+        confirmed = np.asarray(confirmed, dtype=bool)
+        note_class = np.asarray(note_class, dtype=np.int64)
+        if report_ids.size == 0:
+            return
+        fresh, slots = slot_columns(created_ts, confirmed, note_class, now, self.fresh_window_s)
+
+        segments, inverse = np.unique(segment_ids, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        flat = np.bincount(inverse * SLOTS + slots, minlength=len(segments) * SLOTS)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(segments) + 1))
+        ids_sorted = report_ids[order].tolist()
+        for i, segment_id in enumerate(segments.tolist()):
+            counts = self._counts.setdefault(segment_id, [0] * SLOTS)
+            for slot, n in enumerate(flat[i * SLOTS:(i + 1) * SLOTS].tolist()):
+                counts[slot] += n
+            self._ids.setdefault(segment_id, []).extend(ids_sorted[bounds[i]:bounds[i + 1]])
+
+        if self.decay_rate is not None:
+            decay = np.exp(-self.decay_rate * np.maximum(0.0, now - created_ts))
+            decay[np.isnan(decay)] = 0.0
+            decay_slots = confirmed.astype(np.int64) * NOTE_CLASSES + note_class
+            sums = np.bincount(
+                inverse * DECAY_SLOTS + decay_slots, weights=decay, minlength=len(segments) * DECAY_SLOTS
+            ).reshape(len(segments), DECAY_SLOTS)
+            for i, segment_id in enumerate(segments.tolist()):
+                entry = self._rescaled(segment_id, now)
+                # Entries ahead of now (clock skew) keep their own reference time
+                factor = math.exp(-self.decay_rate * (entry[0] - now))
+                entry[1] = [a + b * factor for a, b in zip(entry[1], sums[i].tolist())]
+
+        rids = report_ids.tolist()
+        created = [None if ts != ts else ts for ts in created_ts.tolist()]
+        self._reports.update(
+            (rid, [sid, cls, conf, fr, ts])
+            for rid, sid, cls, conf, fr, ts in zip(
+                rids, segment_ids.tolist(), note_class.tolist(), confirmed.tolist(), fresh.tolist(), created
+            )
+        )
+        expiry = (created_ts[fresh] + self.fresh_window_s).tolist()
+        self._expiry.extend(zip(expiry, report_ids[fresh].tolist()))
+        heapq.heapify(self._expiry)
+        self.confirmed_total += int(confirmed.sum())
+
+    def set_confirmed(self, report_id: int, now: float) -> bool:
+        """Mark a report confirmed; returns False if it was already confirmed (or unknown)."""
+        entry = self._reports.get(report_id)
+        if entry is None or entry[2]:
+            return False
+        segment_id, note_class, _, fresh, created_ts = entry
+        counts = self._counts[segment_id]
+        counts[_slot(fresh, False, note_class)] -= 1
+        counts[_slot(fresh, True, note_class)] += 1
+        self._add_decayed(segment_id, False, note_class, created_ts, now, -1.0)
+        self._add_decayed(segment_id, True, note_class, created_ts, now, 1.0)
+        entry[2] = True
+        self.confirmed_total += 1
+        return True
+
+    def set_note_class(self, report_id: int, note_class: int, now: float) -> bool:
+        """Move a report to another note class (after re-classification); False if unchanged."""
+        entry = self._reports.get(report_id)
+        if entry is None or entry[1] == note_class:
+            return False
+        segment_id, old_class, confirmed, fresh, created_ts = entry
+        counts = self._counts[segment_id]
+        counts[_slot(fresh, confirmed, old_class)] -= 1
+        counts[_slot(fresh, confirmed, note_class)] += 1
+        self._add_decayed(segment_id, confirmed, old_class, created_ts, now, -1.0)
+        self._add_decayed(segment_id, confirmed, note_class, created_ts, now, 1.0)
+        entry[1] = note_class
+        return True
+
+    def expire(self, now: float) -> int:
+        """Move reports whose fresh window has passed to the stale counts; returns how many."""
+        moved = 0
+        heap = self._expiry
+        while heap and heap[0][0] <= now:
+            _, report_id = heapq.heappop(heap)
+            entry = self._reports[report_id]
+            segment_id, note_class, confirmed = entry[0], entry[1], entry[2]
+            counts = self._counts[segment_id]
+            counts[_slot(True, confirmed, note_class)] -= 1
+            counts[_slot(False, confirmed, note_class)] += 1
+            entry[3] = False
+            self._expired_segments.add(segment_id)
+            moved += 1
+        return moved
+
+    def pop_expired_segments(self) -> Set[int]:
+        """Segments whose counts changed through expiry since the last call."""
+        segments, self._expired_segments = self._expired_segments, set()
+        return segments
+
+    def report_ids(self, segment_id: int) -> List[int]:
+        """Ids of the segment's reports in creation order (do not mutate)."""
+        return self._ids.get(segment_id, [])
+
+    def counts(self, segment_id: int, now: float) -> List[int]:
+        """Report counts by slot (fresh, confirmed, note class) as of now."""
+        self.expire(now)
+        return list(self._counts.get(segment_id, [0] * SLOTS))
+
+    def count_matrix(self, segment_ids: Sequence[int], now: float) -> np.ndarray:
+        """(len(segment_ids), SLOTS) int64 counts as of now, for vote_totals."""
+        self.expire(now)
+        empty = [0] * SLOTS
+        rows = [self._counts.get(sid, empty) for sid in segment_ids]
+        return np.array(rows, dtype=np.int64).reshape(len(rows), SLOTS)
+
+    def decayed_matrix(self, segment_ids: Sequence[int], now: float) -> np.ndarray:
+        """(len(segment_ids), DECAY_SLOTS) decayed sums as of now, for decayed_vote_totals."""
+        if self.decay_rate is None:
+            raise ValueError("index was built without decay_half_life_s")
+        empty = [0.0] * DECAY_SLOTS
+        rows = [
+            self._rescaled(sid, now)[1] if sid in self._decayed else empty
+            for sid in segment_ids
+        ]
+        return np.array(rows, dtype=np.float64).reshape(len(rows), DECAY_SLOTS)
+
+    def decayed_totals(
+        self,
+        segment_id: int,
+        now: float,
+        fresh_weight: float,
+        confirmed_weight: float,
+        neutral_negative_share: float = 0.3,
+    ) -> Dict[str, float]:
+        """totals() with exponentially decayed freshness (see decayed_vote_totals)."""
+        out = decayed_vote_totals(
+            self.count_matrix([segment_id], now),
+            self.decayed_matrix([segment_id], now),
+            fresh_weight, confirmed_weight, neutral_negative_share,
+        )
+        return {key: value[0].item() for key, value in out.items()}
+
+    def totals(
+        self,
+        segment_id: int,
+        now: float,
+        fresh_weight: float,
+        confirmed_weight: float,
+        neutral_negative_share: float = 0.3,
+    ) -> Dict[str, float]:
+        """
+        Weighted vote of one segment: report, confirmed and fresh counts and
+        the total / negative / positive weights. A report weighs 1.0, times
+        fresh_weight if fresh, times confirmed_weight if confirmed; neutral
+        reports split their weight neutral_negative_share / the rest.
+        """
+        counts = self.counts(segment_id, now)
+        out = {
+            "reports_total": 0, "reports_confirmed": 0, "reports_fresh": 0,
+            "total_weight": 0.0, "negative_weight": 0.0, "positive_weight": 0.0,
+        }
+        for fresh in (False, True):
+            for confirmed in (False, True):
+                weight = _slot_weight(fresh, confirmed, fresh_weight, confirmed_weight)
+                for note_class in range(NOTE_CLASSES):
+                    n = counts[_slot(fresh, confirmed, note_class)]
+                    if not n:
+                        continue
+                    out["reports_total"] += n
+                    out["reports_confirmed"] += n if confirmed else 0
+                    out["reports_fresh"] += n if fresh else 0
+                    out["total_weight"] += n * weight
+                    if note_class == NOTE_NEGATIVE:
+                        out["negative_weight"] += n * weight
+                    elif note_class == NOTE_POSITIVE:
+                        out["positive_weight"] += n * weight
+                    else:
+                        out["negative_weight"] += n * weight * neutral_negative_share
+                        out["positive_weight"] += n * weight * (1 - neutral_negative_share)
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "reports": len(self._reports),
+            "segments_with_reports": len(self._ids),
+            "confirmed": self.confirmed_total,
+            "pending_expiry": len(self._expiry),
+        }
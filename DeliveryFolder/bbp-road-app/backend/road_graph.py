@@ -0,0 +1,981 @@
+"""
+Embedded road-network router used as a local alternative to OSRM.
+
+The road network is imported from an OSM XML extract or a GeoJSON file of
+LineStrings into a compact array-backed graph:
+
+- node coordinates as float32 lon/lat arrays
+- CSR adjacency (indptr / indices) with float32 edge lengths in meters
+
+Shortest paths are found with A* (straight-line heuristic). For faster
+queries the graph can optionally be preprocessed into a contraction
+hierarchy (ContractionHierarchy), which answers queries with a small
+bidirectional upward search.
+
+LocalRouter wraps both behind the same route(points, profile, alternatives)
+interface as osrm_client.OSRMClient and returns OSRM-shaped responses, so
+the rest of the backend cannot tell the two apart.
+
+SegmentPenalties projects road-segment conditions (status, potholes) onto
+graph edges as per-preference cost arrays, so a single A* search returns
+the route that is best for that preference rather than merely shortest.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import json
+import math
+import threading
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from geodesy import EARTH_RADIUS_M, haversine_m
+from spatial_index import grid_corridor_cells, points_near_polyline
+
+LatLon = Tuple[float, float]
+
+# Highways a bicycle may not use (everything else tagged highway=* is routable)
+BIKE_EXCLUDED_HIGHWAYS = {
+    "motorway", "motorway_link", "trunk", "trunk_link",
+    "construction", "proposed", "raceway", "bus_guideway", "escape", "platform",
+}
+NODE_SNAP_DECIMALS = 6  # GeoJSON vertices closer than ~0.1 m are merged into one node
+BIKE_SPEED_MPS = 4.2  # ~15 km/h, OSRM's default cycling speed
+MAX_SNAP_M = 1_000.0  # Points farther than this from the network get no route
+NODE_GRID_DEG = 0.002  # Node bucket size for nearest_node and segment-to-edge matching
+NODE_SEARCH_MAX_RINGS = 8  # nearest_node scans every node when nothing is this close
+
+
+# ---- Graph ----
+class RoadGraph:
+    """Directed road graph in CSR form. Edge weights are lengths in meters."""
+
+    def __init__(
+        self,
+        lon: np.ndarray,
+        lat: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+        routable: Optional[np.ndarray] = None,
+    ):
+        self.lon = np.asarray(lon, dtype=np.float32)
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        # Python-list views for the search loops (list indexing beats ndarray indexing)
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._weights = self.weights.tolist()
+        self._lon = self.lon.astype(np.float64).tolist()
+        self._lat = self.lat.astype(np.float64).tolist()
+        self.routable = (
+            np.asarray(routable, dtype=bool) if routable is not None else self._largest_component()
+        )
+
+    @property
+    def n_nodes(self) -> int:
+        return int(self.lon.shape[0])
+
+    @property
+    def n_edges(self) -> int:
+        return int(self.indices.shape[0])
+
+    @classmethod
+    def from_edges(
+        cls,
+        lonlat: Sequence[Tuple[float, float]],
+        edges: Iterable[Tuple[int, int, float]],
+    ) -> "RoadGraph":
+        """Build from node coordinates and (u, v, length_m) edges; parallel edges keep the shortest."""
+        best: Dict[Tuple[int, int], float] = {}
+        for u, v, w in edges:
+            if u == v:
+                continue
+            if w < best.get((u, v), math.inf):
+                best[(u, v)] = w
+        n = len(lonlat)
+        keys = sorted(best)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        for u, _ in keys:
+            indptr[u + 1] += 1
+        np.cumsum(indptr, out=indptr)
+        coords = np.asarray(lonlat, dtype=np.float64).reshape(-1, 2)
+        return cls(
+            lon=coords[:, 0],
+            lat=coords[:, 1],
+            indptr=indptr,
+            indices=np.array([v for _, v in keys], dtype=np.int32),
+            weights=np.array([best[k] for k in keys], dtype=np.float32),
+        )
+
+    def _largest_component(self) -> np.ndarray:
+        """Mask of the largest weakly connected component (snapping targets)."""
+        n = self.n_nodes
+        if n == 0:
+            return np.zeros(0, dtype=bool)
+        undirected: List[List[int]] = [[] for _ in range(n)]
+        for u in range(n):
+            for k in range(self._indptr[u], self._indptr[u + 1]):
+                v = self._indices[k]
+                undirected[u].append(v)
+                undirected[v].append(u)
+        label = [-1] * n
+        sizes: List[int] = []
+        for start in range(n):
+            if label[start] != -1:
+                continue
+            comp = len(sizes)
+            label[start] = comp
+            stack = [start]
+            size = 0
+            while stack:
+                u = stack.pop()
+                size += 1
+                for v in undirected[u]:
+                    if label[v] == -1:
+                        label[v] = comp
+                        stack.append(v)
+            sizes.append(size)
+        biggest = int(np.argmax(sizes))
+        return np.asarray(label) == biggest
+
+    def _node_buckets(self) -> Dict[Tuple[int, int], np.ndarray]:
+        """Node ids (ascending) per NODE_GRID_DEG cell, built on first use; the graph never changes."""
+        if getattr(self, "_buckets", None) is None:
+            buckets: Dict[Tuple[int, int], np.ndarray] = {}
+            if self.n_nodes:
+                cx = np.floor(self.lon.astype(np.float64) / NODE_GRID_DEG).astype(np.int64)
+                cy = np.floor(self.lat.astype(np.float64) / NODE_GRID_DEG).astype(np.int64)
+                order = np.lexsort((cy, cx))  # stable: ids stay ascending within a cell
+                sx, sy = cx[order], cy[order]
+                starts = np.concatenate([[0], np.nonzero((np.diff(sx) != 0) | (np.diff(sy) != 0))[0] + 1])
+                ends = np.append(starts[1:], order.size)
+                for a, b in zip(starts.tolist(), ends.tolist()):
+                    buckets[(int(sx[a]), int(sy[a]))] = order[a:b]
+            self._buckets = buckets
+        return self._buckets
+
+    def nodes_in_cells(self, cells: Iterable[Tuple[int, int]]) -> np.ndarray:
+        """Ids of the nodes in the given NODE_GRID_DEG cells, ascending."""
+        buckets = self._node_buckets()
+        found = [buckets[cell] for cell in cells if cell in buckets]
+        return np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def _closest(self, candidates: np.ndarray, lat: float, lon: float, coslat: float) -> Tuple[int, float]:
+        dx = (self.lon[candidates].astype(np.float64) - lon) * coslat
+        dy = self.lat[candidates].astype(np.float64) - lat
+        best = int(candidates[int(np.argmin(dx * dx + dy * dy))])
+        return best, haversine_m(lat, lon, self._lat[best], self._lon[best])
+
+    def nearest_node(self, lat: float, lon: float) -> Tuple[int, float]:
+        """
+        Closest routable node to (lat, lon) and its distance in meters.
+        Scans the node buckets ring by ring around the point and stops once
+        no unscanned ring can hold anything closer; the result is the same
+        as a scan of every node.
+        """
+        coslat = math.cos(math.radians(lat))
+        buckets = self._node_buckets()
+        if coslat > 0 and buckets:
+            cx = math.floor(lon / NODE_GRID_DEG)
+            cy = math.floor(lat / NODE_GRID_DEG)
+            found: List[np.ndarray] = []
+            for ring in range(NODE_SEARCH_MAX_RINGS + 1):
+                for dx in range(-ring, ring + 1):
+                    for dy in range(-ring, ring + 1):
+                        if max(abs(dx), abs(dy)) != ring:
+                            continue
+                        bucket = buckets.get((cx + dx, cy + dy))
+                        if bucket is not None:
+                            nodes = bucket[self.routable[bucket]]
+                            if nodes.size:
+                                found.append(nodes)
+                if not found:
+                    continue
+                candidates = np.sort(np.concatenate(found))
+                d_lon = (self.lon[candidates].astype(np.float64) - lon) * coslat
+                d_lat = self.lat[candidates].astype(np.float64) - lat
+                # Nodes outside the scanned rings are at least this far (in scaled degrees)
+                bound = ring * NODE_GRID_DEG * coslat
+                if float(np.min(d_lon * d_lon + d_lat * d_lat)) < bound * bound:
+                    return self._closest(candidates, lat, lon, coslat)
+        candidates = np.nonzero(self.routable)[0]
+        if candidates.size == 0:
+            return -1, math.inf
+        return self._closest(candidates, lat, lon, coslat)
+
+    def _heuristic_factory(self, target: int):
+        """Admissible straight-line lower bound to target (equirectangular, 1% slack)."""
+        t_lon = math.radians(self._lon[target])
+        t_lat = math.radians(self._lat[target])
+        scale = EARTH_RADIUS_M * 0.99
+        lon_list = self._lon
+        lat_list = self._lat
+
+        def h(node: int) -> float:
+            n_lat = math.radians(lat_list[node])
+            x = (math.radians(lon_list[node]) - t_lon) * math.cos((n_lat + t_lat) / 2)
+            y = n_lat - t_lat
+            return scale * math.sqrt(x * x + y * y)
+
+        return h
+
+    @property
+    def edge_sources(self) -> np.ndarray:
+        """Source node of every CSR edge (parallel to indices/weights)."""
+        if getattr(self, "_edge_sources", None) is None:
+            self._edge_sources = np.repeat(
+                np.arange(self.n_nodes, dtype=np.int32), np.diff(self.indptr)
+            )
+        return self._edge_sources
+
+    def astar(
+        self,
+        source: int,
+        target: int,
+        costs: Optional[List[float]] = None,
+    ) -> Optional[Tuple[float, List[int]]]:
+        """
+        Shortest path with A*. Returns (cost, node path) or None if unreachable.
+        costs: optional per-edge costs replacing the lengths; they must not
+        be smaller than the lengths, or the heuristic stops being admissible.
+        """
+        if source == target:
+            return 0.0, [source]
+        h = self._heuristic_factory(target)
+        indptr, indices = self._indptr, self._indices
+        weights = self._weights if costs is None else costs
+        dist: Dict[int, float] = {source: 0.0}
+        parent: Dict[int, int] = {}
+        closed = set()
+        heap = [(h(source), 0.0, source)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            if u == target:
+                path = [u]
+                while u in parent:
+                    u = parent[u]
+                    path.append(u)
+                path.reverse()
+                return d, path
+            closed.add(u)
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                nd = d + weights[k]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(heap, (nd + h(v), nd, v))
+        return None
+
+    def distances_from(self, source: int, targets: Iterable[int]) -> Dict[int, float]:
+        """Dijkstra from source until every target is settled; unreachable targets are omitted."""
+        pending = set(targets)
+        found: Dict[int, float] = {}
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        dist: Dict[int, float] = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap and pending:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if u in pending:
+                pending.discard(u)
+                found[u] = d
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                nd = d + weights[k]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return found
+
+    def path_coords(self, path: List[int]) -> List[List[float]]:
+        return [[self._lon[n], self._lat[n]] for n in path]
+
+    def path_length_m(self, path: List[int]) -> float:
+        """Length of a node path along its shortest connecting edges."""
+        total = 0.0
+        for u, v in zip(path, path[1:]):
+            total += min(
+                self._weights[k]
+                for k in range(self._indptr[u], self._indptr[u + 1])
+                if self._indices[k] == v
+            )
+        return total
+
+    def save(self, path: str, ch: Optional["ContractionHierarchy"] = None) -> None:
+        """Write the graph (and optionally its contraction hierarchy) to a .npz file."""
+        arrays = {
+            "lon": self.lon, "lat": self.lat,
+            "indptr": self.indptr, "indices": self.indices, "weights": self.weights,
+            "routable": self.routable,
+        }
+        if ch is not None:
+            arrays.update({f"ch_{k}": v for k, v in ch.to_arrays().items()})
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["RoadGraph", Optional["ContractionHierarchy"]]:
+        data = np.load(path)
+        graph = cls(
+            data["lon"], data["lat"], data["indptr"], data["indices"], data["weights"],
+            routable=data["routable"],
+        )
+        ch = None
+        if "ch_rank" in data.files:
+            ch = ContractionHierarchy.from_arrays(
+                {k[3:]: data[k] for k in data.files if k.startswith("ch_")}
+            )
+        return graph, ch
+
+
+# ---- Import ----
+class _GraphBuilder:
+    def __init__(self) -> None:
+        self.node_ids: Dict[Hashable, int] = {}
+        self.lonlat: List[Tuple[float, float]] = []
+        self.edges: List[Tuple[int, int, float]] = []
+
+    def node(self, key: Hashable, lon: float, lat: float) -> int:
+        nid = self.node_ids.get(key)
+        if nid is None:
+            nid = len(self.lonlat)
+            self.node_ids[key] = nid
+            self.lonlat.append((lon, lat))
+        return nid
+
+    def add_way(self, nodes: List[int], oneway: int) -> None:
+        """oneway: 0 = both directions, 1 = along the way, -1 = against it."""
+        for a, b in zip(nodes, nodes[1:]):
+            lon1, lat1 = self.lonlat[a]
+            lon2, lat2 = self.lonlat[b]
+            w = haversine_m(lat1, lon1, lat2, lon2)
+            if oneway >= 0:
+                self.edges.append((a, b, w))
+            if oneway <= 0:
+                self.edges.append((b, a, w))
+
+    def build(self) -> RoadGraph:
+        return RoadGraph.from_edges(self.lonlat, self.edges)
+
+
+def _bike_oneway(tags: Dict[str, Any]) -> Optional[int]:
+    """Direction for a bicycle on a way with these tags, or None if bikes may not use it."""
+    highway = tags.get("highway")
+    if highway is not None and highway in BIKE_EXCLUDED_HIGHWAYS:
+        return None
+    if str(tags.get("bicycle", "")).lower() == "no":
+        return None
+    if str(tags.get("access", "")).lower() in ("no", "private") and str(tags.get("bicycle", "")).lower() not in ("yes", "designated"):
+        return None
+    if str(tags.get("oneway:bicycle", "")).lower() == "no":
+        return 0
+    oneway = str(tags.get("oneway", "")).lower()
+    if oneway in ("yes", "1", "true"):
+        return 1
+    if oneway == "-1":
+        return -1
+    if highway in ("motorway", "motorway_link") or tags.get("junction") == "roundabout":
+        return 1
+    return 0
+
+
+def graph_from_geojson(source: Any) -> RoadGraph:
+    """
+    Build a bike graph from a GeoJSON FeatureCollection (dict or file path)
+    of LineString / MultiLineString roads. OSM-style properties (highway,
+    oneway, bicycle, access) are honoured when present. Vertices that
+    coincide after rounding to NODE_SNAP_DECIMALS become shared nodes.
+    """
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as fh:
+            source = json.load(fh)
+    builder = _GraphBuilder()
+    for feature in source.get("features", []):
+        geom = feature.get("geometry") or {}
+        oneway = _bike_oneway(feature.get("properties") or {})
+        if oneway is None:
+            continue
+        if geom.get("type") == "LineString":
+            lines = [geom.get("coordinates", [])]
+        elif geom.get("type") == "MultiLineString":
+            lines = geom.get("coordinates", [])
+        else:
+            continue
+        for line in lines:
+            nodes = [
+                builder.node(
+                    (round(pt[0], NODE_SNAP_DECIMALS), round(pt[1], NODE_SNAP_DECIMALS)),
+                    pt[0], pt[1],
+                )
+                for pt in line
+            ]
+            builder.add_way(nodes, oneway)
+    return builder.build()
+
+
+def graph_from_osm_xml(path: str) -> RoadGraph:
+    """
+    Build a bike graph from an OSM XML extract (.osm), streaming the file.
+    Only ways with a highway tag usable by bicycles are imported.
+    """
+    node_coords: Dict[str, Tuple[float, float]] = {}
+    builder = _GraphBuilder()
+    for _, elem in ET.iterparse(path, events=("end",)):
+        if elem.tag == "node":
+            node_coords[elem.get("id")] = (float(elem.get("lon")), float(elem.get("lat")))
+            elem.clear()
+        elif elem.tag == "way":
+            tags = {t.get("k"): t.get("v") for t in elem.findall("tag")}
+            oneway = _bike_oneway(tags) if "highway" in tags else None
+            if oneway is not None:
+                refs = [nd.get("ref") for nd in elem.findall("nd")]
+                nodes = [
+                    builder.node(ref, *node_coords[ref]) for ref in refs if ref in node_coords
+                ]
+                builder.add_way(nodes, oneway)
+            elem.clear()
+    return builder.build()
+
+
+def load_road_graph(path: str) -> Tuple[RoadGraph, Optional["ContractionHierarchy"]]:
+    """Load a road network from .npz (prebuilt), .osm or .geojson/.json."""
+    lower = path.lower()
+    if lower.endswith(".npz"):
+        return RoadGraph.load(path)
+    if lower.endswith(".osm"):
+        return graph_from_osm_xml(path), None
+    return graph_from_geojson(path), None
+
+
+# ---- Contraction hierarchies ----
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over a RoadGraph.
+
+    Nodes are contracted in order of edge difference; shortcuts remember
+    the contracted middle node so paths can be unpacked. Queries run a
+    bidirectional Dijkstra that only climbs to higher-ranked nodes.
+    """
+
+    def __init__(
+        self,
+        rank: np.ndarray,
+        up: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        down: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    ):
+        self.rank = np.asarray(rank, dtype=np.int32)
+        self._up = tuple(a.tolist() for a in up)  # indptr, targets, weights, middles
+        self._down = tuple(a.tolist() for a in down)
+        self._up_arrays = up
+        self._down_arrays = down
+        self._rank = self.rank.tolist()
+
+    @property
+    def n_shortcuts(self) -> int:
+        return int((self._up_arrays[3] >= 0).sum() + (self._down_arrays[3] >= 0).sum())
+
+    @classmethod
+    def build(cls, graph: RoadGraph, witness_settle_limit: int = 60) -> "ContractionHierarchy":
+        n = graph.n_nodes
+        out: List[Dict[int, float]] = [dict() for _ in range(n)]
+        inn: List[Dict[int, float]] = [dict() for _ in range(n)]
+        middle: Dict[Tuple[int, int], int] = {}
+        for u in range(n):
+            for k in range(graph._indptr[u], graph._indptr[u + 1]):
+                v = graph._indices[k]
+                w = graph._weights[k]
+                if w < out[u].get(v, math.inf):
+                    out[u][v] = w
+                    inn[v][u] = w
+        contracted = [False] * n
+        deleted_neighbors = [0] * n
+        rank = [0] * n
+
+        def witness_dists(source: int, skip: int, max_dist: float) -> Dict[int, float]:
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            while heap and settled < witness_settle_limit:
+                d, u = heapq.heappop(heap)
+                if d > dist.get(u, math.inf):
+                    continue
+                if d > max_dist:
+                    break
+                settled += 1
+                for v, w in out[u].items():
+                    if v == skip or contracted[v]:
+                        continue
+                    nd = d + w
+                    if nd < dist.get(v, math.inf):
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+            return dist
+
+        def contract(v: int, apply: bool) -> int:
+            ins = [(u, w) for u, w in inn[v].items() if not contracted[u]]
+            outs = [(x, w) for x, w in out[v].items() if not contracted[x]]
+            shortcuts = 0
+            for u, wu in ins:
+                targets = {x: wu + wx for x, wx in outs if x != u}
+                if not targets:
+                    continue
+                dist = witness_dists(u, v, max(targets.values()))
+                for x, via in targets.items():
+                    if dist.get(x, math.inf) <= via:
+                        continue
+                    shortcuts += 1
+                    if apply and via < out[u].get(x, math.inf):
+                        out[u][x] = via
+                        inn[x][u] = via
+                        middle[(u, x)] = v
+            if apply:
+                return shortcuts
+            return shortcuts - len(ins) - len(outs) + deleted_neighbors[v]
+
+        heap = [(contract(v, False), v) for v in range(n)]
+        heapq.heapify(heap)
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            priority = contract(v, False)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, v))
+                continue
+            contract(v, True)
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+            for u in list(inn[v]) + list(out[v]):
+                deleted_neighbors[u] += 1
+
+        up_adj: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+        down_adj: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+        for u in range(n):
+            for x, w in out[u].items():
+                mid = middle.get((u, x), -1)
+                if rank[x] > rank[u]:
+                    up_adj[u].append((x, w, mid))
+                else:
+                    down_adj[x].append((u, w, mid))
+        return cls(np.asarray(rank), _to_csr(up_adj), _to_csr(down_adj))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        names = ("indptr", "targets", "weights", "middles")
+        arrays = {"rank": self.rank}
+        arrays.update({f"up_{k}": a for k, a in zip(names, self._up_arrays)})
+        arrays.update({f"down_{k}": a for k, a in zip(names, self._down_arrays)})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "ContractionHierarchy":
+        names = ("indptr", "targets", "weights", "middles")
+        return cls(
+            arrays["rank"],
+            tuple(arrays[f"up_{k}"] for k in names),
+            tuple(arrays[f"down_{k}"] for k in names),
+        )
+
+    def query(self, source: int, target: int) -> Optional[Tuple[float, List[int]]]:
+        """Shortest path. Returns (length_m, node path) or None if unreachable."""
+        if source == target:
+            return 0.0, [source]
+        sides = (
+            ({source: 0.0}, {}, [(0.0, source)], self._up),
+            ({target: 0.0}, {}, [(0.0, target)], self._down),
+        )
+        best = math.inf
+        meet = -1
+        while True:
+            tops = [s[2][0][0] if s[2] else math.inf for s in sides]
+            if min(tops) >= best:
+                break
+            side = 0 if tops[0] <= tops[1] else 1
+            dist, parent, heap, (indptr, targets, weights, _) = sides[side]
+            other = sides[1 - side][0]
+            d, u = heapq.heappop(heap)
+            if d > dist.get(u, math.inf):
+                continue
+            if u in other and d + other[u] < best:
+                best = d + other[u]
+                meet = u
+            for k in range(indptr[u], indptr[u + 1]):
+                v = targets[k]
+                nd = d + weights[k]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(heap, (nd, v))
+        if meet < 0:
+            return None
+        forward = [meet]
+        parent_f = sides[0][1]
+        while forward[-1] in parent_f:
+            forward.append(parent_f[forward[-1]])
+        forward.reverse()
+        backward = []
+        parent_b = sides[1][1]
+        node = meet
+        while node in parent_b:
+            node = parent_b[node]
+            backward.append(node)
+        hops = forward + backward
+        path = [hops[0]]
+        for a, b in zip(hops, hops[1:]):
+            self._unpack(a, b, path)
+        return best, path
+
+    def _edge_middle(self, u: int, v: int) -> int:
+        """Middle node of the cheapest hierarchy edge u->v (-1 for an original edge)."""
+        if self._rank[v] > self._rank[u]:
+            indptr, targets, weights, middles = self._up
+            lo, hi, want = indptr[u], indptr[u + 1], v
+        else:
+            indptr, targets, weights, middles = self._down
+            lo, hi, want = indptr[v], indptr[v + 1], u
+        best_w, best_mid = math.inf, -1
+        for k in range(lo, hi):
+            if targets[k] == want and weights[k] < best_w:
+                best_w, best_mid = weights[k], middles[k]
+        return best_mid
+
+    def _unpack(self, u: int, v: int, path: List[int]) -> None:
+        """Append the original nodes after u on hierarchy edge u->v (iteratively)."""
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            mid = self._edge_middle(a, b)
+            if mid < 0:
+                path.append(b)
+            else:
+                stack.append((mid, b))
+                stack.append((a, mid))
+
+
+def _to_csr(adj: List[List[Tuple[int, float, int]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    indptr = np.zeros(len(adj) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(a) for a in adj])
+    flat = [e for a in adj for e in a]
+    return (
+        indptr,
+        np.array([e[0] for e in flat], dtype=np.int32),
+        np.array([e[1] for e in flat], dtype=np.float32),
+        np.array([e[2] for e in flat], dtype=np.int32),
+    )
+
+
+# ---- Segment penalties ----
+class SegmentPenalties:
+    """
+    Per-preference edge costs derived from road-segment conditions.
+
+    profiles maps a preference name to cost factors, e.g.
+    {"maintenance": 16.0, "suboptimal": 6.0, "medium": 2.5, "pothole_m": 1200.0}:
+    an edge covered by a segment with that status costs length x factor
+    (the largest factor wins when several segments cover it; factors below
+    1 are raised to 1 so A* stays exact), and a pothole segment adds
+    pothole_m spread over its edges in proportion to their length.
+
+    A segment covers the edges whose two end nodes both lie within
+    match_tolerance_deg of the segment line; only the out-edges of nodes in
+    the node buckets around the segment are tested, so matching one segment
+    does not depend on the size of the graph. update_segment() and
+    remove_segment() only recompute the edges of the segment concerned.
+
+    A cost list returned by costs() is never modified again: the next
+    update copies it and swaps the copy in (copy-on-write), so a search
+    running in a worker thread sees one consistent set of costs. Lists no
+    search has seen yet are updated in place, so a burst of updates
+    between searches copies each list once.
+    """
+
+    def __init__(
+        self,
+        graph: RoadGraph,
+        profiles: Dict[str, Dict[str, float]],
+        match_tolerance_deg: float = 0.0002,
+    ):
+        self.graph = graph
+        self.profiles = profiles
+        self.match_tolerance_deg = match_tolerance_deg
+        self._costs: Dict[str, List[float]] = {name: list(graph._weights) for name in profiles}
+        self._shared: Set[str] = set()  # Preferences whose current list was handed out by costs()
+        self._lock = threading.Lock()
+        self._segment_edges: Dict[Hashable, List[int]] = {}
+        self._segment_state: Dict[Hashable, Tuple[str, bool, float]] = {}
+        self._edge_segments: Dict[int, set] = {}
+        self.updates = 0
+
+    def costs(self, preference: str) -> Optional[List[float]]:
+        """Edge cost list for a preference (None if unknown); never modified after it is returned."""
+        with self._lock:
+            costs = self._costs.get(preference)
+            if costs is not None:
+                self._shared.add(preference)
+            return costs
+
+    def _match_edges(self, coords: List[List[float]]) -> List[int]:
+        g = self.graph
+        line = np.asarray(coords, dtype=np.float64)
+        tol = self.match_tolerance_deg
+        # Sources near the line lie in the buckets covering it buffered by tol
+        path = line.tolist() if len(line) > 1 else line.tolist() * 2
+        sources = g.nodes_in_cells(grid_corridor_cells(path, NODE_GRID_DEG, tol))
+        if sources.size == 0:
+            return []
+        first = g.indptr[sources]
+        counts = g.indptr[sources + 1] - first
+        total = int(counts.sum())
+        if total == 0:
+            return []
+        # Out-edge ids of every source, ascending (CSR keeps a node's edges contiguous)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        edges = np.repeat(first, counts) + offsets
+        ends = np.concatenate([g.edge_sources[edges], g.indices[edges]])
+        pts = np.column_stack([g.lon[ends], g.lat[ends]]).astype(np.float64)
+        near = points_near_polyline(pts, line, tol)
+        both = near[: edges.size] & near[edges.size:]
+        return edges[both].tolist()
+
+    def update_segment(
+        self,
+        segment_id: Hashable,
+        coords: List[List[float]],
+        status: str,
+        pothole: bool = False,
+    ) -> int:
+        """Insert or refresh a segment ([lon, lat] line); returns the number of edges it covers."""
+        edges = self._segment_edges.get(segment_id)
+        if edges is None:
+            edges = self._match_edges(coords)
+            self._segment_edges[segment_id] = edges
+            for e in edges:
+                self._edge_segments.setdefault(e, set()).add(segment_id)
+        total_m = sum(self.graph._weights[e] for e in edges)
+        self._segment_state[segment_id] = (status, pothole, total_m)
+        self._recompute(edges)
+        self.updates += 1
+        return len(edges)
+
+    def remove_segment(self, segment_id: Hashable) -> None:
+        edges = self._segment_edges.pop(segment_id, [])
+        self._segment_state.pop(segment_id, None)
+        for e in edges:
+            owners = self._edge_segments.get(e)
+            if owners is not None:
+                owners.discard(segment_id)
+                if not owners:
+                    del self._edge_segments[e]
+        self._recompute(edges)
+
+    def _recompute(self, edges: List[int]) -> None:
+        if not edges:
+            return
+        weights = self.graph._weights
+        with self._lock:
+            for name, factors in self.profiles.items():
+                self._recompute_costs(name, factors, edges, weights)
+
+    def _recompute_costs(
+        self, name: str, factors: Dict[str, float], edges: List[int], weights: List[float]
+    ) -> None:
+        costs = self._costs[name]
+        if name in self._shared:
+            # Copy-on-write: searches in worker threads keep the list they started with
+            costs = list(costs)
+            self._shared.discard(name)
+        pothole_m = factors.get("pothole_m", 0.0)
+        for e in edges:
+            multiplier = 1.0
+            extra = 0.0
+            for sid in self._edge_segments.get(e, ()):
+                status, pothole, total_m = self._segment_state[sid]
+                multiplier = max(multiplier, factors.get(status, 1.0))
+                if pothole and total_m > 0:
+                    extra += pothole_m * weights[e] / total_m
+            costs[e] = weights[e] * multiplier + extra
+        self._costs[name] = costs
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments": len(self._segment_edges),
+            "penalized_edges": len(self._edge_segments),
+            "profiles": sorted(self.profiles),
+            "updates": self.updates,
+        }
+
+
+# ---- Router ----
+class LocalRouter:
+    """
+    OSRM stand-in backed by a RoadGraph.
+
+    route() has the same signature as OSRMClient.route and returns the same
+    response shape ({"code": "Ok", "routes": [...]}) with a single route;
+    `alternatives` is accepted but ignored, and the graph is always a bike
+    network whatever `profile` is passed.
+
+    With `penalties` attached, route(..., preference=...) searches on that
+    preference's penalized costs (A* only: the contraction hierarchy is
+    built for plain lengths). Reported distances are always real lengths.
+    """
+
+    def __init__(
+        self,
+        graph: RoadGraph,
+        ch: Optional[ContractionHierarchy] = None,
+        speed_mps: float = BIKE_SPEED_MPS,
+        max_snap_m: float = MAX_SNAP_M,
+    ):
+        self.graph = graph
+        self.ch = ch
+        self.penalties: Optional[SegmentPenalties] = None
+        self.speed_mps = speed_mps
+        self.max_snap_m = max_snap_m
+        self.queries = 0
+        self.no_route = 0
+
+    @classmethod
+    def from_file(cls, path: str, contract: bool = False, **kwargs: Any) -> "LocalRouter":
+        graph, ch = load_road_graph(path)
+        if contract and ch is None:
+            ch = ContractionHierarchy.build(graph)
+        return cls(graph, ch, **kwargs)
+
+    def shortest_path(
+        self,
+        source: int,
+        target: int,
+        preference: Optional[str] = None,
+        costs: Optional[List[float]] = None,
+    ) -> Optional[Tuple[float, List[int]]]:
+        """
+        (length_m, node path) of the cheapest path for the preference (None = plain length).
+        costs: edge costs already fetched for the preference (route_sync uses one
+        snapshot for all legs).
+        """
+        if costs is None:
+            costs = self._preference_costs(preference)
+        if costs is not None:
+            result = self.graph.astar(source, target, costs)
+            if result is None:
+                return None
+            return self.graph.path_length_m(result[1]), result[1]
+        if self.ch is not None:
+            return self.ch.query(source, target)
+        return self.graph.astar(source, target)
+
+    def _preference_costs(self, preference: Optional[str]) -> Optional[List[float]]:
+        return self.penalties.costs(preference) if self.penalties is not None and preference else None
+
+    def route_sync(
+        self,
+        points: List[LatLon],
+        profile: str = "bike",
+        alternatives: bool = False,
+        preference: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Route through (lat, lon) points leg by leg; None if any point or leg is unroutable."""
+        self.queries += 1
+        nodes = []
+        for lat, lon in points:
+            node, snap_m = self.graph.nearest_node(lat, lon)
+            if node < 0 or snap_m > self.max_snap_m:
+                self.no_route += 1
+                return None
+            nodes.append(node)
+
+        costs = self._preference_costs(preference)
+        coords: List[List[float]] = []
+        legs = []
+        total = 0.0
+        for a, b in zip(nodes, nodes[1:]):
+            result = self.shortest_path(a, b, preference, costs)
+            if result is None:
+                self.no_route += 1
+                return None
+            length, path = result
+            leg_coords = self.graph.path_coords(path)
+            coords.extend(leg_coords[1:] if coords else leg_coords)
+            legs.append({"distance": length, "duration": length / self.speed_mps, "steps": []})
+            total += length
+        if len(coords) == 1:
+            coords.append(list(coords[0]))
+
+        return {
+            "code": "Ok",
+            "engine": "local",
+            "routes": [{
+                "geometry": {"type": "LineString", "coordinates": coords},
+                "distance": total,
+                "duration": total / self.speed_mps,
+                "legs": legs,
+                "weight_name": "distance",
+                "weight": total,
+            }],
+            "waypoints": [
+                {"location": [self.graph._lon[n], self.graph._lat[n]]} for n in nodes
+            ],
+        }
+
+    def table_sync(self, points: List[LatLon], profile: str = "bike") -> Optional[Dict[str, Any]]:
+        """OSRM table-shaped distance/duration matrix (None entries where unreachable)."""
+        nodes = []
+        for lat, lon in points:
+            node, snap_m = self.graph.nearest_node(lat, lon)
+            if node < 0 or snap_m > self.max_snap_m:
+                return None
+            nodes.append(node)
+        distances: List[List[Optional[float]]] = []
+        for node in nodes:
+            reached = self.graph.distances_from(node, nodes)
+            distances.append([reached.get(other) for other in nodes])
+        return {
+            "code": "Ok",
+            "engine": "local",
+            "distances": distances,
+            "durations": [
+                [None if d is None else d / self.speed_mps for d in row] for row in distances
+            ],
+        }
+
+    async def table(
+        self,
+        points: List[LatLon],
+        profile: str = "bike",
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.table_sync, points, profile)
+
+    async def route(
+        self,
+        points: List[LatLon],
+        profile: str = "bike",
+        alternatives: bool = False,
+        timeout: Optional[float] = None,
+        preference: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Async wrapper; the search runs in a worker thread to keep the event loop free."""
+        return await asyncio.to_thread(self.route_sync, points, profile, alternatives, preference)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "nodes": self.graph.n_nodes,
+            "edges": self.graph.n_edges,
+            "routable_nodes": int(self.graph.routable.sum()),
+            "contraction_hierarchy": self.ch is not None,
+            "shortcuts": self.ch.n_shortcuts if self.ch is not None else 0,
+            "penalties": self.penalties.stats() if self.penalties is not None else None,
+            "queries": self.queries,
+            "no_route": self.no_route,
+        }
@@ -0,0 +1,222 @@
+"""
+Road skeleton learned from OSRM responses.
+
+Every route geometry OSRM returns is real road. RoadSkeleton folds those
+polylines into one undirected graph: vertices are snapped to a small grid,
+so the same street fetched by different routes collapses onto the same
+nodes, and repeated edges are merged instead of duplicated.
+
+When OSRM is unreachable, route() runs A* on the skeleton and returns an
+OSRM-shaped response, so degraded mode still follows streets that earlier
+routes used, without any network call. Requests whose endpoints are not
+near the skeleton, or that need roads nobody has fetched yet, get None and
+callers fall back as before.
+
+Building and routing are blocking pure-Python work: async callers run them
+through asyncio.to_thread. A lock serializes them, so a route search never
+sees the graph change under it.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from geodesy import haversine_m
+
+LatLon = Tuple[float, float]
+Cell = Tuple[int, int]
+
+METERS_PER_DEG_LAT = 111_320.0
+
+
+class RoadSkeleton:
+    """
+    Incremental undirected graph of road geometry seen so far.
+
+    snap_deg: grid used to merge vertices (~11 m at the default)
+    max_nodes: growth stops once this many vertices are stored
+    max_snap_m: how far a route endpoint may be from the nearest vertex
+    """
+
+    def __init__(
+        self,
+        snap_deg: float = 0.0001,
+        max_nodes: int = 200_000,
+        max_snap_m: float = 250.0,
+        speed_mps: float = 4.2,
+        bucket_deg: float = 0.002,
+    ):
+        if snap_deg <= 0 or bucket_deg <= 0:
+            raise ValueError("snap_deg and bucket_deg must be positive")
+        self.snap_deg = snap_deg
+        self.max_nodes = max_nodes
+        self.max_snap_m = max_snap_m
+        self.speed_mps = speed_mps
+        self.bucket_deg = bucket_deg
+        self._node_of: Dict[Cell, int] = {}
+        self._lon: List[float] = []
+        self._lat: List[float] = []
+        self._adj: List[Dict[int, float]] = []
+        self._buckets: Dict[Cell, List[int]] = {}
+        self._lock = threading.RLock()
+        self.edges = 0
+        self.geometries_added = 0
+        self.queries = 0
+        self.routed = 0
+
+    def __len__(self) -> int:
+        return len(self._lon)
+
+    # ---- building ----
+
+    def _node(self, lon: float, lat: float) -> int:
+        """Node id for the grid cell of (lon, lat), created at the cell centre if new (-1 when full)."""
+        key = (round(lon / self.snap_deg), round(lat / self.snap_deg))
+        node = self._node_of.get(key)
+        if node is not None:
+            return node
+        if len(self._lon) >= self.max_nodes:
+            return -1
+        node = len(self._lon)
+        self._node_of[key] = node
+        self._lon.append(key[0] * self.snap_deg)
+        self._lat.append(key[1] * self.snap_deg)
+        self._adj.append({})
+        bucket = (math.floor(self._lon[node] / self.bucket_deg), math.floor(self._lat[node] / self.bucket_deg))
+        self._buckets.setdefault(bucket, []).append(node)
+        return node
+
+    def add_geometry(self, coords: List[List[float]]) -> int:
+        """Merge a [lon, lat] polyline into the skeleton; returns the number of new edges."""
+        with self._lock:
+            added = 0
+            prev = -1
+            for lon, lat in coords:
+                node = self._node(lon, lat)
+                if node >= 0 and prev >= 0 and node != prev and node not in self._adj[prev]:
+                    length = haversine_m(self._lat[prev], self._lon[prev], self._lat[node], self._lon[node])
+                    self._adj[prev][node] = length
+                    self._adj[node][prev] = length
+                    added += 1
+                prev = node
+            self.edges += added
+            self.geometries_added += 1
+            return added
+
+    def add_route_response(self, data: Optional[Dict[str, Any]]) -> int:
+        """Merge every route geometry of an OSRM route response."""
+        if not data:
+            return 0
+        added = 0
+        for route in data.get("routes") or []:
+            coords = (route.get("geometry") or {}).get("coordinates")
+            if coords and len(coords) >= 2:
+                added += self.add_geometry(coords)
+        return added
+
+    # ---- routing ----
+
+    def nearest_node(self, lat: float, lon: float) -> Tuple[int, float]:
+        """Closest skeleton vertex within max_snap_m of (lat, lon) and its distance (-1, inf if none)."""
+        rings_lat = math.ceil(self.max_snap_m / METERS_PER_DEG_LAT / self.bucket_deg)
+        coslat = max(math.cos(math.radians(lat)), 0.01)
+        rings_lon = math.ceil(rings_lat / coslat)
+        cx = math.floor(lon / self.bucket_deg)
+        cy = math.floor(lat / self.bucket_deg)
+        best, best_m = -1, math.inf
+        for dx in range(-rings_lon, rings_lon + 1):
+            for dy in range(-rings_lat, rings_lat + 1):
+                for node in self._buckets.get((cx + dx, cy + dy), ()):
+                    dist = haversine_m(lat, lon, self._lat[node], self._lon[node])
+                    if dist < best_m:
+                        best, best_m = node, dist
+        if best_m > self.max_snap_m:
+            return -1, math.inf
+        return best, best_m
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[float, List[int]]]:
+        """A* on edge lengths; (length_m, node path) or None if target is not connected."""
+        if source == target:
+            return 0.0, [source]
+        lat, lon, adj = self._lat, self._lon, self._adj
+        t_lat, t_lon = lat[target], lon[target]
+        dist = {source: 0.0}
+        parent = {source: -1}
+        heap = [(0.0, 0.0, source)]
+        while heap:
+            _, d, node = heapq.heappop(heap)
+            if node == target:
+                path = [node]
+                while parent[path[-1]] >= 0:
+                    path.append(parent[path[-1]])
+                return d, path[::-1]
+            if d > dist[node]:
+                continue
+            for nxt, w in adj[node].items():
+                nd = d + w
+                if nd < dist.get(nxt, math.inf):
+                    dist[nxt] = nd
+                    parent[nxt] = node
+                    # Straight-line lower bound; edge lengths are haversine too
+                    h = 0.999 * haversine_m(lat[nxt], lon[nxt], t_lat, t_lon)
+                    heapq.heappush(heap, (nd + h, nd, nxt))
+        return None
+
+    def route(self, points: List[LatLon], profile: str = "bike", alternatives: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        OSRM-shaped route through (lat, lon) points, leg by leg, with a single
+        route ("engine": "skeleton"). None if any point is off the skeleton or
+        any leg is disconnected. `profile` and `alternatives` are ignored.
+        """
+        with self._lock:
+            return self._route(points)
+
+    def _route(self, points: List[LatLon]) -> Optional[Dict[str, Any]]:
+        self.queries += 1
+        nodes = []
+        for lat, lon in points:
+            node, _ = self.nearest_node(lat, lon)
+            if node < 0:
+                return None
+            nodes.append(node)
+
+        coords: List[List[float]] = []
+        legs = []
+        total = 0.0
+        for a, b in zip(nodes, nodes[1:]):
+            result = self.shortest_path(a, b)
+            if result is None:
+                return None
+            length, path = result
+            leg_coords = [[self._lon[n], self._lat[n]] for n in path]
+            coords.extend(leg_coords[1:] if coords else leg_coords)
+            legs.append({"distance": length, "duration": length / self.speed_mps, "steps": []})
+            total += length
+        if len(coords) == 1:
+            coords.append(list(coords[0]))
+
+        self.routed += 1
+        return {
+            "code": "Ok",
+            "engine": "skeleton",
+            "routes": [{
+                "geometry": {"type": "LineString", "coordinates": coords},
+                "distance": total,
+                "duration": total / self.speed_mps,
+                "legs": legs,
+                "weight_name": "distance",
+                "weight": total,
+            }],
+            "waypoints": [{"location": [self._lon[n], self._lat[n]]} for n in nodes],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "nodes": len(self._lon),
+            "edges": self.edges,
+            "geometries_added": self.geometries_added,
+            "queries": self.queries,
+            "routed": self.routed,
+        }
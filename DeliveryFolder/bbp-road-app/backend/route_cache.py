@@ -0,0 +1,289 @@
+"""
+Caches for OSRM responses.
+
+Routes are keyed by profile, alternatives flag and the request points
+snapped to a fixed number of decimals, so repeated searches for (almost)
+the same origin/destination are served without network I/O.
+
+TTLCache is the in-memory layer; DiskRouteCache is a SQLite file that
+keeps compressed responses across restarts.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+LatLon = Tuple[float, float]
+
+
+def snap_route_key(
+    profile: str,
+    points: List[LatLon],
+    alternatives: bool,
+    precision: int = 4,
+) -> Tuple[Any, ...]:
+    """
+    Cache key for an OSRM route request.
+    precision: decimals kept per coordinate (4 ~ 11 m, 3 ~ 110 m).
+    """
+    snapped = tuple((round(lat, precision), round(lon, precision)) for lat, lon in points)
+    return (profile, bool(alternatives), snapped)
+
+
+def route_key_to_str(key: Tuple[Any, ...]) -> str:
+    """Stable text form of a snap_route_key() key (used as SQLite primary key)."""
+    profile, alternatives, snapped = key
+    return json.dumps([profile, alternatives, [list(p) for p in snapped]], separators=(",", ":"))
+
+
+def route_key_from_str(text: str) -> Tuple[Any, ...]:
+    profile, alternatives, snapped = json.loads(text)
+    return (profile, bool(alternatives), tuple((lat, lon) for lat, lon in snapped))
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after ttl_s seconds.
+    Not thread-safe; meant for use from the event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_s: float = 600.0):
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl_s, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class DiskRouteCache:
+    """
+    SQLite-backed OSRM response cache that survives restarts.
+
+    Responses are stored zlib-compressed. When the stored payload exceeds
+    max_bytes, least recently used entries are deleted down to ~90% of the
+    budget. Entries older than max_age_s are treated as missing.
+    The connection is opened lazily and guarded by a lock, so the cache can
+    be used from worker threads (the event loop should reach it through
+    asyncio.to_thread: every call is blocking SQLite I/O).
+
+    A hit is a read only: hit counts and last-used times are kept in memory
+    and written in one batch every flush_every hits, before eviction and
+    hottest(), and on close().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_age_s: float = 7 * 86400.0,
+        flush_every: int = 256,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.flush_every = flush_every
+        # key -> [hits since last flush, last used]
+        self._pending_hits: Dict[str, List[float]] = {}
+        self._pending_count = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.warm_loaded = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                " key TEXT PRIMARY KEY,"
+                " payload BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("DELETE FROM routes WHERE created_at < ?", (time.time() - self.max_age_s,))
+            conn.commit()
+            self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM routes").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def open(self) -> None:
+        with self._lock:
+            self._connect()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._flush_hits(self._conn)
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def flush(self) -> None:
+        """Write pending hit counts and last-used times."""
+        with self._lock:
+            if self._pending_hits:
+                conn = self._connect()
+                self._flush_hits(conn)
+                conn.commit()
+
+    def _flush_hits(self, conn: sqlite3.Connection) -> None:
+        if not self._pending_hits:
+            return
+        conn.executemany(
+            "UPDATE routes SET hits = hits + ?, last_used = MAX(last_used, ?) WHERE key = ?",
+            [(int(n), last_used, skey) for skey, (n, last_used) in self._pending_hits.items()],
+        )
+        self._pending_hits.clear()
+        self._pending_count = 0
+        self.flushes += 1
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[Any]:
+        skey = route_key_to_str(key)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT payload, created_at FROM routes WHERE key = ?", (skey,)
+            ).fetchone()
+            if row is None or row[1] < now - self.max_age_s:
+                self.misses += 1
+                return None
+            pending = self._pending_hits.setdefault(skey, [0, now])
+            pending[0] += 1
+            pending[1] = now
+            self._pending_count += 1
+            self.hits += 1
+            if self._pending_count >= self.flush_every:
+                self._flush_hits(conn)
+                conn.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key: Tuple[Any, ...], value: Any) -> None:
+        skey = route_key_to_str(key)
+        payload = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            # The row is replaced with fresh counters
+            self._pending_hits.pop(skey, None)
+            old = conn.execute("SELECT size FROM routes WHERE key = ?", (skey,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO routes (key, payload, size, hits, created_at, last_used)"
+                " VALUES (?, ?, ?, 0, ?, ?)",
+                (skey, payload, len(payload), now, now),
+            )
+            self._bytes += len(payload) - (old[0] if old else 0)
+            self.writes += 1
+            if self._bytes > self.max_bytes:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        target = int(self.max_bytes * 0.9)
+        self._flush_hits(conn)  # LRU order needs the latest last_used
+        doomed = []
+        for skey, size in conn.execute("SELECT key, size FROM routes ORDER BY last_used ASC"):
+            if self._bytes <= target:
+                break
+            doomed.append((skey,))
+            self._bytes -= size
+        conn.executemany("DELETE FROM routes WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def hottest(self, limit: int) -> List[Tuple[Tuple[Any, ...], Any]]:
+        """Most frequently used unexpired entries, for warming the memory cache."""
+        with self._lock:
+            conn = self._connect()
+            self._flush_hits(conn)
+            conn.commit()
+            rows = conn.execute(
+                "SELECT key, payload FROM routes WHERE created_at >= ?"
+                " ORDER BY hits DESC, last_used DESC LIMIT ?",
+                (time.time() - self.max_age_s, limit),
+            ).fetchall()
+        return [(route_key_from_str(k), json.loads(zlib.decompress(p))) for k, p in rows]
+
+    def warm(self, memory: TTLCache, limit: int) -> int:
+        """Copy the hottest entries into an in-memory cache; returns how many were loaded."""
+        entries = self.hottest(limit)
+        # Insert coldest first so the hottest end up most recently used
+        for key, value in reversed(entries):
+            memory.set(key, value)
+        self.warm_loaded = len(entries)
+        return len(entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0] if self._conn else 0
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "pending_hits": self._pending_count,
+            "flushes": self.flushes,
+            "warm_loaded": self.warm_loaded,
+        }
@@ -0,0 +1,183 @@
+"""
+Route similarity checks used to deduplicate candidate routes.
+
+The second route's vertices are hashed into a uniform grid whose cell size
+equals the match tolerance, so "is there a vertex within tol of this point"
+only has to look at the 3x3 neighbouring cells instead of scanning the
+whole route.
+
+Coordinates are [lon, lat] pairs and distances are planar, in degrees,
+exactly like the original linear-scan implementation.
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_TOLERANCE_DEG = 0.0005  # ~50m tolerance
+
+SIMILARITY_MODES = ("sample", "hausdorff", "frechet")
+
+
+class VertexGrid:
+    """Grid hash of polyline vertices for O(1) expected proximity queries."""
+
+    def __init__(self, coords: List[List[float]], cell_deg: float = DEFAULT_TOLERANCE_DEG):
+        if cell_deg <= 0:
+            raise ValueError("cell_deg must be positive")
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float]]] = {}
+        for x, y in coords:
+            key = (math.floor(x / cell_deg), math.floor(y / cell_deg))
+            self._cells.setdefault(key, []).append((x, y))
+
+    def nearest_within(self, x: float, y: float, max_dist: float) -> float:
+        """
+        Distance to the nearest vertex if one lies within max_dist, else inf.
+        max_dist must not exceed cell_deg (only neighbouring cells are searched).
+        """
+        size = self.cell_deg
+        cx = math.floor(x / size)
+        cy = math.floor(y / size)
+        best = math.inf
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                bucket = self._cells.get((cx + dx, cy + dy))
+                if not bucket:
+                    continue
+                for vx, vy in bucket:
+                    dist = math.sqrt((x - vx) ** 2 + (y - vy) ** 2)
+                    if dist < best:
+                        best = dist
+        return best if best <= max_dist else math.inf
+
+    def has_vertex_within(self, x: float, y: float, tol: float) -> bool:
+        """True if some vertex is strictly closer than tol to (x, y)."""
+        return self.nearest_within(x, y, tol) < tol
+
+
+def sampled_overlap(
+    route1_coords: List[List[float]],
+    route2_grid: VertexGrid,
+    tolerance_deg: float = DEFAULT_TOLERANCE_DEG,
+    samples: int = 10,
+) -> float:
+    """Fraction of ~samples evenly spaced route1 vertices that have a route2 vertex within tolerance."""
+    sample_step = max(1, len(route1_coords) // samples)
+    close_count = 0
+    total_sampled = 0
+    for i in range(0, len(route1_coords), sample_step):
+        total_sampled += 1
+        x, y = route1_coords[i]
+        if route2_grid.has_vertex_within(x, y, tolerance_deg):
+            close_count += 1
+    return close_count / total_sampled if total_sampled > 0 else 1.0
+
+
+def hausdorff_within(
+    route1_coords: List[List[float]],
+    route2_coords: List[List[float]],
+    tolerance_deg: float = DEFAULT_TOLERANCE_DEG,
+    route1_grid: Optional[VertexGrid] = None,
+    route2_grid: Optional[VertexGrid] = None,
+) -> bool:
+    """
+    True if the discrete (vertex) Hausdorff distance is below tolerance_deg.
+    Stops at the first vertex of either route without a close counterpart.
+    """
+    grid2 = route2_grid or VertexGrid(route2_coords, tolerance_deg)
+    for x, y in route1_coords:
+        if not grid2.has_vertex_within(x, y, tolerance_deg):
+            return False
+    grid1 = route1_grid or VertexGrid(route1_coords, tolerance_deg)
+    for x, y in route2_coords:
+        if not grid1.has_vertex_within(x, y, tolerance_deg):
+            return False
+    return True
+
+
+def frechet_within(
+    route1_coords: List[List[float]],
+    route2_coords: List[List[float]],
+    tolerance_deg: float = DEFAULT_TOLERANCE_DEG,
+) -> bool:
+    """
+    True if the discrete Frechet distance is below tolerance_deg.
+
+    Decision version of the Eiter-Mannila recurrence, evaluated one row at
+    a time with NumPy. Returns early as soon as a row has no reachable
+    cell. Both routes must be densely sampled (as OSRM geometries are) for
+    the vertex-based distance to be meaningful.
+    """
+    a = np.asarray(route1_coords, dtype=np.float64).reshape(-1, 2)
+    b = np.asarray(route2_coords, dtype=np.float64).reshape(-1, 2)
+    if a.shape[0] == 0 or b.shape[0] == 0:
+        return a.shape[0] == b.shape[0]
+    tol_sq = tolerance_deg * tolerance_deg
+    idx = np.arange(b.shape[0])
+    prev: Optional[np.ndarray] = None
+    for i in range(a.shape[0]):
+        close = ((b[:, 0] - a[i, 0]) ** 2 + (b[:, 1] - a[i, 1]) ** 2) < tol_sq
+        if prev is None:
+            # First row: reachable along the run of close cells starting at (0, 0)
+            seed = np.zeros_like(close)
+            seed[0] = close[0]
+        else:
+            diag = np.zeros_like(prev)
+            diag[1:] = prev[:-1]
+            seed = close & (prev | diag)
+        # Within a run of close cells, everything after a seed is reachable from the left
+        last_seed = np.maximum.accumulate(np.where(seed, idx, -1))
+        last_gap = np.maximum.accumulate(np.where(close, -1, idx))
+        row = close & (last_seed > last_gap)
+        if not row.any():
+            return False
+        prev = row
+    return bool(prev[-1])
+
+
+def routes_are_similar(route1_coords: List[List[float]], route2_coords: List[List[float]],
+                       route1_dist: float, route2_dist: float,
+                       distance_threshold: float = 0.02,
+                       coord_similarity_threshold: float = 0.8,
+                       mode: str = "sample",
+                       tolerance_deg: float = DEFAULT_TOLERANCE_DEG,
+                       route2_grid: Optional[VertexGrid] = None) -> bool:
+    """
+    Check if two routes are essentially the same.
+    Returns True if routes are similar (should be deduplicated).
+
+    Uses two criteria:
+    1. Distance similarity (within threshold percentage)
+    2. Geometric similarity, depending on mode:
+       - "sample": share of ~10 sampled route1 points that are close to
+         route2 is at least coord_similarity_threshold (original behaviour)
+       - "hausdorff": discrete Hausdorff distance below tolerance_deg
+       - "frechet": discrete Frechet distance below tolerance_deg
+
+    route2_grid: optional prebuilt VertexGrid of route2 (cell = tolerance_deg),
+    so a candidate compared against many others is hashed only once.
+    """
+    if mode not in SIMILARITY_MODES:
+        raise ValueError(f"unknown similarity mode: {mode}")
+
+    # Check distance similarity
+    if route1_dist > 0 and route2_dist > 0:
+        dist_diff = abs(route1_dist - route2_dist) / max(route1_dist, route2_dist)
+        if dist_diff > distance_threshold:
+            return False  # Significantly different distances = different routes
+
+    if not route1_coords or not route2_coords:
+        return True
+
+    if mode == "frechet":
+        return frechet_within(route1_coords, route2_coords, tolerance_deg)
+
+    grid2 = route2_grid or VertexGrid(route2_coords, tolerance_deg)
+    if mode == "hausdorff":
+        return hausdorff_within(route1_coords, route2_coords, tolerance_deg, route2_grid=grid2)
+
+    similarity = sampled_overlap(route1_coords, grid2, tolerance_deg)
+    return similarity >= coord_similarity_threshold
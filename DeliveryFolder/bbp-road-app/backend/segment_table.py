@@ -0,0 +1,106 @@
+"""
+Array-backed table of derived segment geometry.
+
+Road segments are straight lines between a start and an end point. Their
+length, midpoint and bounding box never change after insert, so they are
+computed once and stored column-wise in NumPy arrays (one row per
+segment) instead of being recomputed for every route request.
+
+Midpoints are stored as [lon, lat] rows, the planar coordinates the
+spatial code (spatial_index) matches against route geometry.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from geodesy import haversine_m_array
+
+# Column order of the geometry matrix
+COLUMNS = (
+    "start_lon", "start_lat", "end_lon", "end_lat",
+    "mid_lon", "mid_lat",
+    "min_lon", "min_lat", "max_lon", "max_lat",
+    "length_m",
+)
+_COL = {name: i for i, name in enumerate(COLUMNS)}
+
+
+class SegmentGeometryTable:
+    """
+    Growable (rows x len(COLUMNS)) float64 matrix keyed by segment id.
+    Capacity doubles when full, so inserts are amortised O(1).
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._data = np.zeros((max(1, capacity), len(COLUMNS)), dtype=np.float64)
+        self._row_of: Dict[int, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, segment_id: int) -> bool:
+        return segment_id in self._row_of
+
+    def upsert(self, segment_id: int, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> int:
+        """Store (or overwrite) a segment's geometry; returns its row."""
+        row = self._row_of.get(segment_id)
+        if row is None:
+            if self._size == self._data.shape[0]:
+                grown = np.zeros((self._data.shape[0] * 2, len(COLUMNS)), dtype=np.float64)
+                grown[: self._size] = self._data[: self._size]
+                self._data = grown
+            row = self._size
+            self._size += 1
+            self._row_of[segment_id] = row
+        length = float(haversine_m_array(start_lat, start_lon, end_lat, end_lon))
+        self._data[row] = (
+            start_lon, start_lat, end_lon, end_lat,
+            (start_lon + end_lon) / 2, (start_lat + end_lat) / 2,
+            min(start_lon, end_lon), min(start_lat, end_lat),
+            max(start_lon, end_lon), max(start_lat, end_lat),
+            length,
+        )
+        return row
+
+    def clear(self) -> None:
+        self._row_of.clear()
+        self._size = 0
+
+    def rows(self, segment_ids: Iterable[int]) -> Optional[np.ndarray]:
+        """Row numbers for the ids, or None if any id is not in the table."""
+        row_of = self._row_of
+        out = []
+        for sid in segment_ids:
+            row = row_of.get(sid)
+            if row is None:
+                return None
+            out.append(row)
+        return np.asarray(out, dtype=np.int64)
+
+    def column(self, name: str, rows: np.ndarray) -> np.ndarray:
+        return self._data[rows, _COL[name]]
+
+    def midpoints(self, rows: np.ndarray) -> np.ndarray:
+        """(k, 2) array of [lon, lat] midpoints."""
+        return self._data[rows][:, [_COL["mid_lon"], _COL["mid_lat"]]]
+
+    def lengths_m(self, rows: np.ndarray) -> np.ndarray:
+        return self._data[rows, _COL["length_m"]]
+
+    def bboxes(self, rows: np.ndarray) -> np.ndarray:
+        """(k, 4) array of [min_lon, min_lat, max_lon, max_lat]."""
+        return self._data[rows][:, [_COL["min_lon"], _COL["min_lat"], _COL["max_lon"], _COL["max_lat"]]]
+
+    def midpoint(self, segment_id: int) -> Tuple[float, float]:
+        """(lon, lat) midpoint of one segment."""
+        row = self._row_of[segment_id]
+        return float(self._data[row, _COL["mid_lon"]]), float(self._data[row, _COL["mid_lat"]])
+
+    def length_m(self, segment_id: int) -> float:
+        return float(self._data[self._row_of[segment_id], _COL["length_m"]])
+
+    def stats(self) -> Dict[str, int]:
+        return {"segments": self._size, "capacity": int(self._data.shape[0])}
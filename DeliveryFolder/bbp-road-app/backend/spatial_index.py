@@ -0,0 +1,368 @@
+"""
+Spatial index over road segments.
+
+Segments are bucketed by their midpoint on a uniform lon/lat grid so that
+route scoring only has to look at segments inside the route's buffered
+corridor instead of the whole segment table. The corridor test itself is
+done in one vectorized NumPy pass over all candidate points.
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from geodesy import cumulative_distance_m
+
+Cell = Tuple[int, int]
+
+
+def grid_corridor_cells(route_coords: List[List[float]], cell_deg: float, buffer_deg: float) -> Set[Cell]:
+    """
+    Cells of a cell_deg grid covering the route buffered by buffer_deg.
+    route_coords: list of [lon, lat] pairs
+
+    Long edges are split into pieces no longer than one cell so that a
+    diagonal edge does not pull in its whole bounding box.
+    """
+    cells: Set[Cell] = set()
+    size = cell_deg
+    for i in range(len(route_coords) - 1):
+        lon1, lat1 = route_coords[i]
+        lon2, lat2 = route_coords[i + 1]
+        pieces = max(1, math.ceil(max(abs(lon2 - lon1), abs(lat2 - lat1)) / size))
+        for k in range(pieces):
+            t0 = k / pieces
+            t1 = (k + 1) / pieces
+            a_lon = lon1 + (lon2 - lon1) * t0
+            a_lat = lat1 + (lat2 - lat1) * t0
+            b_lon = lon1 + (lon2 - lon1) * t1
+            b_lat = lat1 + (lat2 - lat1) * t1
+            cx0 = math.floor((min(a_lon, b_lon) - buffer_deg) / size)
+            cx1 = math.floor((max(a_lon, b_lon) + buffer_deg) / size)
+            cy0 = math.floor((min(a_lat, b_lat) - buffer_deg) / size)
+            cy1 = math.floor((max(a_lat, b_lat) + buffer_deg) / size)
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cells.add((cx, cy))
+    return cells
+
+
+class SegmentGridIndex:
+    """
+    Uniform grid (bucket) index keyed by segment midpoint.
+
+    cell_deg: grid cell size in degrees. A value close to the matching
+    tolerance keeps the number of cells touched per route edge small.
+    """
+
+    def __init__(self, cell_deg: float = 0.002):
+        if cell_deg <= 0:
+            raise ValueError("cell_deg must be positive")
+        self.cell_deg = cell_deg
+        self._cells: Dict[Cell, Set[int]] = {}
+        self._cell_of: Dict[int, Cell] = {}
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def __contains__(self, segment_id: int) -> bool:
+        return segment_id in self._cell_of
+
+    def _cell(self, lon: float, lat: float) -> Cell:
+        return (math.floor(lon / self.cell_deg), math.floor(lat / self.cell_deg))
+
+    def insert(self, segment_id: int, lon: float, lat: float) -> None:
+        """Insert (or move) a segment at the given midpoint."""
+        self.remove(segment_id)
+        cell = self._cell(lon, lat)
+        self._cells.setdefault(cell, set()).add(segment_id)
+        self._cell_of[segment_id] = cell
+
+    def remove(self, segment_id: int) -> None:
+        cell = self._cell_of.pop(segment_id, None)
+        if cell is None:
+            return
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(segment_id)
+            if not bucket:
+                del self._cells[cell]
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._cell_of.clear()
+
+    def corridor_cells(self, route_coords: List[List[float]], buffer_deg: float) -> Set[Cell]:
+        """Grid cells covering the route buffered by buffer_deg (see grid_corridor_cells)."""
+        return grid_corridor_cells(route_coords, self.cell_deg, buffer_deg)
+
+    def query_cells(self, cells: Iterable[Cell]) -> List[int]:
+        """Segment ids stored in the given cells, in ascending id order."""
+        found: Set[int] = set()
+        for cell in cells:
+            bucket = self._cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return sorted(found)
+
+    def query_corridor(self, route_coords: List[List[float]], buffer_deg: float) -> List[int]:
+        """
+        Candidate segment ids whose midpoint may lie within buffer_deg of the route.
+        The result is a superset of the exact match; callers still run the
+        precise distance test on it.
+        """
+        if len(route_coords) < 2 or not self._cells:
+            return []
+        return self.query_cells(self.corridor_cells(route_coords, buffer_deg))
+
+
+class HazardTileGrid:
+    """
+    Coarse per-tile totals of road hazards, keyed by segment midpoint.
+
+    Each tile holds meters of maintenance / suboptimal / medium road and a
+    pothole count. update_segment() replaces a segment's previous
+    contribution, so the grid follows SEGMENTS incrementally. route_mass()
+    sums the tiles a route crosses, at O(route length / tile size) cost;
+    buffered by a midpoint-matching tolerance, the tiles contain every
+    segment such a match can find, so the sums bound its result from above.
+    """
+
+    FIELDS = ("maintenance_m", "suboptimal_m", "medium_m", "potholes")
+
+    def __init__(self, tile_deg: float = 0.005):
+        if tile_deg <= 0:
+            raise ValueError("tile_deg must be positive")
+        self.tile_deg = tile_deg
+        self._tiles: Dict[Cell, Dict[str, float]] = {}
+        self._contribution: Dict[int, Tuple[Cell, Dict[str, float]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def update_segment(
+        self,
+        segment_id: int,
+        lon: float,
+        lat: float,
+        status: str,
+        length_m: float,
+        pothole: bool,
+    ) -> None:
+        """Set a segment's contribution from its midpoint, status, length and pothole flag."""
+        self.remove_segment(segment_id)
+        mass = {field: 0.0 for field in self.FIELDS}
+        if status in ("maintenance", "suboptimal", "medium"):
+            mass[f"{status}_m"] = length_m
+        if pothole:
+            mass["potholes"] = 1.0
+        if not any(mass.values()):
+            return
+        cell = (math.floor(lon / self.tile_deg), math.floor(lat / self.tile_deg))
+        tile = self._tiles.setdefault(cell, {field: 0.0 for field in self.FIELDS})
+        for field, value in mass.items():
+            tile[field] += value
+        self._contribution[segment_id] = (cell, mass)
+
+    def remove_segment(self, segment_id: int) -> None:
+        entry = self._contribution.pop(segment_id, None)
+        if entry is None:
+            return
+        cell, mass = entry
+        tile = self._tiles[cell]
+        for field, value in mass.items():
+            tile[field] -= value
+        if all(abs(v) < 1e-9 for v in tile.values()):
+            del self._tiles[cell]
+
+    def clear(self) -> None:
+        self._tiles.clear()
+        self._contribution.clear()
+
+    def route_mass(self, route_coords: List[List[float]], buffer_deg: float = 0.0) -> Dict[str, float]:
+        """Summed hazard totals of the tiles crossed by the route (buffered by buffer_deg)."""
+        total = {field: 0.0 for field in self.FIELDS}
+        if len(route_coords) < 2 or not self._tiles:
+            return total
+        for cell in grid_corridor_cells(route_coords, self.tile_deg, buffer_deg):
+            tile = self._tiles.get(cell)
+            if tile:
+                for field in self.FIELDS:
+                    total[field] += tile[field]
+        return total
+
+
+# ---- Vectorized corridor matching ----
+CORRIDOR_BLOCK_ELEMENTS = 1 << 18  # points x edges evaluated per chunk (~2 MB per float64 temp)
+
+
+def points_to_polyline_distance(
+    points: "np.ndarray | List[List[float]]",
+    route: "np.ndarray | List[List[float]]",
+    block_elements: int = CORRIDOR_BLOCK_ELEMENTS,
+) -> np.ndarray:
+    """
+    Minimum planar distance from each point to a polyline.
+
+    points: (M, 2) array of [lon, lat]
+    route: (N, 2) array of [lon, lat], N >= 2
+    block_elements: upper bound on M x edges evaluated at once, so memory
+    stays bounded for long routes.
+
+    Returns an (M,) float64 array in the same units as the input (degrees).
+    Uses the same arithmetic as point_to_segment_distance in main.py, so the
+    results compare identically against a tolerance.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    line = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    m = pts.shape[0]
+    n_edges = line.shape[0] - 1
+    best = np.full(m, np.inf)
+    if m == 0 or n_edges < 1:
+        return best
+
+    ax_all = line[:-1, 0]
+    ay_all = line[:-1, 1]
+    abx_all = line[1:, 0] - ax_all
+    aby_all = line[1:, 1] - ay_all
+    ab_sq_all = abx_all * abx_all + aby_all * aby_all
+
+    px = pts[:, 0:1]
+    py = pts[:, 1:2]
+    step = max(1, block_elements // m)
+    for start in range(0, n_edges, step):
+        end = min(start + step, n_edges)
+        ax = ax_all[start:end]
+        ay = ay_all[start:end]
+        abx = abx_all[start:end]
+        aby = aby_all[start:end]
+        ab_sq = ab_sq_all[start:end]
+
+        apx = px - ax
+        apy = py - ay
+        degenerate = ab_sq == 0
+        safe_sq = np.where(degenerate, 1.0, ab_sq)
+        t = np.clip((apx * abx + apy * aby) / safe_sq, 0.0, 1.0)
+        t = np.where(degenerate, 0.0, t)
+        dx = px - (ax + t * abx)
+        dy = py - (ay + t * aby)
+        np.minimum(best, (dx * dx + dy * dy).min(axis=1), out=best)
+    return np.sqrt(best)
+
+
+def points_near_polyline(
+    points: "np.ndarray | List[List[float]]",
+    route: "np.ndarray | List[List[float]]",
+    tolerance: float,
+    block_elements: int = CORRIDOR_BLOCK_ELEMENTS,
+) -> np.ndarray:
+    """Boolean (M,) mask of points strictly closer than tolerance to the polyline."""
+    return points_to_polyline_distance(points, route, block_elements) < tolerance
+
+
+def locate_along_polyline(
+    points: "np.ndarray | List[List[float]]",
+    route: "np.ndarray | List[List[float]]",
+    block_elements: int = CORRIDOR_BLOCK_ELEMENTS,
+) -> np.ndarray:
+    """
+    Linear referencing: distance in meters along the route to where each
+    point projects onto it (its closest point on the closest edge).
+
+    The projection is planar in degrees, like points_to_polyline_distance;
+    the measure is the haversine length of the route up to that edge plus
+    the projected fraction of the edge. Returns an (M,) float64 array.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    line = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    m = pts.shape[0]
+    n_edges = line.shape[0] - 1
+    if m == 0 or n_edges < 1:
+        return np.zeros(m)
+
+    cum = cumulative_distance_m(line)
+    hop = np.diff(cum)
+    ax_all = line[:-1, 0]
+    ay_all = line[:-1, 1]
+    abx_all = line[1:, 0] - ax_all
+    aby_all = line[1:, 1] - ay_all
+    ab_sq_all = abx_all * abx_all + aby_all * aby_all
+
+    px = pts[:, 0:1]
+    py = pts[:, 1:2]
+    best = np.full(m, np.inf)
+    measure = np.zeros(m)
+    rows = np.arange(m)
+    step = max(1, block_elements // m)
+    for start in range(0, n_edges, step):
+        end = min(start + step, n_edges)
+        ab_sq = ab_sq_all[start:end]
+        degenerate = ab_sq == 0
+        safe_sq = np.where(degenerate, 1.0, ab_sq)
+        apx = px - ax_all[start:end]
+        apy = py - ay_all[start:end]
+        t = np.clip((apx * abx_all[start:end] + apy * aby_all[start:end]) / safe_sq, 0.0, 1.0)
+        t = np.where(degenerate, 0.0, t)
+        dx = apx - t * abx_all[start:end]
+        dy = apy - t * aby_all[start:end]
+        d_sq = dx * dx + dy * dy
+        k = d_sq.argmin(axis=1)
+        block_best = d_sq[rows, k]
+        better = block_best < best
+        best = np.where(better, block_best, best)
+        edge = start + k
+        measure = np.where(better, cum[edge] + t[rows, k] * hop[edge], measure)
+    return measure
+
+
+def points_near_polylines(
+    points: "np.ndarray | List[List[float]]",
+    routes: List["np.ndarray | List[List[float]]"],
+    tolerance: float,
+    block_elements: int = CORRIDOR_BLOCK_ELEMENTS,
+) -> np.ndarray:
+    """
+    Boolean (M, R) mask: point m is strictly closer than tolerance to route r.
+
+    The edges of all routes are stacked and evaluated together, then reduced
+    per route with np.minimum.reduceat, so scoring several candidate routes
+    costs one vectorized pass instead of one per route. Same arithmetic as
+    points_to_polyline_distance. Routes with fewer than 2 points match nothing.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    m = pts.shape[0]
+    lines = [np.asarray(r, dtype=np.float64).reshape(-1, 2) for r in routes]
+    result = np.zeros((m, len(lines)), dtype=bool)
+    usable = [i for i, line in enumerate(lines) if line.shape[0] >= 2]
+    if m == 0 or not usable:
+        return result
+
+    starts = np.concatenate([lines[i][:-1] for i in usable])
+    ends = np.concatenate([lines[i][1:] for i in usable])
+    offsets = np.cumsum([0] + [lines[i].shape[0] - 1 for i in usable[:-1]])
+    ax_all = starts[:, 0]
+    ay_all = starts[:, 1]
+    abx_all = ends[:, 0] - ax_all
+    aby_all = ends[:, 1] - ay_all
+    ab_sq_all = abx_all * abx_all + aby_all * aby_all
+    degenerate_all = ab_sq_all == 0
+    safe_sq_all = np.where(degenerate_all, 1.0, ab_sq_all)
+
+    n_edges = starts.shape[0]
+    step = max(1, block_elements // n_edges)
+    best = np.empty((m, len(usable)))
+    for start in range(0, m, step):
+        end = min(start + step, m)
+        px = pts[start:end, 0:1]
+        py = pts[start:end, 1:2]
+        apx = px - ax_all
+        apy = py - ay_all
+        t = np.clip((apx * abx_all + apy * aby_all) / safe_sq_all, 0.0, 1.0)
+        t = np.where(degenerate_all, 0.0, t)
+        dx = px - (ax_all + t * abx_all)
+        dy = py - (ay_all + t * aby_all)
+        best[start:end] = np.minimum.reduceat(dx * dx + dy * dy, offsets, axis=1)
+    result[:, usable] = np.sqrt(best) < tolerance
+    return result
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Test report note classification against the original English keyword scan."""
+import random
+
+from main import NOTE_CLASSIFIER, REPORT_NOTE_KEYWORDS
+from note_classifier import NoteClassifier
+from report_index import NOTE_NEGATIVE, NOTE_NEUTRAL, NOTE_POSITIVE
+
+ENGLISH = REPORT_NOTE_KEYWORDS["en"]
+
+
+def baseline_class(note):
+    """Classification of the original aggregation loop (English substrings only)."""
+    note = (note or "").lower()
+    if any(kw in note for kw in ENGLISH["negative"]):
+        return NOTE_NEGATIVE
+    if any(kw in note for kw in ENGLISH["positive"]):
+        return NOTE_POSITIVE
+    return NOTE_NEUTRAL
+
+
+def test_english_notes_match_baseline():
+    notes = [
+        None, "", "Potholes everywhere", "badly cracked asphalt", "road is FINE now",
+        "smooth but a hole near the corner", "nothing to report", "Repaired last week",
+        # Contain Italian keywords as parts of English words
+        "we cycled past the grotto", "pessimistic about the schedule",
+        "a buonarroti statue", "stopped for crepes, then rode on", "a crepe stand by the lane",
+    ]
+    random.seed(7)
+    words = ["road", "lane", "the", "is", "very", "grotto", "pessimistic", "ottoman", "crepe", "curb"]
+    words += ENGLISH["negative"] + ENGLISH["positive"]
+    for _ in range(5000):
+        notes.append(" ".join(random.choice(words) for _ in range(random.randint(1, 6))))
+    for note in notes:
+        assert NOTE_CLASSIFIER.classify(note)[0] == baseline_class(note), note
+
+
+def test_italian_keywords_only_match_whole_words():
+    assert NOTE_CLASSIFIER.classify("we cycled past the grotto") == (NOTE_NEUTRAL, [])
+    assert NOTE_CLASSIFIER.classify("pessimistic about the schedule") == (NOTE_NEUTRAL, [])
+    assert NOTE_CLASSIFIER.classify("a crepe stand by the lane") == (NOTE_NEUTRAL, [])
+    assert NOTE_CLASSIFIER.classify("strada rotta, buca enorme")[0] == NOTE_NEGATIVE
+    assert NOTE_CLASSIFIER.classify("asfalto liscio, ottimo")[0] == NOTE_POSITIVE
+    assert NOTE_CLASSIFIER.classify("Pessima strada") == (NOTE_NEGATIVE, ["pessima"])
+
+
+def test_negative_in_any_language_wins():
+    assert NOTE_CLASSIFIER.classify("路上有坑") == (NOTE_NEGATIVE, ["坑"])
+    assert NOTE_CLASSIFIER.classify("good road but buca at the end") == (NOTE_NEGATIVE, ["buca", "good"])
+
+
+def test_substring_mode_differs_from_whole_words():
+    substring = NoteClassifier(["rotto"], ["ottim"])
+    whole = NoteClassifier(["rotto"], ["ottim"], whole_words=True)
+    assert substring.classify("the grotto") == (NOTE_NEGATIVE, ["rotto"])
+    assert whole.classify("the grotto") == (NOTE_NEUTRAL, [])
+    assert substring.version != whole.version
+
+
+if __name__ == "__main__":
+    test_english_notes_match_baseline()
+    test_italian_keywords_only_match_whole_words()
+    test_negative_in_any_language_wins()
+    test_substring_mode_differs_from_whole_words()
+    print("note classifier tests passed")
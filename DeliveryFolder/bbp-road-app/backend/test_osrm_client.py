@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Test how OSRM timeouts under the request latency budget feed the circuit breaker."""
+import asyncio
+
+import httpx
+
+from main import OSRM_REQUEST_BUDGET_S, OSRM_TIMEOUT
+from osrm_client import CircuitBreaker, OSRMClient, latency_budget
+
+POINTS = [(45.46, 9.19), (45.47, 9.20)]
+
+
+def timing_out_client():
+    def handler(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    breaker = CircuitBreaker(window=20, min_calls=5, failure_rate=0.5, open_s=30.0)
+    client = OSRMClient("http://osrm.invalid", timeout=OSRM_TIMEOUT, breaker=breaker)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, breaker
+
+
+async def route_in_request(client, budget_s):
+    with latency_budget(budget_s):
+        return await client.route(POINTS)
+
+
+def test_timeouts_under_default_budget_open_breaker():
+    client, breaker = timing_out_client()
+
+    async def scenario():
+        for _ in range(20):
+            assert await route_in_request(client, OSRM_REQUEST_BUDGET_S) is None
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.OPEN
+    assert client.budget_timeouts == 0
+    assert breaker.rejected > 0  # later requests failed fast
+
+
+def test_nearly_spent_budget_does_not_count_as_failure():
+    client, breaker = timing_out_client()
+
+    async def scenario():
+        for _ in range(20):
+            assert await route_in_request(client, OSRM_TIMEOUT * 0.1) is None
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["window_calls"] == 0
+    assert client.budget_timeouts == 20
+
+
+if __name__ == "__main__":
+    test_timeouts_under_default_budget_open_breaker()
+    test_nearly_spent_budget_does_not_count_as_failure()
+    print("osrm client tests passed")
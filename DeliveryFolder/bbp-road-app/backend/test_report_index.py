@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""Test the report index's running totals against the per-report weight loop."""
+import asyncio
+import contextlib
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import main
+from report_index import (
+    DECAY_SLOTS, NOTE_CLASSES, NOTE_NEGATIVE, NOTE_POSITIVE, SLOTS, SegmentReportIndex,
+    decayed_vote_totals, utc_timestamp, vote_counts_from_columns, vote_totals,
+)
+
+DAY = 86400.0
+NOW = 1_790_000_000.0
+FRESH_WEIGHT = main.AGGREGATION_FRESHNESS_WEIGHT
+CONFIRMED_WEIGHT = main.AGGREGATION_CONFIRMED_WEIGHT
+WINDOW_S = (main.AGGREGATION_FRESHNESS_DAYS + 1) * DAY
+
+
+def new_index():
+    return SegmentReportIndex(WINDOW_S, decay_half_life_s=main.AGGREGATION_DECAY_HALF_LIFE_DAYS * DAY)
+
+
+@contextlib.contextmanager
+def weighting(mode):
+    previous, main.AGGREGATION_WEIGHTING = main.AGGREGATION_WEIGHTING, mode
+    try:
+        yield
+    finally:
+        main.AGGREGATION_WEIGHTING = previous
+
+
+def random_reports(n, segments=8, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "segment_id": rng.randrange(segments),
+            "created_ts": None if rng.random() < 0.05 else NOW - rng.uniform(0, 90 * DAY),
+            "confirmed": rng.random() < 0.4,
+            "note_class": rng.randrange(NOTE_CLASSES),
+        }
+        for i in range(n)
+    ]
+
+
+def weight_loop(reports, segment_id, now):
+    """The original aggregation loop: calculate_report_weight per report."""
+    out = {"reports_total": 0, "reports_confirmed": 0, "total_weight": 0.0,
+           "negative_weight": 0.0, "positive_weight": 0.0}
+    for report in reports:
+        if report["segment_id"] != segment_id:
+            continue
+        weight = main.calculate_report_weight(report, now)
+        out["reports_total"] += 1
+        out["reports_confirmed"] += int(report["confirmed"])
+        out["total_weight"] += weight
+        if report["note_class"] == NOTE_NEGATIVE:
+            out["negative_weight"] += weight
+        elif report["note_class"] == NOTE_POSITIVE:
+            out["positive_weight"] += weight
+        else:
+            out["negative_weight"] += weight * 0.3
+            out["positive_weight"] += weight * 0.7
+    return out
+
+
+def assert_matches_loop(totals, expected):
+    for key, value in expected.items():
+        assert math.isclose(totals[key], value, rel_tol=1e-12, abs_tol=1e-9), (key, totals[key], value)
+
+
+def index_reports(index, reports, now=NOW):
+    for r in reports:
+        index.add(r["id"], r["segment_id"], r["created_ts"], r["confirmed"], r["note_class"], now=now)
+
+
+def test_totals_match_weight_loop():
+    reports = random_reports(3000)
+    index = new_index()
+    index_reports(index, reports)
+    with weighting("window"):
+        for now in (NOW, NOW + 10 * DAY, NOW + 45 * DAY):
+            for segment_id in range(8):
+                totals = index.totals(segment_id, now, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+                assert_matches_loop(totals, weight_loop(reports, segment_id, now))
+
+
+def test_decayed_totals_match_weight_loop():
+    reports = random_reports(3000, seed=1)
+    index = new_index()
+    index_reports(index, reports[:2000])
+    # Later reports arrive after the sums were last rescaled
+    later = reports[2000:]
+    for r in later:
+        r["created_ts"] = None if r["created_ts"] is None else r["created_ts"] + 5 * DAY
+    index_reports(index, later, now=NOW + 5 * DAY)
+    with weighting("decay"):
+        for now in (NOW + 5 * DAY, NOW + 40 * DAY):
+            for segment_id in range(8):
+                totals = index.decayed_totals(segment_id, now, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+                assert_matches_loop(totals, weight_loop(reports, segment_id, now))
+
+
+def test_bulk_totals_agree_bit_for_bit():
+    reports = random_reports(5000, segments=40, seed=2)
+    index = new_index()
+    index_reports(index, reports)
+    now = NOW + 3 * DAY
+    ids = list(range(40))
+    counts = index.count_matrix(ids, now)
+    window = vote_totals(counts, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+    decayed = decayed_vote_totals(counts, index.decayed_matrix(ids, now), FRESH_WEIGHT, CONFIRMED_WEIGHT)
+    for row, segment_id in enumerate(ids):
+        scalar = index.totals(segment_id, now, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+        scalar_decayed = index.decayed_totals(segment_id, now, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+        for key in scalar:
+            assert window[key][row] == scalar[key], key
+            assert decayed[key][row] == scalar_decayed[key], key
+
+    # The same counts straight from report columns
+    created = np.array([np.nan if r["created_ts"] is None else r["created_ts"] for r in reports])
+    segments, from_columns = vote_counts_from_columns(
+        np.array([r["segment_id"] for r in reports]),
+        created,
+        np.array([r["confirmed"] for r in reports]),
+        np.array([r["note_class"] for r in reports]),
+        now,
+        WINDOW_S,
+    )
+    assert segments.tolist() == ids
+    assert (from_columns == counts).all()
+
+
+def test_expiry_at_window_edge():
+    index = new_index()
+    created = NOW - 10 * DAY
+    report = {"id": 1, "segment_id": 7, "created_ts": created, "confirmed": False, "note_class": NOTE_NEGATIVE}
+    index_reports(index, [report])
+    edge = created + WINDOW_S
+    with weighting("window"):
+        before = index.totals(7, edge - 1e-3, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+        assert before["reports_fresh"] == 1
+        assert_matches_loop(before, weight_loop([report], 7, edge - 1e-3))
+        assert index.pop_expired_segments() == set()
+
+        at_edge = index.totals(7, edge, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+        assert at_edge["reports_fresh"] == 0
+        assert_matches_loop(at_edge, weight_loop([report], 7, edge))
+    assert index.pop_expired_segments() == {7}
+    assert index.pop_expired_segments() == set()
+    assert index.expire(edge + DAY) == 0  # each report expires exactly once
+
+
+def test_confirm_after_expiry():
+    index = new_index()
+    reports = [
+        {"id": i, "segment_id": 3, "created_ts": NOW - 20 * DAY, "confirmed": False, "note_class": i % 3}
+        for i in range(6)
+    ]
+    index_reports(index, reports)
+    later = NOW + 15 * DAY  # past the fresh window
+    assert index.expire(later) == 6
+    for r in reports[:4]:
+        r["confirmed"] = True
+        assert index.set_confirmed(r["id"], now=later)
+    assert not index.set_confirmed(reports[0]["id"], now=later)  # already confirmed
+    with weighting("window"):
+        totals = index.totals(3, later, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+        assert (totals["reports_fresh"], totals["reports_confirmed"]) == (0, 4)
+        assert_matches_loop(totals, weight_loop(reports, 3, later))
+    with weighting("decay"):
+        totals = index.decayed_totals(3, later, FRESH_WEIGHT, CONFIRMED_WEIGHT)
+        assert_matches_loop(totals, weight_loop(reports, 3, later))
+    assert index.confirmed_total == 4
+
+
+def test_add_many_matches_repeated_add():
+    reports = random_reports(4000, segments=25, seed=3)
+    one_by_one = new_index()
+    index_reports(one_by_one, reports)
+    bulk = new_index()
+    bulk.add_many(
+        [r["id"] for r in reports],
+        np.array([r["segment_id"] for r in reports]),
+        np.array([np.nan if r["created_ts"] is None else r["created_ts"] for r in reports]),
+        np.array([r["confirmed"] for r in reports]),
+        np.array([r["note_class"] for r in reports]),
+        now=NOW,
+    )
+    ids = list(range(25))
+    assert bulk.stats() == one_by_one.stats()
+    for segment_id in ids:
+        assert bulk.report_ids(segment_id) == one_by_one.report_ids(segment_id)
+    for now in (NOW, NOW + 20 * DAY, NOW + 80 * DAY):
+        assert (bulk.count_matrix(ids, now) == one_by_one.count_matrix(ids, now)).all()
+        assert np.allclose(bulk.decayed_matrix(ids, now), one_by_one.decayed_matrix(ids, now), rtol=1e-12)
+        assert bulk.pop_expired_segments() == one_by_one.pop_expired_segments()
+    assert bulk.count_matrix(ids, NOW).shape == (25, SLOTS)
+    assert bulk.decayed_matrix(ids, NOW).shape == (25, DECAY_SLOTS)
+
+
+def test_timestamps_with_utc_offset():
+    naive = datetime(2023, 12, 31, 22, 0, 0)
+    aware = datetime(2024, 1, 1, 0, 0, 0, tzinfo=timezone(timedelta(hours=2)))
+    assert utc_timestamp(aware) == utc_timestamp(naive)
+    assert main.report_timestamp("2024-01-01T00:00:00+02:00") == utc_timestamp(naive)
+    assert main.report_timestamp("2023-12-31T22:00:00Z") == utc_timestamp(naive)
+
+    async def import_with_offset():
+        user = main.create_user(main.UserCreate(username="offset-importer"))
+        segment = await main.create_segment(main.SegmentCreate(
+            user_id=user["id"], start_lat=45.46, start_lon=9.19, end_lat=45.47, end_lon=9.20,
+        ))
+        return await main.import_reports(main.ReportBulkCreate(reports=[
+            main.ReportImport(segment_id=segment["id"], created_at="2023-12-31T22:00:00"),
+            main.ReportImport(segment_id=segment["id"], created_at="2024-01-01T00:00:00+02:00"),
+        ]))
+
+    result = asyncio.run(import_with_offset())
+    assert result["imported"] == 2
+    for rid in (result["first_report_id"], result["last_report_id"]):
+        assert main.REPORTS[rid]["created_ts"] == utc_timestamp(naive)
+
+
+if __name__ == "__main__":
+    test_totals_match_weight_loop()
+    test_decayed_totals_match_weight_loop()
+    test_bulk_totals_agree_bit_for_bit()
+    test_expiry_at_window_edge()
+    test_confirm_after_expiry()
+    test_add_many_matches_repeated_add()
+    test_timestamps_with_utc_offset()
+    print("report index tests passed")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Test the contraction hierarchy against plain A* and Dijkstra on random road graphs."""
+import math
+import os
+import random
+import tempfile
+
+from geodesy import haversine_m
+from road_graph import ContractionHierarchy, LocalRouter, RoadGraph, SegmentPenalties
+
+
+def random_graph(size=14, seed=0):
+    """Jittered grid near Milan with one-way streets, diagonals and detour factors."""
+    rng = random.Random(seed)
+    lonlat = [
+        (9.15 + 0.002 * (i + rng.uniform(-0.3, 0.3)), 45.45 + 0.002 * (j + rng.uniform(-0.3, 0.3)))
+        for j in range(size) for i in range(size)
+    ]
+
+    def length(u, v):
+        (lon1, lat1), (lon2, lat2) = lonlat[u], lonlat[v]
+        # Never shorter than the straight line, so the A* heuristic stays admissible
+        return haversine_m(lat1, lon1, lat2, lon2) * rng.uniform(1.0, 1.6)
+
+    edges = []
+    for j in range(size):
+        for i in range(size):
+            u = j * size + i
+            for v in ([u + 1] if i + 1 < size else []) + ([u + size] if j + 1 < size else []):
+                if rng.random() < 0.1:
+                    continue  # missing street
+                w = length(u, v)
+                direction = rng.random()
+                if direction < 0.8:
+                    edges.append((u, v, w))
+                if direction >= 0.1:
+                    edges.append((v, u, w))
+            if i + 1 < size and j + 1 < size and rng.random() < 0.15:
+                edges.append((u, u + size + 1, length(u, u + size + 1)))
+    return RoadGraph.from_edges(lonlat, edges)
+
+
+# Shortcut weights are stored as float32 sums, like the edge weights
+CH_REL_TOL = 1e-6
+
+
+def assert_valid_path(graph, path, source, target, cost):
+    assert path[0] == source and path[-1] == target
+    assert math.isclose(graph.path_length_m(path), cost, rel_tol=CH_REL_TOL)
+
+
+def test_ch_matches_astar_and_dijkstra():
+    for seed in range(3):
+        graph = random_graph(seed=seed)
+        ch = ContractionHierarchy.build(graph)
+        rng = random.Random(seed)
+        nodes = range(graph.n_nodes)
+        for _ in range(150):
+            source, target = rng.choice(nodes), rng.choice(nodes)
+            expected = graph.astar(source, target)
+            got = ch.query(source, target)
+            dijkstra = graph.distances_from(source, [target]).get(target)
+            if expected is None:
+                assert got is None and dijkstra is None, (seed, source, target)
+                continue
+            assert got is not None, (seed, source, target)
+            assert math.isclose(got[0], expected[0], rel_tol=CH_REL_TOL), (seed, source, target)
+            assert math.isclose(dijkstra, expected[0], rel_tol=1e-9), (seed, source, target)
+            assert_valid_path(graph, got[1], source, target, got[0])
+            assert_valid_path(graph, expected[1], source, target, expected[0])
+
+
+def test_ch_survives_save_and_load():
+    graph = random_graph(size=10, seed=5)
+    ch = ContractionHierarchy.build(graph)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph.npz")
+        graph.save(path, ch)
+        loaded_graph, loaded_ch = RoadGraph.load(path)
+    assert loaded_ch is not None
+    assert loaded_ch.n_shortcuts == ch.n_shortcuts
+    rng = random.Random(5)
+    for _ in range(100):
+        source, target = rng.randrange(graph.n_nodes), rng.randrange(graph.n_nodes)
+        assert loaded_ch.query(source, target) == ch.query(source, target)
+        assert loaded_graph.astar(source, target) == graph.astar(source, target)
+
+
+def test_nearest_node_matches_full_scan():
+    graph = random_graph(seed=1)
+    rng = random.Random(1)
+    for _ in range(200):
+        lat, lon = 45.45 + rng.uniform(-0.01, 0.04), 9.15 + rng.uniform(-0.01, 0.04)
+        node, dist = graph.nearest_node(lat, lon)
+        best = min(
+            haversine_m(lat, lon, float(graph.lat[n]), float(graph.lon[n]))
+            for n in range(graph.n_nodes) if graph.routable[n]
+        )
+        assert math.isclose(dist, best, rel_tol=1e-6), (lat, lon)
+
+
+def test_penalty_costs_are_copy_on_write():
+    graph = random_graph(size=8, seed=2)
+    penalties = SegmentPenalties(graph, {"safety_first": {"maintenance": 16.0}})
+    u = 10
+    v = graph._indices[graph._indptr[u]]
+    line = [[graph._lon[u], graph._lat[u]], [graph._lon[v], graph._lat[v]]]
+
+    before = penalties.costs("safety_first")
+    snapshot = list(before)
+    assert penalties.update_segment("s1", line, "maintenance") > 0
+    assert before == snapshot  # a running search keeps its costs
+    penalized = penalties.costs("safety_first")
+    assert penalized != before
+
+    router = LocalRouter(graph)
+    router.penalties = penalties
+    points = [(graph._lat[u], graph._lon[u]), (graph._lat[v], graph._lon[v])]
+    assert router.route_sync(points, preference="safety_first") is not None
+    penalties.remove_segment("s1")
+    penalties.update_segment("s2", line, "medium")
+    assert penalties.costs("safety_first") == snapshot  # "medium" has no factor here
+    assert penalized != snapshot
+
+if __name__ == "__main__":
+    test_ch_matches_astar_and_dijkstra()
+    test_ch_survives_save_and_load()
+    test_nearest_node_matches_full_scan()
+    test_penalty_costs_are_copy_on_write()
+    print("road graph tests passed")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Test the grid-hashed similarity checks against brute-force definitions."""
+import random
+
+from route_similarity import (
+    DEFAULT_TOLERANCE_DEG, VertexGrid, frechet_within, hausdorff_within, sampled_overlap,
+)
+
+TOL = DEFAULT_TOLERANCE_DEG
+
+
+def sq_dist(p, q):
+    return (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2
+
+
+def brute_frechet_sq(a, b):
+    """Squared discrete Frechet distance, full Eiter-Mannila table."""
+    table = [[0.0] * len(b) for _ in a]
+    for i, p in enumerate(a):
+        for j, q in enumerate(b):
+            d = sq_dist(p, q)
+            if i == 0 and j == 0:
+                table[i][j] = d
+            elif i == 0:
+                table[i][j] = max(table[i][j - 1], d)
+            elif j == 0:
+                table[i][j] = max(table[i - 1][j], d)
+            else:
+                table[i][j] = max(min(table[i - 1][j], table[i - 1][j - 1], table[i][j - 1]), d)
+    return table[-1][-1]
+
+
+def brute_has_vertex_within(coords, p, tol):
+    return any(sq_dist(p, q) < tol * tol for q in coords)
+
+
+def random_route(rng, n):
+    x, y = 9.19, 45.46
+    route = []
+    for _ in range(n):
+        x += rng.uniform(0, 0.0004)
+        y += rng.uniform(-0.0003, 0.0003)
+        route.append([x, y])
+    return route
+
+
+def variant(rng, route):
+    """Resampled, jittered and sometimes detoured or reversed copy of route."""
+    out = []
+    for p in route:
+        if rng.random() < 0.2:
+            continue  # dropped vertex
+        out.append([p[0] + rng.gauss(0, TOL / 3), p[1] + rng.gauss(0, TOL / 3)])
+    if rng.random() < 0.2 and out:
+        k = rng.randrange(len(out))
+        out[k] = [out[k][0], out[k][1] + 0.002]
+    if rng.random() < 0.1:
+        out.reverse()
+    return out or [list(route[0])]
+
+
+def test_frechet_matches_brute_force():
+    rng = random.Random(11)
+    decided = {True: 0, False: 0}
+    for _ in range(400):
+        a = random_route(rng, rng.randint(1, 30))
+        b = variant(rng, a)
+        expected = brute_frechet_sq(a, b) < TOL * TOL
+        assert frechet_within(a, b, TOL) == expected, (a, b)
+        assert frechet_within(b, a, TOL) == expected, (a, b)
+        decided[expected] += 1
+    assert decided[True] and decided[False]
+
+
+def test_frechet_respects_order():
+    route = random_route(random.Random(3), 20)
+    assert frechet_within(route, route, TOL)
+    assert hausdorff_within(route, route[::-1], TOL)
+    assert not frechet_within(route, route[::-1], TOL)
+    assert frechet_within([], [], TOL)
+    assert not frechet_within(route, [], TOL)
+
+
+def test_grid_checks_match_linear_scan():
+    rng = random.Random(5)
+    for _ in range(300):
+        a = random_route(rng, rng.randint(1, 40))
+        b = variant(rng, a)
+        grid = VertexGrid(b, TOL)
+        for p in a:
+            assert grid.has_vertex_within(p[0], p[1], TOL) == brute_has_vertex_within(b, p, TOL)
+        expected = all(brute_has_vertex_within(b, p, TOL) for p in a) and all(
+            brute_has_vertex_within(a, q, TOL) for q in b
+        )
+        assert hausdorff_within(a, b, TOL) == expected
+
+        step = max(1, len(a) // 10)
+        sampled = a[::step]
+        share = sum(brute_has_vertex_within(b, p, TOL) for p in sampled) / len(sampled)
+        assert sampled_overlap(a, grid, TOL) == share
+
+
+if __name__ == "__main__":
+    test_frechet_matches_brute_force()
+    test_frechet_respects_order()
+    test_grid_checks_match_linear_scan()
+    print("route similarity tests passed")
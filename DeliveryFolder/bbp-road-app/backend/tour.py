@@ -0,0 +1,111 @@
+"""
+Visiting-order heuristics for multi-stop trips.
+
+Works on a square cost matrix (e.g. OSRM table distances, which may be
+asymmetric). The first node is a fixed start; an optional fixed end node
+stays last, or the tour returns to the start. Nearest neighbour builds the
+initial order, then 2-opt and Or-opt moves are applied until none of them
+improves the total cost. Meant for the handful of stops of an errand trip,
+not for large instances.
+"""
+from __future__ import annotations
+
+import math
+from typing import List, Optional, Sequence
+
+UNREACHABLE_COST = 1e12  # Stand-in cost for matrix entries without a route
+
+
+def _clean(matrix: Sequence[Sequence[Optional[float]]]) -> List[List[float]]:
+    return [
+        [UNREACHABLE_COST if v is None or not math.isfinite(v) else float(v) for v in row]
+        for row in matrix
+    ]
+
+
+def path_cost(matrix: Sequence[Sequence[float]], seq: Sequence[int]) -> float:
+    """Total cost of visiting seq in order (open path)."""
+    return sum(matrix[a][b] for a, b in zip(seq, seq[1:]))
+
+
+def sequence_cost(matrix: Sequence[Sequence[Optional[float]]], seq: Sequence[int]) -> Optional[float]:
+    """path_cost on a raw matrix; None if any leg has no finite entry."""
+    total = 0.0
+    for a, b in zip(seq, seq[1:]):
+        value = matrix[a][b]
+        if value is None or not math.isfinite(value):
+            return None
+        total += value
+    return total
+
+
+def nearest_neighbour(matrix: Sequence[Sequence[float]], start: int, nodes: Sequence[int]) -> List[int]:
+    """Greedy order of `nodes` starting from `start` (start itself not included)."""
+    left = list(nodes)
+    order: List[int] = []
+    current = start
+    while left:
+        nxt = min(left, key=lambda n: matrix[current][n])
+        left.remove(nxt)
+        order.append(nxt)
+        current = nxt
+    return order
+
+
+def _two_opt_pass(matrix: List[List[float]], seq: List[int], lo: int, hi: int) -> bool:
+    """One improving 2-opt move (reverse seq[i..j]) within positions lo..hi, if any."""
+    best = path_cost(matrix, seq)
+    for i in range(lo, hi):
+        for j in range(i + 1, hi + 1):
+            candidate = seq[:i] + seq[i:j + 1][::-1] + seq[j + 1:]
+            if path_cost(matrix, candidate) < best - 1e-9:
+                seq[:] = candidate
+                return True
+    return False
+
+
+def _or_opt_pass(matrix: List[List[float]], seq: List[int], lo: int, hi: int) -> bool:
+    """One improving Or-opt move (relocate a chain of 1-3 stops) within positions lo..hi, if any."""
+    best = path_cost(matrix, seq)
+    for length in (1, 2, 3):
+        for i in range(lo, hi - length + 2):
+            chain = seq[i:i + length]
+            rest = seq[:i] + seq[i + length:]
+            rest_hi = hi - length
+            for k in range(lo, rest_hi + 2):
+                if k == i:
+                    continue
+                candidate = rest[:k] + chain + rest[k:]
+                if path_cost(matrix, candidate) < best - 1e-9:
+                    seq[:] = candidate
+                    return True
+    return False
+
+
+def solve_visit_order(
+    matrix: Sequence[Sequence[Optional[float]]],
+    start: int = 0,
+    end: Optional[int] = None,
+    return_to_start: bool = False,
+    max_moves: int = 1000,
+) -> List[int]:
+    """
+    Order in which to visit every node of the matrix.
+
+    Returns the full node sequence: start first, then the free nodes, then
+    `end` if given (or `start` again with return_to_start).
+    None / non-finite entries are treated as very expensive.
+    """
+    costs = _clean(matrix)
+    n = len(costs)
+    if end is not None and return_to_start:
+        raise ValueError("end and return_to_start are mutually exclusive")
+    free = [i for i in range(n) if i != start and i != end]
+    tail = [end] if end is not None else ([start] if return_to_start else [])
+
+    seq = [start] + nearest_neighbour(costs, start, free) + tail
+    lo, hi = 1, len(free)  # positions of the free nodes in seq
+    for _ in range(max_moves):
+        if not (_two_opt_pass(costs, seq, lo, hi) or _or_opt_pass(costs, seq, lo, hi)):
+            break
+    return seq